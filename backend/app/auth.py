@@ -10,7 +10,8 @@ from passlib.context import CryptContext
 
 from app.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# コストが BCRYPT_ROUNDS と異なるハッシュは needs_update になり、ログイン時に作り直す
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 PASSWORD_PATTERN = re.compile(
     r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[!@#$%^&*()_+\-=\[\]{};':\"\\|,.<>\/?]).{8,}$"
@@ -30,6 +31,11 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+def verify_and_update_password(plain: str, hashed: str) -> tuple[bool, Optional[str]]:
+    """照合し、一致してハッシュのコストが現在の設定と異なれば新しいハッシュも返す"""
+    return pwd_context.verify_and_update(plain, hashed)
+
+
 def generate_activation_token() -> str:
     return secrets.token_urlsafe(32)
 
@@ -0,0 +1,170 @@
+"""
+投票データの正規化テーブル（ballot_entries）と SQL による集計
+
+単記・承認・スコア・クアドラティック・負の投票は、選択肢ごとの件数・合計だけで
+集計状態（app/voting.py の TALLIES）が決まる。投票ごとに (vote_id, poll_id, option_id, value)
+の行を書いておけば、全票の vote_data を読み出さずに1回の GROUP BY で集計状態を作れる。
+
+- 新しい投票は submit_vote で投票と同じトランザクションに書き込む（add_entries）
+- 導入前の投票は python -m scripts.backfill_entries で展開する（backfill_batch）
+- 展開が済んでいない投票が残っている投票フォームでは sql_state は None を返す
+"""
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.voting import TALLIES
+
+
+# 方式ごとに vote_data → [(option_id, value), ...]
+# 値の変換は app/voting.py の accumulate と同じ（同じ入力で同じ例外を送出する）
+def _plurality_entries(vote_data: dict) -> list:
+    oid = vote_data.get("option_id")
+    return [] if oid is None else [(int(oid), 1)]
+
+
+def _approval_entries(vote_data: dict) -> list:
+    return [(int(oid), 1) for oid in vote_data.get("option_ids", [])]
+
+
+def _score_entries(vote_data: dict) -> list:
+    return [(int(oid), float(score)) for oid, score in vote_data.get("scores", {}).items()]
+
+
+def _votes_entries(vote_data: dict) -> list:
+    return [(int(oid), int(value)) for oid, value in vote_data.get("votes", {}).items()]
+
+
+ENTRY_BUILDERS = {
+    "plurality": _plurality_entries,
+    "approval": _approval_entries,
+    "score": _score_entries,
+    "quadratic": _votes_entries,
+    "negative": _votes_entries,
+}
+
+
+def add_entries(db: Session, poll: models.Poll, vote_id: int, vote_data: dict) -> None:
+    """
+    保存した投票の ballot_entries 行を追加する（対象外の方式では何もしない）。
+    投票は entries_written=True で保存すること。
+    """
+    build = ENTRY_BUILDERS.get(poll.voting_method)
+    if build is not None:
+        rows = [
+            {"vote_id": vote_id, "poll_id": poll.id, "option_id": oid, "value": value}
+            for oid, value in build(vote_data)
+        ]
+        if rows:
+            db.execute(models.BallotEntry.__table__.insert(), rows)
+
+
+def delete_entries(db: Session, poll_id: int) -> None:
+    """投票フォームの ballot_entries を一括削除する（投票フォームの削除前に呼ぶ）"""
+    db.execute(delete(models.BallotEntry).where(models.BallotEntry.poll_id == poll_id))
+
+
+def entries_complete(db: Session, poll_id: int) -> bool:
+    pending = select(models.Vote.id).where(
+        models.Vote.poll_id == poll_id, models.Vote.entries_written.is_(False)
+    )
+    return not db.scalar(select(pending.exists()))
+
+
+# GROUP BY の結果 (件数, 合計, 正の件数, 負の件数) を方式ごとの集計状態に入れる
+def _fill_counts(state: dict, key: str, count: int, total: float, positives: int, negatives: int) -> None:
+    state["counts"][key] = count
+
+
+def _fill_score(state: dict, key: str, count: int, total: float, positives: int, negatives: int) -> None:
+    state["counts"][key] = count
+    state["totals"][key] = float(total)
+
+
+def _fill_quadratic(state: dict, key: str, count: int, total: float, positives: int, negatives: int) -> None:
+    state["totals"][key] = int(total)
+
+
+def _fill_negative(state: dict, key: str, count: int, total: float, positives: int, negatives: int) -> None:
+    state["totals"][key] = int(total)
+    if positives:
+        state["positives"][key] = positives
+    if negatives:
+        state["negatives"][key] = negatives
+
+
+_STATE_FILLERS = {
+    "plurality": _fill_counts,
+    "approval": _fill_counts,
+    "score": _fill_score,
+    "quadratic": _fill_quadratic,
+    "negative": _fill_negative,
+}
+
+
+def sql_state(db: Session, poll: models.Poll) -> dict | None:
+    """
+    ballot_entries の GROUP BY から集計状態を作る（全票を vote_data から集計した state と一致）。
+    対象外の方式、または展開が済んでいない投票がある場合は None を返す。
+    """
+    fill = _STATE_FILLERS.get(poll.voting_method)
+    if fill is None or not entries_complete(db, poll.id):
+        return None
+
+    entry = models.BallotEntry
+    rows = db.execute(
+        select(
+            entry.option_id,
+            func.count(),
+            func.sum(entry.value),
+            func.sum(case((entry.value > 0, 1), else_=0)),
+            func.sum(case((entry.value < 0, 1), else_=0)),
+        )
+        .where(entry.poll_id == poll.id)
+        .group_by(entry.option_id)
+    )
+    state = TALLIES[poll.voting_method].init()
+    state["total"] = db.scalar(
+        select(func.count()).select_from(models.Vote).where(models.Vote.poll_id == poll.id)
+    )
+    for option_id, count, total, positives, negatives in rows:
+        fill(state, str(option_id), count, total, positives, negatives)
+    return state
+
+
+def backfill_batch(db: Session, after_id: int = 0, batch_size: int = 1000) -> tuple[int, int, int]:
+    """
+    id が after_id より大きい未展開の投票を最大 batch_size 件展開してコミットする。
+    (最後に読んだ投票ID, 読んだ件数, 展開した件数) を返す。読んだ件数が 0 なら完了。
+    展開できない投票データ（不正な値）は未展開のまま残し、その投票フォームは vote_data から集計する。
+    """
+    rows = db.execute(
+        select(models.Vote.id, models.Vote.poll_id, models.Vote.vote_data, models.Poll.voting_method)
+        .join(models.Poll, models.Poll.id == models.Vote.poll_id)
+        .where(models.Vote.id > after_id, models.Vote.entries_written.is_(False))
+        .order_by(models.Vote.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return after_id, 0, 0
+
+    entries = []
+    written = []
+    for vote_id, poll_id, vote_data, voting_method in rows:
+        build = ENTRY_BUILDERS.get(voting_method)
+        try:
+            pairs = build(vote_data) if build else []
+        except (TypeError, ValueError, AttributeError):
+            continue
+        entries += [
+            {"vote_id": vote_id, "poll_id": poll_id, "option_id": oid, "value": value}
+            for oid, value in pairs
+        ]
+        written.append(vote_id)
+
+    if entries:
+        db.execute(models.BallotEntry.__table__.insert(), entries)
+    if written:
+        db.execute(update(models.Vote).where(models.Vote.id.in_(written)).values(entries_written=True))
+    db.commit()
+    return rows[-1][0], len(rows), len(written)
@@ -6,25 +6,106 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24時間
 
+    # パスワードのハッシュ化（app/password_hasher.py）
+    BCRYPT_ROUNDS: int = 12  # 変更すると既存のユーザーは次のログイン時に新しいコストで保存し直す
+    PASSWORD_HASH_WORKERS: int = 2  # ハッシュ化・照合を実行するスレッド数
+    PASSWORD_HASH_MAX_QUEUE: int = 32  # これを超えて待たせる登録・ログインは 503 にする
+
+    # ログイン中のユーザーのキャッシュ（app/principal_cache.py）
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 1024  # 0 で無効（リクエストごとに users を読む）
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 60  # DB を直接変更した無効化が反映されるまでの最大時間
+
     DATABASE_URL: str = "sqlite:///./voting_app.db"
 
+    # GET /api/metrics（Prometheus のテキスト形式。app/metrics.py）
+    METRICS_ENABLED: bool = True
+    # リクエストごとのトレース（app/tracing.py）
+    TRACING_ENABLED: bool = False
+    TRACE_FILE: str = "./traces.jsonl"  # スパンを1行1つの JSON で追記する
+    TRACE_SAMPLE_RATE: float = 1.0  # トレースするリクエストの割合（traceparent ヘッダーの指定が優先）
+    SLOW_QUERY_MS: float = 250  # これ以上かかった SQL 文を EXPLAIN QUERY PLAN とともにログに出す（0 で無効）
+
+    # SQLite の接続ごとの設定（app/database.py の configure_sqlite）
+    SQLITE_JOURNAL_MODE: str = "WAL"  # 読み取りが書き込み（投票送信）を待たない
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # WAL ではコミットごとの fsync を省いても DB は壊れない
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # 書き込みロックの待ち時間（即座に database is locked にしない）
+    SQLITE_CACHE_SIZE: int = -65536  # 負の値は KiB 単位（64 MiB）
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_TEMP_STORE: str = "MEMORY"  # GROUP BY・ORDER BY の一時領域
+    # コネクションプール（ファイルの DB のみ）。API の書き込み用エンジンは接続1つに固定し、
+    # 書き込みのトランザクションはプールで到着順に待つ（app/database.py の async_engine）
+    DB_POOL_SIZE: int = 5  # 同期エンジン（コマンド・ベンチマーク）
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30  # 接続の空きを待つ秒数（書き込みの順番待ちを含む）
+    DB_READ_POOL_SIZE: int = 10  # 読み取り専用エンジン（結果・CSV・一覧）
+
     SMTP_HOST: str = ""
     SMTP_PORT: int = 587
     SMTP_USER: str = ""
     SMTP_PASSWORD: str = ""
     SMTP_FROM: str = "noreply@votingapp.local"
+    SMTP_START_TLS: bool = True
+    SMTP_TIMEOUT_SECONDS: float = 30
+    # 送信メールのキュー（app/mail_queue.py）
+    SMTP_CONNECTIONS: int = 2  # 同時に持つ SMTP の接続（送信用タスク）の数
+    SMTP_IDLE_SECONDS: float = 30  # この間メールがなければ接続を閉じる
+    MAIL_BATCH_SIZE: int = 20  # 1つの接続で続けて送る最大の通数
+    MAIL_QUEUE_MAX_SIZE: int = 1000
+    MAIL_ENQUEUE_TIMEOUT_SECONDS: float = 5  # キューがいっぱいのときに空きを待つ時間（登録 API は 503）
+    MAIL_MAX_RETRIES: int = 3
+    MAIL_RETRY_BACKOFF_SECONDS: float = 1  # 送り直すまでの待ち時間（回ごとに倍）
 
     BASE_URL: str = "http://localhost:8000"
     FRONTEND_URL: str = "http://localhost:5173"  # 開発時のVite devサーバー / 本番はnginxのURL
     CORS_ORIGINS: str = "http://localhost:5173,http://localhost:3000,http://localhost"
     DEV_MODE: bool = True  # TrueならコンソールにアクティベーションURLを表示
 
+    # 集計エンジン: この票数以上かつ対象方式なら NumPy 投票行列エンジンを使う
+    NUMPY_ENGINE_MIN_VOTES: int = 10000
+    NUMPY_ENGINE_METHODS: str = "approval,borda,score,quadratic,negative"
+    # 再集計（scripts/recount --workers）のプロセス並列集計
+    PARALLEL_WORKERS: int = 0  # 0 なら CPU 数
+    PARALLEL_CHUNK_SIZE: int = 50000
+
+    # 集計結果キャッシュ（app/result_cache.py）
+    RESULT_CACHE_MAX_ENTRIES: int = 256
+    RESULT_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    RESULT_CACHE_STALE_SECONDS: float = 0  # 0 より大きければ古い結果を返しつつバックグラウンドで再計算
+
+    # ダッシュボードの一覧（GET /api/polls/）の1ページの件数
+    POLL_PAGE_SIZE: int = 50
+    POLL_PAGE_MAX_SIZE: int = 200
+
+    # 集計結果のライブ配信（app/result_stream.py）
+    RESULTS_STREAM_COALESCE_MS: int = 1000  # 投票フォームごとの更新の最小間隔
+    RESULTS_STREAM_KEEPALIVE_SECONDS: float = 15  # 更新がない間に送るコメント行の間隔
+
+    # 公開投票フォームのキャッシュ（app/public_poll_cache.py）
+    PUBLIC_POLL_CACHE_MAX_ENTRIES: int = 4096
+    PUBLIC_POLL_MAX_AGE: int = 30  # Cache-Control の max-age（秒）。nginx・ブラウザがこの間キャッシュする
+
+    # 投票済みフィンガープリントのブルームフィルター（app/voter_filter.py）
+    VOTER_FILTER_MAX_POLLS: int = 1024  # 0 で無効（常に DB で確認する）
+    VOTER_FILTER_ERROR_RATE: float = 0.01
+    VOTER_FILTER_MIN_CAPACITY: int = 1024
+
     model_config = {"env_file": ".env", "extra": "ignore"}
 
     @property
     def cors_origins_list(self) -> list[str]:
         return [o.strip() for o in self.CORS_ORIGINS.split(",") if o.strip()]
 
+    @property
+    def async_database_url(self) -> str:
+        """DATABASE_URL の非同期ドライバ版（sqlite:// → sqlite+aiosqlite://）"""
+        if self.DATABASE_URL.startswith("sqlite://"):
+            return "sqlite+aiosqlite://" + self.DATABASE_URL[len("sqlite://"):]
+        return self.DATABASE_URL
+
+    @property
+    def numpy_engine_methods_list(self) -> list[str]:
+        return [m.strip() for m in self.NUMPY_ENGINE_METHODS.split(",") if m.strip()]
+
 
 settings = Settings()
 
@@ -41,3 +122,10 @@ VOTING_METHODS = {
 }
 
 MJ_GRADES = ["拒否", "不良", "許容", "良い", "とても良い", "優秀"]
+
+# コンドルセ方式で循環があった場合の補完ルール (method_settings["completion"])
+CONDORCET_COMPLETIONS = {
+    "none": "補完なし（循環時は勝者なし）",
+    "schulze": "シュルツ方式",
+    "ranked_pairs": "ランクドペア方式",
+}
@@ -1,19 +1,201 @@
-from sqlalchemy import create_engine
+import logging
+from functools import partial
+
+from sqlalchemy import create_engine, event, inspect, make_url, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.schema import CreateColumn
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+def sqlite_pragmas(read_only: bool = False) -> list[str]:
+    """接続ごとに実行する PRAGMA（read_only=True なら書き込みを禁止する query_only を加える）"""
+    pragmas = [
+        f"journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"cache_size={int(settings.SQLITE_CACHE_SIZE)}",
+        f"mmap_size={int(settings.SQLITE_MMAP_SIZE)}",
+        f"temp_store={settings.SQLITE_TEMP_STORE}",
+    ]
+    if read_only:
+        pragmas.append("query_only=ON")
+    return pragmas
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record, read_only: bool = False) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma in sqlite_pragmas(read_only):
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+def _disable_implicit_begin(dbapi_connection, connection_record) -> None:
+    # sqlite3 ドライバーの暗黙の BEGIN（DEFERRED）を止め、_begin_immediate・_begin_deferred の BEGIN を使わせる
+    dbapi_connection.isolation_level = None
+
+
+def _begin_immediate(conn) -> None:
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _begin_deferred(conn) -> None:
+    conn.exec_driver_sql("BEGIN")
+
+
+def configure_sqlite(engine, read_only: bool = False, snapshot: bool = False) -> None:
+    """
+    SQLite のエンジン（同期・非同期）の新しい接続に sqlite_pragmas を適用する。
+
+    書き込み用のエンジン（read_only=False）のトランザクションは BEGIN IMMEDIATE で始め、最初の
+    SELECT の時点で書き込みのロックを取る。DEFERRED のままだと、同時に投票した2つのリクエストが
+    同じ集計（poll_tallies）を読んでから書き込むため、後の書き込みが SQLITE_BUSY（WAL では
+    busy_timeout を待たずに失敗する）になるか、先の更新を上書きしてしまう。
+
+    読み取り専用のエンジンで snapshot=True なら、トランザクションを BEGIN（DEFERRED）で始める。
+    sqlite3 ドライバーは SELECT の前に BEGIN しないため、指定しないと文ごとに別の時点を読む。
+    トランザクション中は最初の SELECT の時点のスナップショットを読み続け、WAL では書き込みを待たせない。
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", partial(_set_sqlite_pragmas, read_only=read_only))
+        if not read_only:
+            event.listen(sync_engine, "connect", _disable_implicit_begin)
+            event.listen(sync_engine, "begin", _begin_immediate)
+        elif snapshot:
+            event.listen(sync_engine, "connect", _disable_implicit_begin)
+            event.listen(sync_engine, "begin", _begin_deferred)
+
+
+def _pool_args(url: str, pool_size: int, max_overflow: int | None = None) -> dict:
+    """ファイルの DB ならプールの大きさを指定する（インメモリ DB は接続を1つに固定するため指定しない）"""
+    if make_url(url).database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": pool_size,
+        "max_overflow": settings.DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+
+
+# 同期エンジン: テーブル作成・スキーマ更新・コマンド（scripts/）・ベンチマーク用
 engine = create_engine(
     settings.DATABASE_URL,
     connect_args={"check_same_thread": False},  # SQLite用
+    **_pool_args(settings.DATABASE_URL, settings.DB_POOL_SIZE),
 )
+configure_sqlite(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# 同期の読み取り専用エンジン: コマンドの全票の読み出し・検証用（scripts/recount）。書き込みのロックを
+# 取らずにトランザクションごとのスナップショットを読み、その間も投票送信を待たせない
+sync_read_engine = create_engine(
+    settings.DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    **_pool_args(settings.DATABASE_URL, settings.DB_READ_POOL_SIZE),
+)
+configure_sqlite(sync_read_engine, read_only=True, snapshot=True)
+SyncReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_read_engine)
+
+# 非同期エンジン: API のリクエスト処理用（aiosqlite。クエリ中もイベントループを止めない）。
+# 書き込みのトランザクションは BEGIN IMMEDIATE で始まり、同時に書き込めるのはいずれにしても1つだけ。
+# 接続が複数あると残りは SQLite の busy_timeout でポーリングしながら待ち（待ち時間が長く偏る）、
+# 接続を1つにするとプールの取り出し（asyncio のキュー）で到着順に待つ。セッションは最初の SQL で
+# 接続を取り出し、コミット・ロールバック・close で返す
+async_engine = create_async_engine(
+    settings.async_database_url,
+    **_pool_args(settings.DATABASE_URL, 1, max_overflow=0),
+)
+configure_sqlite(async_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# 読み取り専用エンジン: 結果・CSV・一覧用。セッション（トランザクション）ごとに最初の SELECT の時点の
+# スナップショットを読むため、投票フォーム・集計状態・パターンの行が別々の時点の内容になることはなく、
+# WAL では投票送信の書き込みも待たせない（query_only で誤って書き込むことも防ぐ）
+read_engine = create_async_engine(
+    settings.async_database_url,
+    **_pool_args(settings.DATABASE_URL, settings.DB_READ_POOL_SIZE),
+)
+configure_sqlite(read_engine, read_only=True, snapshot=True)
+ReadSessionLocal = async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_db():
+    """読み取りのみのルート用のセッション（書き込むとエラーになる）"""
+    async with ReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+def _dedupe_votes(conn) -> set[int]:
+    """
+    ux_votes_poll_id_voter_fingerprint の作成前に、同じ (poll_id, voter_fingerprint) の投票の
+    最初の1票（id が最小）以外を ballot_entries とともに削除する（一意インデックスの導入前に
+    同時送信で保存された重複票）。投票を削除した投票フォームの ID を返す。
+    """
+    duplicates = conn.execute(text(
+        "SELECT id, poll_id FROM votes WHERE id NOT IN "
+        "(SELECT min(id) FROM votes GROUP BY poll_id, voter_fingerprint)"
+    )).all()
+    if not duplicates:
+        return set()
+    conn.execute(text("CREATE TEMP TABLE duplicate_votes (id INTEGER PRIMARY KEY)"))
+    conn.execute(text("INSERT INTO duplicate_votes (id) VALUES (:id)"), [{"id": vote_id} for vote_id, _ in duplicates])
+    conn.execute(text("DELETE FROM ballot_entries WHERE vote_id IN (SELECT id FROM duplicate_votes)"))
+    conn.execute(text("DELETE FROM votes WHERE id IN (SELECT id FROM duplicate_votes)"))
+    conn.execute(text("DROP TABLE duplicate_votes"))
+    polls = {poll_id for _, poll_id in duplicates}
+    logger.warning("Removed %d duplicate votes from %d polls before adding the unique index", len(duplicates), len(polls))
+    return polls
+
+
+# インデックスの作成前に既存の行を直す処理（作成すると制約に反する行があるもの）
+_BEFORE_INDEX = {"ux_votes_poll_id_voter_fingerprint": _dedupe_votes}
+
+
+def upgrade_schema(bind=engine) -> None:
+    """
+    create_all は既存テーブルに列やインデックスを追加しないため、モデルにあって DB にない列を
+    ALTER TABLE ... ADD COLUMN で追加し（追加する列には server_default が必要）、
+    ないインデックスを作成する。重複票を削除した投票フォームは全票から再集計する。
+    """
+    recount = set()
+    with bind.begin() as conn:
+        inspector = inspect(conn)  # 別の接続で調べると、この接続の書き込みのロックを待ってしまう
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    if index.name in _BEFORE_INDEX:
+                        recount |= _BEFORE_INDEX[index.name](conn)
+                    index.create(conn)
+    if recount:
+        _recount_polls(bind, recount)
+
+
+def _recount_polls(bind, poll_ids: set[int]) -> None:
+    from app import models  # app.models・app.tally はこのモジュールを読み込むため
+    from app.tally import recount_poll
+
+    with Session(bind) as db:
+        for poll_id in sorted(poll_ids):
+            poll = db.get(models.Poll, poll_id)
+            if poll is not None:
+                recount_poll(db, poll)
+                db.commit()
@@ -1,53 +1,62 @@
-import asyncio
 import logging
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
 
 from app.config import settings
+from app.mail_queue import Reservation, mail_queue
 
 logger = logging.getLogger(__name__)
 
 
-async def send_activation_email(email: str, token: str) -> None:
+def _dev_mode() -> bool:
+    return settings.DEV_MODE or not settings.SMTP_HOST
+
+
+async def reserve_activation_email() -> Reservation | None:
+    """
+    アクティベーションメール1通分の送信キューの空きを確保する（開発モードでは None）。
+    キューがいっぱいで空かなければ MailQueueFull
+    """
+    if _dev_mode():
+        return None
+    return await mail_queue.reserve()
+
+
+async def send_activation_email(email: str, token: str, reservation: Reservation | None = None) -> None:
+    """reservation があれば確保済みの空きに入れる（待たない）"""
     activation_url = f"{settings.BASE_URL}/auth/activate/{token}"
 
-    if settings.DEV_MODE or not settings.SMTP_HOST:
+    if _dev_mode():
         # 開発モード: コンソールに表示
         print("\n" + "=" * 60)
         print(f"[開発モード] アクティベーションURL:")
         print(f"  {activation_url}")
         print("=" * 60 + "\n")
         logger.info(f"Activation URL for {email}: {activation_url}")
+        if reservation is not None:
+            reservation.cancel()
         return
 
-    try:
-        import aiosmtplib
-        from email.mime.multipart import MIMEMultipart
-        from email.mime.text import MIMEText
-
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = "【投票アプリ】アカウントのアクティベーション"
-        msg["From"] = settings.SMTP_FROM
-        msg["To"] = email
-
-        html_body = f"""
-        <html><body>
-        <h2>アカウントのアクティベーション</h2>
-        <p>ご登録ありがとうございます。</p>
-        <p>以下のリンクをクリックしてアカウントを有効化してください：</p>
-        <p><a href="{activation_url}">{activation_url}</a></p>
-        <p>このリンクは24時間有効です。</p>
-        </body></html>
-        """
-        msg.attach(MIMEText(html_body, "html", "utf-8"))
-
-        await aiosmtplib.send(
-            msg,
-            hostname=settings.SMTP_HOST,
-            port=settings.SMTP_PORT,
-            username=settings.SMTP_USER,
-            password=settings.SMTP_PASSWORD,
-            start_tls=True,
-        )
-    except Exception as e:
-        logger.error(f"Failed to send activation email to {email}: {e}")
-        # メール送信失敗時もコンソールに表示
-        print(f"[メール送信失敗] アクティベーションURL: {activation_url}")
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = "【投票アプリ】アカウントのアクティベーション"
+    msg["From"] = settings.SMTP_FROM
+    msg["To"] = email
+
+    html_body = f"""
+    <html><body>
+    <h2>アカウントのアクティベーション</h2>
+    <p>ご登録ありがとうございます。</p>
+    <p>以下のリンクをクリックしてアカウントを有効化してください：</p>
+    <p><a href="{activation_url}">{activation_url}</a></p>
+    <p>このリンクは24時間有効です。</p>
+    </body></html>
+    """
+    msg.attach(MIMEText(html_body, "html", "utf-8"))
+
+    # 送信は app/mail_queue.py の送信用タスクが接続を再利用してまとめて行う
+    # （キューがいっぱいで空かなければ MailQueueFull）
+    note = f"activation URL: {activation_url}"
+    if reservation is not None:
+        reservation.put(msg, note)
+    else:
+        await mail_queue.enqueue(msg, note=note)
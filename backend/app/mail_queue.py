@@ -0,0 +1,236 @@
+"""
+送信メール（アクティベーションメール）のキュー
+
+登録ごとに SMTP の接続・STARTTLS・ログインをやり直さないよう、メールはキューに入れて
+送信用のタスクがまとめて送る。
+
+- 送信用のタスクは SMTP_CONNECTIONS 個。それぞれが SMTP の接続を1つ持ち、
+  SMTP_IDLE_SECONDS の間メールがなければ切断する（次のメールで接続し直す）
+- キューから最大 MAIL_BATCH_SIZE 通をまとめて取り出し、同じ接続で続けて送る
+- 送信に失敗したメールは MAIL_RETRY_BACKOFF_SECONDS から倍々に待って接続し直し、
+  MAIL_MAX_RETRIES 回まで送り直す。それでも失敗すれば破棄し、宛先と enqueue の note
+  （アクティベーションURLなど、送り直しに必要な情報）をログに残す
+- キューは MAIL_QUEUE_MAX_SIZE 通まで。いっぱいなら MAIL_ENQUEUE_TIMEOUT_SECONDS 待ち、
+  空かなければ MailQueueFull を送出する（登録 API は 503 を返す）
+- reserve で先に1通分の空きを確保し、あとから待たずに入れられる（登録 API はユーザーを
+  コミットする前に確保し、キューがいっぱいならユーザーを保存しない）
+- 送信用のタスクは最初の enqueue で起動し、アプリの終了時に stop で残りを送ってから止める
+- プロセスごとに持つ（app/result_cache.py と同じ）
+"""
+import asyncio
+import logging
+from email.message import Message
+from typing import Awaitable, Callable
+
+import aiosmtplib
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 接続済み（STARTTLS・ログイン済み）の SMTP クライアントを返す
+Connect = Callable[[], Awaitable[aiosmtplib.SMTP]]
+
+
+class MailQueueFull(Exception):
+    """キューがいっぱいで、待っても空かなかった"""
+
+
+class Reservation:
+    """MailQueue.reserve で確保したキューの空き1通分。put か cancel のどちらかを1回だけ呼ぶ"""
+
+    def __init__(self, queue: "MailQueue"):
+        self._queue = queue
+        self._done = False
+
+    def put(self, message: Message, note: str = "") -> None:
+        """確保した空きにメールを入れる（待たない）"""
+        if self._done:
+            raise RuntimeError("reservation already used")
+        self._done = True
+        self._queue._queue.put_nowait((message, note))
+
+    def cancel(self) -> None:
+        """メールを入れずに空きを返す（put 済みなら何もしない）"""
+        if not self._done:
+            self._done = True
+            self._queue._slots.release()
+
+
+async def connect_smtp() -> aiosmtplib.SMTP:
+    smtp = aiosmtplib.SMTP(
+        hostname=settings.SMTP_HOST,
+        port=settings.SMTP_PORT,
+        start_tls=settings.SMTP_START_TLS,
+        timeout=settings.SMTP_TIMEOUT_SECONDS,
+    )
+    await smtp.connect()
+    if settings.SMTP_USER:
+        await smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+    return smtp
+
+
+class MailQueue:
+    def __init__(
+        self,
+        connect: Connect,
+        connections: int,
+        max_size: int,
+        batch_size: int,
+        max_retries: int,
+        backoff_seconds: float,
+        idle_seconds: float,
+    ):
+        self.connect = connect
+        self.connections = max(1, connections)
+        self.max_size = max_size
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.idle_seconds = idle_seconds
+        self._queue: asyncio.Queue | None = None
+        # キューの空き（送信用タスクが取り出すと返る）。予約した分も含めて max_size 通まで
+        self._slots: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._workers: list[asyncio.Task] = []
+        self.sent = self.failed = self.retries = self.batches = self.connects = self.rejected = 0
+
+    async def enqueue(self, message: Message, timeout: float | None = None, note: str = "") -> None:
+        """
+        メールをキューに入れる（いっぱいなら timeout 秒まで空きを待つ）。
+        note は送信を諦めたときに宛先と一緒にログに残す
+        """
+        (await self.reserve(timeout)).put(message, note)
+
+    async def reserve(self, timeout: float | None = None) -> Reservation:
+        """キューの空きを1通分確保する（いっぱいなら timeout 秒まで待ち、空かなければ MailQueueFull）"""
+        self._start()
+        timeout = settings.MAIL_ENQUEUE_TIMEOUT_SECONDS if timeout is None else timeout
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise MailQueueFull() from None
+        return Reservation(self)
+
+    async def stop(self, timeout: float = 10) -> None:
+        """キューに残ったメールを timeout 秒まで送ってから送信用のタスクを止める"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Mail queue stopped with %d unsent messages", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = self._slots = self._loop = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "connects": self.connects,
+            "rejected": self.rejected,
+        }
+
+    def _start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._queue is not None and self._loop is loop:
+            return
+        # 初回、または別のイベントループで使われた場合（テスト）は作り直す
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_size)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.connections)]
+
+    async def _worker(self) -> None:
+        queue, slots = self._queue, self._slots
+        smtp: aiosmtplib.SMTP | None = None
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(queue.get(), self.idle_seconds)
+                except asyncio.TimeoutError:
+                    smtp = await self._close(smtp)  # 送るメールがない間は接続を持たない
+                    continue
+                batch = [first]
+                while len(batch) < self.batch_size and not queue.empty():
+                    batch.append(queue.get_nowait())
+                for _ in batch:
+                    slots.release()
+                try:
+                    smtp = await self._send_batch(smtp, batch)
+                except Exception:
+                    logger.exception("Unexpected error while sending mail")
+                    smtp = await self._close(smtp)
+                finally:
+                    for _ in batch:
+                        queue.task_done()
+        finally:
+            await self._close(smtp)
+
+    async def _send_batch(
+        self, smtp: aiosmtplib.SMTP | None, batch: list[tuple[Message, str]]
+    ) -> aiosmtplib.SMTP | None:
+        self.batches += 1
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += len(pending)
+                await asyncio.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+            try:
+                if smtp is None or not smtp.is_connected:
+                    smtp = await self.connect()
+                    self.connects += 1
+                while pending:
+                    (message, note), pending = pending[0], pending[1:]
+                    try:
+                        await smtp.send_message(message)
+                    except Exception as e:
+                        if not _is_permanent(e):
+                            pending = [(message, note)] + pending
+                            raise
+                        # 宛先の拒否など、送り直しても成功しないもの
+                        self.failed += 1
+                        logger.error("Mail to %s was rejected: %s (%s)", message["To"], e, note)
+                        continue
+                    self.sent += 1
+                return smtp
+            except (aiosmtplib.SMTPException, OSError) as e:
+                logger.warning("Failed to send mail (attempt %d): %s", attempt + 1, e)
+                smtp = await self._close(smtp)
+        self.failed += len(pending)
+        for message, note in pending:
+            logger.error("Gave up sending mail to %s (%s)", message["To"], note)
+        return smtp
+
+    async def _close(self, smtp: aiosmtplib.SMTP | None) -> None:
+        """接続を閉じて None を返す"""
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+        return None
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code >= 500
+
+
+mail_queue = MailQueue(
+    connect=connect_smtp,
+    connections=settings.SMTP_CONNECTIONS,
+    max_size=settings.MAIL_QUEUE_MAX_SIZE,
+    batch_size=settings.MAIL_BATCH_SIZE,
+    max_retries=settings.MAIL_MAX_RETRIES,
+    backoff_seconds=settings.MAIL_RETRY_BACKOFF_SECONDS,
+    idle_seconds=settings.SMTP_IDLE_SECONDS,
+)
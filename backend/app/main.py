@@ -1,15 +1,39 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from app.config import settings
-from app.database import Base, engine
+from app.database import Base, async_engine, engine, read_engine, upgrade_schema
+from app.mail_queue import mail_queue
+from app.metrics import CONTENT_TYPE, MetricsMiddleware, instrument_engine, registry
+from app.password_hasher import password_hasher
+from app.principal_cache import principal_cache
+from app.public_poll_cache import public_poll_cache
+from app.result_cache import result_cache
+from app.result_stream import result_broadcaster
+from app.tally import build_missing_tallies
+from app.tracing import TracedJSONResponse, TracingMiddleware, trace_engine
 from app.routers import auth as auth_router
 from app.routers import polls as polls_router
 from app.routers import votes as votes_router
+from app.voter_filter import voter_filters
 
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+build_missing_tallies(engine)  # 結果の表示のたびに全票を再集計しないよう、書き込み用のエンジンで作っておく
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await mail_queue.stop()  # キューに残ったメールを送ってから終了する
 
-app = FastAPI(title="投票アプリ API", version="2.0.0")
+
+app = FastAPI(
+    title="投票アプリ API", version="2.0.0", lifespan=lifespan, default_response_class=TracedJSONResponse
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,13 +41,52 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # 投票フォーム一覧の次のページ
 )
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+if settings.TRACING_ENABLED or settings.SLOW_QUERY_MS > 0:
+    trace_engine(async_engine, "write")
+    trace_engine(read_engine, "read")
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)  # 最も外側で CORS の処理も含めて測る
+    instrument_engine(async_engine, "write")
+    instrument_engine(read_engine, "read")
 
 app.include_router(auth_router.router, prefix="/api")
 app.include_router(polls_router.router, prefix="/api")
 app.include_router(votes_router.router, prefix="/api")
 
 
+def component_stats() -> dict:
+    """プロセスごとに持つキャッシュ・キューなどの統計"""
+    return {
+        "result_cache": result_cache.stats(),
+        "public_poll_cache": public_poll_cache.stats(),
+        "result_stream": result_broadcaster.stats(),
+        "voter_filter": voter_filters.stats(),
+        "password_hasher": password_hasher.stats(),
+        "principal_cache": principal_cache.stats(),
+        "mail_queue": mail_queue.stats(),
+    }
+
+
 @app.get("/api/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/api/stats", include_in_schema=False)
+async def stats():
+    """component_stats を JSON で返す（/api/metrics と同じく METRICS_ENABLED のときのみ。nginx では公開しない）"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404)
+    return component_stats()
+
+
+@app.get("/api/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus のテキスト形式のメトリクス（app/metrics.py）"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404)
+    return PlainTextResponse(registry.render(component_stats()), media_type=CONTENT_TYPE)
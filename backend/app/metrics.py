@@ -0,0 +1,295 @@
+"""
+Prometheus のテキスト形式のメトリクス（GET /api/metrics）
+
+- MetricsMiddleware（ASGI）: ルートのテンプレート（/api/polls/{poll_id} など）ごとの応答時間の
+  ヒストグラム・ステータスごとのリクエスト数・処理中のリクエスト数
+- instrument_engine: SQLAlchemy のエンジンのイベントで、SQL 文の種類ごとの実行時間のヒストグラム
+- 結果の確定（app/tally.py の finalize_tally）の方式・投票数ごとの時間、CSV の送信バイト数、
+  受け付けた・拒否した投票の数は各処理から直接記録する
+
+記録はラベルごとの値への加算（ロック1回）のみで、1リクエストあたり数マイクロ秒。
+値はプロセスごとに持つ（複数ワーカーで動かす場合はワーカーごとに収集される）。
+"""
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+BALLOT_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000)
+SQL_OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK"))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """ラベルの値ごとの系列（一度作った系列は使い回す）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in sorted(children):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    @abstractmethod
+    def _new_child(self):
+        """ラベルの値ごとの系列を新しく作る"""
+
+    def _render_child(self, values: tuple, child) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock: threading.Lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value(self._lock)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value(self._lock)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: tuple, lock: threading.Lock):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最後は +Inf
+        self.sum = 0.0
+        self._lock = lock
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets, self._lock)
+
+    def _render_child(self, values: tuple, child: _HistogramValue) -> list[str]:
+        with self._lock:
+            counts, total = list(child.counts), child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format_value(bound)
+            labels = _format_labels(self.labelnames, values, f'le="{le}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list[_Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, components: dict | None = None) -> str:
+        """
+        全メトリクスをテキスト形式にする。components（GET /api/stats と同じ
+        {コンポーネント名: stats()}）の数値は component_stat のゲージとして加える。
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        if components:
+            lines.append("# HELP component_stat Process-local component statistics (same as /api/stats)")
+            lines.append("# TYPE component_stat gauge")
+            for component, stats in components.items():
+                for stat, value in stats.items():
+                    if isinstance(value, (int, float)):
+                        labels = _format_labels(("component", "stat"), (component, stat))
+                        lines.append(f"component_stat{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status")
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route")
+))
+http_requests_in_progress = registry.register(Gauge(
+    "http_requests_in_progress", "HTTP requests currently being processed"
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement execution time by engine and statement type",
+    ("engine", "operation"), QUERY_BUCKETS,
+))
+results_calculation_duration = registry.register(Histogram(
+    "results_calculation_duration_seconds",
+    "Time to finalize poll results from the stored tally by voting method and ballot count (upper bound)",
+    ("method", "ballots_le"),
+))
+csv_export_bytes = registry.register(Counter(
+    "csv_export_bytes_total", "Bytes sent by CSV exports", ("encoding",)
+))
+vote_submissions = registry.register(Counter(
+    "vote_submissions_total", "Vote submissions by outcome", ("outcome",)
+))
+
+
+def observe_calculation(voting_method: str, ballots: int, seconds: float) -> None:
+    i = bisect.bisect_left(BALLOT_BUCKETS, ballots)
+    bound = str(BALLOT_BUCKETS[i]) if i < len(BALLOT_BUCKETS) else "+Inf"
+    results_calculation_duration.labels(voting_method, bound).observe(seconds)
+
+
+# ----------------------------- HTTP -----------------------------
+
+class MetricsMiddleware:
+    """
+    ASGI のミドルウェア。ルートのテンプレートはルーティング後の scope["route"] から取る
+    （パスの値ごとに系列を増やさない。どのルートにも一致しなければ "unmatched"）。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # 応答を始める前に例外で終わった場合
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = http_requests_in_progress.labels()
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress.dec()
+            route = route_template(scope)
+            method = scope["method"]
+            http_requests.labels(method, route, str(status)).inc()
+            http_request_duration.labels(method, route).observe(elapsed)
+
+
+def route_template(scope) -> str:
+    """
+    一致したルートのテンプレート。include_router(prefix=...) のルートは scope["route"] に
+    接頭辞のないテンプレートが入る FastAPI のバージョンがあるため、パスから接頭辞を補う。
+    """
+    route = scope.get("route")
+    template = getattr(route, "path_format", None)
+    if template is None:
+        return "unmatched"
+    try:
+        suffix = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    path = scope["path"]
+    if path.endswith(suffix) and len(path) > len(suffix):
+        return path[: len(path) - len(suffix)] + template
+    return template
+
+
+# ----------------------------- DB -----------------------------
+
+_QUERY_START = "metrics_query_start"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info[_QUERY_START] = time.perf_counter()
+
+
+def statement_operation(statement: str) -> str:
+    """SQL 文の種類（SELECT・INSERT など。SQL_OPERATIONS にないものは OTHER）"""
+    head = statement[:16].lstrip().split(None, 1)
+    operation = head[0].upper() if head else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine, name: str) -> None:
+    """エンジン（同期・非同期）で実行する SQL 文の時間を db_query_duration に記録する"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop(_QUERY_START, None)
+        if start is not None:
+            db_query_duration.labels(name, statement_operation(statement)).observe(time.perf_counter() - start)
+
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
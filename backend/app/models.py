@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, JSON, String, Text
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, JSON, String, Text
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -39,6 +39,8 @@ class Poll(Base):
     end_time = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 結果が変わりうる更新（投票・編集・再集計）ごとに増やす。結果キャッシュのキーに使う
+    results_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     creator = relationship("User", back_populates="polls")
     options = relationship(
@@ -48,6 +50,15 @@ class Poll(Base):
         cascade="all, delete-orphan",
     )
     votes = relationship("Vote", back_populates="poll", cascade="all, delete-orphan")
+    tally = relationship(
+        "PollTally",
+        back_populates="poll",
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
+
+    # ダッシュボードの一覧（作成者ごとに (created_at, id) の降順でキーセットページング）
+    __table_args__ = (Index("ix_polls_creator_id_created_at_id", "creator_id", "created_at", "id"),)
 
 
 class PollOption(Base):
@@ -67,8 +78,68 @@ class Vote(Base):
     id = Column(Integer, primary_key=True, index=True)
     poll_id = Column(Integer, ForeignKey("polls.id"), nullable=False)
     # 投票者フィンガープリント (HMAC(voter_token + poll_public_id) をハッシュ化)
-    voter_fingerprint = Column(String, nullable=False, index=True)
+    # 投票フォームごとに一意（ux_votes_poll_id_voter_fingerprint）
+    voter_fingerprint = Column(String, nullable=False)
     vote_data = Column(JSON, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # ballot_entries への展開が済んでいるか（導入前の投票は backfill_entries で展開する）
+    entries_written = Column(Boolean, nullable=False, default=False, server_default="0")
 
     poll = relationship("Poll", back_populates="votes")
+
+    __table_args__ = (
+        Index("ix_votes_poll_id_entries_written", "poll_id", "entries_written"),
+        # 重複投票の確認と書き込みを1つの INSERT ... ON CONFLICT で行うための一意インデックス
+        Index("ux_votes_poll_id_voter_fingerprint", "poll_id", "voter_fingerprint", unique=True),
+    )
+
+
+class BallotEntry(Base):
+    """
+    投票データを (投票, 選択肢, 値) の行に展開したもの（app/ballot_entries.py を参照）。
+    単記・承認・スコア・クアドラティック・負の投票の集計を GROUP BY で行うために使う。
+    """
+
+    __tablename__ = "ballot_entries"
+
+    id = Column(Integer, primary_key=True)
+    vote_id = Column(Integer, ForeignKey("votes.id"), nullable=False)
+    poll_id = Column(Integer, ForeignKey("polls.id"), nullable=False)
+    # 選択肢に存在しないIDもそのまま保存する（投票データと同じ集計結果にするため）
+    option_id = Column(Integer, nullable=False)
+    value = Column(Float, nullable=False)
+
+    vote = relationship("Vote")
+
+    # value まで含め、GROUP BY をインデックスのみで処理できるようにする
+    __table_args__ = (Index("ix_ballot_entries_poll_id_option_id", "poll_id", "option_id", "value"),)
+
+
+class PollTally(Base):
+    __tablename__ = "poll_tallies"
+
+    poll_id = Column(Integer, ForeignKey("polls.id"), primary_key=True)
+    voting_method = Column(String, nullable=False)
+    # 投票方式ごとの集計状態 (app/voting.py の TALLIES を参照)
+    state = Column(JSON, nullable=False)
+    vote_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    poll = relationship("Poll", back_populates="tally")
+
+
+class PollTallyPattern(Base):
+    """
+    集計状態のうち、異なる投票パターンごとの票数
+    （ボルダ・IRV・コンドルセの投票パターン。app/tally.py の PATTERN_KEYS）。
+    poll_tallies.state の JSON に持つと投票ごとに全パターンを書き直すため行にし、
+    投票ごとに該当する1行だけを加算する。読み込むのは結果を確定するときのみ。
+    """
+
+    __tablename__ = "poll_tally_patterns"
+
+    poll_id = Column(Integer, ForeignKey("polls.id"), primary_key=True)
+    # 集計状態のキーと同じ形式（IRV・コンドルセは選択肢IDをカンマでつないだ順位、
+    # ボルダは "選択肢ID:順位" をカンマでつないだもの）
+    pattern = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,106 @@
+"""
+パスワードのハッシュ化・照合（登録・ログイン用）の専用スレッドプール
+
+bcrypt は1回あたり数百ミリ秒 CPU を使うため、イベントループ上で実行すると
+その間ワーカーの全リクエスト（投票送信など）が止まる。ハッシュ化・照合は
+PASSWORD_HASH_WORKERS 個のスレッドで実行し、イベントループは完了を待つだけにする。
+
+- 実行中と待機中の合計は PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE まで（セマフォ）。
+  それを超える要求は待たせずに PasswordHasherBusy を送出する（API は 503 を返す）
+- 照合時にハッシュのコスト（BCRYPT_ROUNDS）が現在の設定と異なれば、
+  同じスレッドで新しいコストのハッシュを作って返す（ログイン時に保存し直す）
+- 実行中・待機中の件数、待機の最大数、拒否件数、1回あたりの所要時間は stats() で確認できる
+  （GET /api/stats の password_hasher）。コストはこの所要時間を見て調整する
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.auth import hash_password, verify_and_update_password
+from app.config import settings
+
+
+class PasswordHasherBusy(Exception):
+    """実行中・待機中のハッシュ化・照合が上限に達している"""
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self.pending = self.active = 0  # pending は実行中と待機中の合計
+        self.peak_queued = self.rejected = self.operations = 0
+        self.total_seconds = self.max_seconds = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        """(一致したか, コストを更新した新しいハッシュ。更新不要なら None)"""
+        return await self._run(verify_and_update_password, password, hashed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "active": self.active,
+                "queued": self.pending - self.active,
+                "peak_queued": self.peak_queued,
+                "rejected": self.rejected,
+                "operations": self.operations,
+                "average_ms": round(self.total_seconds / self.operations * 1000, 1) if self.operations else 0.0,
+                "max_ms": round(self.max_seconds * 1000, 1),
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.peak_queued = self.rejected = self.operations = 0
+            self.total_seconds = self.max_seconds = 0.0
+
+    async def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy()
+        with self._lock:
+            self.pending += 1
+            self.peak_queued = max(self.peak_queued, self.pending - self.active)
+        # 要求元がキャンセルされてもスレッドでの実行は止まらないため、枠は実行の完了時に返す
+        future = self._get_executor().submit(self._timed, fn, *args)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _timed(self, fn, *args):
+        with self._lock:
+            self.active += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.active -= 1
+                self.operations += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hasher")
+            return self._executor
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
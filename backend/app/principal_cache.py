@@ -0,0 +1,80 @@
+"""
+ログイン中のユーザー（get_current_user）のキャッシュ
+
+認証が必要なリクエスト（ダッシュボード・結果画面など）ごとに users を読み出さないよう、
+有効なユーザーの ID とメールアドレスをユーザーIDごとに保持する。
+
+- 保持するのは有効（is_active）なユーザーのみ。PRINCIPAL_CACHE_TTL_SECONDS を過ぎたものは使わず
+  DB から読み直すため、DB を直接変更して無効化した場合もこの時間内に反映される
+- User.is_active の変更（アクティベーション・無効化）で discard する（ORM の属性イベント）
+- 読み出し中に discard された場合に古い内容を保存しないよう、lookup 時の世代番号が
+  変わっていれば store しない（app/public_poll_cache.py と同じ）
+- 保持する件数は PRINCIPAL_CACHE_MAX_ENTRIES まで（最後に使われてから最も時間が経ったものから破棄）
+- プロセスごとに持つ（app/result_cache.py と同じ）
+"""
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from sqlalchemy import event
+
+from app import models
+from app.config import settings
+
+
+class Principal(NamedTuple):
+    id: int
+    email: str
+
+
+class PrincipalCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[int, tuple[Principal, float]] = OrderedDict()
+        self._generation = 0
+        self.hits = self.misses = 0
+
+    def lookup(self, user_id: int) -> tuple[Principal | None, int]:
+        """(有効期限内のエントリ, 世代番号) を返す。ミスした場合は同じ世代番号を store に渡す"""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0], self._generation
+        if entry is not None:
+            del self._entries[user_id]
+        self.misses += 1
+        return None, self._generation
+
+    def store(self, principal: Principal, generation: int) -> None:
+        if generation != self._generation or self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return  # 読み出し後にアクティベーション・無効化があった
+        self._entries[principal.id] = (principal, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(principal.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, user_id: int) -> None:
+        self._generation += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache(
+    max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+
+@event.listens_for(models.User.is_active, "set")
+def _discard_on_active_change(user, value, oldvalue, initiator):
+    if user.id is not None and value != oldvalue:
+        principal_cache.discard(user.id)
@@ -0,0 +1,74 @@
+"""
+公開投票フォーム（GET /api/vote/{public_id}）のキャッシュ
+
+投票ページの表示ごとに投票フォームと選択肢を読み出さないよう、シリアライズ済みの
+内容を公開IDごとに保持する。投票フォームの内容は作成後ほとんど変わらないため、
+編集・削除（app/routers/polls.py）で破棄するまで使い続ける。
+
+- is_active は表示時刻で変わるためキャッシュせず、保持した開始・終了時刻から毎回求める
+- 保持する件数は PUBLIC_POLL_CACHE_MAX_ENTRIES まで（最後に使われてから最も時間が経ったものから破棄）
+- 読み出し中に編集・削除された場合に古い内容を保存しないよう、lookup 時の世代番号が
+  変わっていれば store しない
+- プロセスごとに持つ（app/result_cache.py と同じ）
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+
+from app.config import settings
+
+
+class PublicPoll(NamedTuple):
+    poll_id: int
+    payload: dict  # is_active を除く公開用の内容
+    start_time: datetime | None
+    end_time: datetime | None
+    digest: str  # payload の SHA-256（ETag に使う）
+
+
+def make_public_poll(poll_id: int, payload: dict, start_time, end_time) -> PublicPoll:
+    body = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return PublicPoll(poll_id, payload, start_time, end_time, hashlib.sha256(body).hexdigest()[:32])
+
+
+class PublicPollCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, PublicPoll] = OrderedDict()
+        self._generation = 0
+        self.hits = self.misses = 0
+
+    def lookup(self, public_id: str) -> tuple[PublicPoll | None, int]:
+        """(エントリ, 世代番号) を返す。ミスした場合は同じ世代番号を store に渡す"""
+        entry = self._entries.get(public_id)
+        if entry is None:
+            self.misses += 1
+        else:
+            self._entries.move_to_end(public_id)
+            self.hits += 1
+        return entry, self._generation
+
+    def store(self, public_id: str, entry: PublicPoll, generation: int) -> None:
+        if generation != self._generation or self.max_entries <= 0:
+            return  # 読み出し後に編集・削除があった
+        self._entries[public_id] = entry
+        self._entries.move_to_end(public_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, public_id: str) -> None:
+        self._generation += 1
+        self._entries.pop(public_id, None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+public_poll_cache = PublicPollCache(max_entries=settings.PUBLIC_POLL_CACHE_MAX_ENTRIES)
@@ -0,0 +1,129 @@
+"""
+集計結果のキャッシュ（GET /api/polls/{id}/results 用）
+
+キーは投票フォームID、各エントリは結果を作ったときの results_version を持つ。
+投票・編集・再集計で Poll.results_version が増えると古いエントリは一致しなくなる。
+
+- 件数（RESULT_CACHE_MAX_ENTRIES）とバイト数（RESULT_CACHE_MAX_BYTES）の上限を超えたら
+  最後に使われてから最も時間が経ったエントリから削除する（LRU）
+- RESULT_CACHE_STALE_SECONDS > 0 のとき、古いバージョンのエントリでも作成から
+  その秒数以内であればそのまま返し、最新の結果はバックグラウンドで作り直す
+  （stale-while-revalidate）
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+from app.config import settings
+
+
+class _Entry(NamedTuple):
+    version: int
+    value: Any
+    size: int
+    stored_at: float
+
+
+class ResultCache:
+    def __init__(self, max_entries: int, max_bytes: int, stale_seconds: float = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._refreshing: set[int] = set()
+        self._lock = threading.Lock()
+        self.hits = self.stale_hits = self.misses = self.evictions = 0
+
+    def lookup(self, poll_id: int, version: int) -> tuple[Any, bool]:
+        """
+        (値, 再計算が必要か) を返す。値が None なら利用できるエントリがない（ミス）。
+        古いエントリを返した場合は、再計算を1件だけ引き受けたことを示す True を返す。
+        """
+        with self._lock:
+            entry = self._entries.get(poll_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(poll_id)
+                self.hits += 1
+                return entry.value, False
+            if (
+                entry is not None
+                and entry.version < version
+                and time.monotonic() - entry.stored_at <= self.stale_seconds
+            ):
+                self._entries.move_to_end(poll_id)
+                self.stale_hits += 1
+                refresh = poll_id not in self._refreshing
+                self._refreshing.add(poll_id)
+                return entry.value, refresh
+            self.misses += 1
+            return None, False
+
+    def get(self, poll_id: int, version: int) -> Any:
+        """version と一致するエントリの値（古いエントリは返さない）。なければ None"""
+        with self._lock:
+            entry = self._entries.get(poll_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(poll_id)
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+            return None
+
+    def store(self, poll_id: int, version: int, value: Any) -> None:
+        size = len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        with self._lock:
+            self._refreshing.discard(poll_id)
+            current = self._entries.get(poll_id)
+            if current is not None and current.version > version:
+                return  # より新しい結果がすでにある
+            self._remove(poll_id)
+            if size > self.max_bytes or self.max_entries <= 0:
+                return
+            self._entries[poll_id] = _Entry(version, value, size, time.monotonic())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def release(self, poll_id: int) -> None:
+        """バックグラウンドでの再計算が失敗したとき、次のリクエストで再度引き受けられるようにする"""
+        with self._lock:
+            self._refreshing.discard(poll_id)
+
+    def discard(self, poll_id: int) -> None:
+        with self._lock:
+            self._remove(poll_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._refreshing.clear()
+            self._bytes = 0
+            self.hits = self.stale_hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, poll_id: int) -> None:
+        entry = self._entries.pop(poll_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+
+result_cache = ResultCache(
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+    stale_seconds=settings.RESULT_CACHE_STALE_SECONDS,
+)
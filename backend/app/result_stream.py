@@ -0,0 +1,123 @@
+"""
+集計結果のライブ配信（GET /api/polls/{id}/results/stream の Server-Sent Events）
+
+投票・編集のたびに notify(poll_id) を呼ぶと、その投票フォームを購読している接続に
+最新の結果を送る。
+
+- 投票フォームごとに配信タスクを1つだけ動かし、notify から RESULTS_STREAM_COALESCE_MS
+  待ってまとめて1回だけ結果を計算する（その間の投票は1回の更新にまとまる）
+- 計算した結果は SSE のメッセージ（バイト列）にしてから全購読者に同じものを渡す
+- 購読者ごとに持つのは最新のメッセージへの参照と asyncio.Event のみで、
+  送信が追いつかない接続には途中のメッセージを飛ばして最新のものだけを送る
+- 購読者のいない投票フォームへの notify は何もしない
+- プロセスごとに持つ（app/result_cache.py と同じ）。他のプロセスで受け付けた投票は配信されない
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 最新の結果の SSE メッセージを返す。None なら投票フォームが削除された
+Compute = Callable[[], Awaitable[bytes | None]]
+
+
+class Subscriber:
+    __slots__ = ("message", "closed", "_event")
+
+    def __init__(self):
+        self.message: bytes | None = None
+        self.closed = False
+        self._event = asyncio.Event()
+
+    def push(self, message: bytes | None) -> None:
+        if message is None:
+            self.closed = True
+        else:
+            self.message = message
+        self._event.set()
+
+    async def next(self, timeout: float) -> bytes | None:
+        """次のメッセージ（未送信のうち最新のもの）を返す。timeout 秒なければ None"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._event.clear()
+        message, self.message = self.message, None
+        return message
+
+
+class ResultBroadcaster:
+    def __init__(self, coalesce_seconds: float):
+        self.coalesce_seconds = coalesce_seconds
+        self._subscribers: dict[int, set[Subscriber]] = {}
+        self._compute: dict[int, Compute] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._dirty: set[int] = set()
+        self.computations = self.messages = 0
+
+    def subscribe(self, poll_id: int, compute: Compute) -> Subscriber:
+        subscriber = Subscriber()
+        self._subscribers.setdefault(poll_id, set()).add(subscriber)
+        self._compute[poll_id] = compute
+        return subscriber
+
+    def unsubscribe(self, poll_id: int, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(poll_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[poll_id]
+            self._compute.pop(poll_id, None)
+            self._dirty.discard(poll_id)
+
+    def notify(self, poll_id: int) -> None:
+        """投票フォームの結果が変わったことを知らせる（イベントループ上から呼ぶ）"""
+        if poll_id not in self._subscribers:
+            return
+        self._dirty.add(poll_id)
+        if poll_id not in self._tasks:
+            self._tasks[poll_id] = asyncio.create_task(self._publish(poll_id))
+
+    def stats(self) -> dict:
+        return {
+            "polls": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "computations": self.computations,
+            "messages": self.messages,
+        }
+
+    async def _publish(self, poll_id: int) -> None:
+        try:
+            while poll_id in self._dirty:
+                await asyncio.sleep(self.coalesce_seconds)
+                # 計算中に届いた notify は次の周回でまとめて反映する
+                self._dirty.discard(poll_id)
+                compute = self._compute.get(poll_id)
+                if compute is None:
+                    break
+                try:
+                    message = await compute()
+                except Exception:
+                    logger.exception("Failed to compute streamed results for poll %s", poll_id)
+                    continue
+                self.computations += 1
+                subscribers = list(self._subscribers.get(poll_id, ()))
+                for subscriber in subscribers:
+                    subscriber.push(message)
+                self.messages += len(subscribers)
+        finally:
+            del self._tasks[poll_id]
+
+
+def format_event(event: str, data: str, event_id: int | None = None) -> bytes:
+    """SSE のメッセージ（data は改行を含まない JSON 文字列）"""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+result_broadcaster = ResultBroadcaster(coalesce_seconds=settings.RESULTS_STREAM_COALESCE_MS / 1000)
@@ -1,27 +1,30 @@
 from datetime import timedelta
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import JSONResponse, RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models
 from app.auth import (
     create_access_token,
     decode_access_token,
     generate_activation_token,
-    hash_password,
     validate_password,
-    verify_password,
 )
 from app.config import settings
-from app.database import get_db
-from app.email_utils import send_activation_email
+from app.database import get_db, get_read_db
+from app.email_utils import reserve_activation_email, send_activation_email
+from app.mail_queue import MailQueueFull
+from app.password_hasher import PasswordHasherBusy, password_hasher
+from app.principal_cache import Principal, principal_cache
 from app.schemas import LoginRequest, RegisterRequest
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-def get_current_user(request: Request, db: Session = Depends(get_db)):
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)):
     token = request.cookies.get("access_token")
     if not token:
         return None
@@ -31,26 +34,46 @@ def get_current_user(request: Request, db: Session = Depends(get_db)):
     user_id = payload.get("sub")
     if not user_id:
         return None
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
+    principal, generation = principal_cache.lookup(int(user_id))
+    if principal is not None:
+        return principal
+    user = await db.get(models.User, int(user_id))
     if not user or not user.is_active:
         return None
-    return user
+    principal = Principal(user.id, user.email)
+    principal_cache.store(principal, generation)
+    return principal
 
 
-def require_user(request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
+async def require_user(request: Request, db: AsyncSession = Depends(get_db)):
+    user = await get_current_user(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="ログインが必要です。")
     return user
 
 
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="ただいま混み合っています。しばらくしてから再度お試しください。",
+        headers={"Retry-After": "1"},
+    )
+
+
+def _already_registered() -> HTTPException:
+    return HTTPException(status_code=409, detail="このメールアドレスはすでに登録されています。")
+
+
+# 登録・ログインは bcrypt の間に書き込みのロック（書き込み用の接続は BEGIN IMMEDIATE で始まる）を
+# 持たないよう、ユーザーは読み取り専用のセッションで読み、INSERT・UPDATE のときだけ書き込む
+
 # ----------------------------- 登録 -----------------------------
 
 @router.post("/register")
 async def register(
     body: RegisterRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
 ):
     if body.password != body.password_confirm:
         raise HTTPException(status_code=422, detail="パスワードが一致しません。")
@@ -61,21 +84,42 @@ async def register(
             detail="パスワードは8文字以上で、大文字・小文字・数字・記号をそれぞれ1文字以上含めてください。",
         )
 
-    existing = db.query(models.User).filter(models.User.email == body.email).first()
+    existing = await read_db.scalar(select(models.User.id).where(models.User.email == body.email))
     if existing:
-        raise HTTPException(status_code=409, detail="このメールアドレスはすでに登録されています。")
+        raise _already_registered()
+
+    try:
+        hashed_password = await password_hasher.hash(body.password)
+    except PasswordHasherBusy:
+        raise _busy()
 
     token = generate_activation_token()
     user = models.User(
         email=body.email,
-        hashed_password=hash_password(body.password),
+        hashed_password=hashed_password,
         is_active=False,
         activation_token=token,
     )
-    db.add(user)
-    db.commit()
 
-    background_tasks.add_task(send_activation_email, body.email, token)
+    # 送信キューの空きはコミットの前に確保する（キューがいっぱいならユーザーを保存せずに 503。
+    # 空きを待つ間は書き込みのロックを持たない）。メールはコミットしてから確保した空きに入れ、
+    # 保存できなかった登録には送らない
+    try:
+        reservation = await reserve_activation_email()
+    except MailQueueFull:
+        raise _busy()
+    db.add(user)
+    committed = False
+    try:
+        await db.commit()
+        committed = True
+    except IntegrityError:  # 同じメールアドレスの登録が同時に送られた
+        raise _already_registered()
+    finally:
+        if not committed and reservation is not None:
+            reservation.cancel()
+
+    await send_activation_email(body.email, token, reservation)
 
     return {
         "message": f"登録メールを {body.email} に送信しました。メール内のリンクをクリックしてアカウントを有効化してください。"
@@ -85,24 +129,41 @@ async def register(
 # ----------------------------- アクティベーション -----------------------------
 
 @router.get("/activate/{token}")
-async def activate(token: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.activation_token == token).first()
+async def activate(token: str, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.activation_token == token))
     if not user:
         return RedirectResponse(url=f"{settings.FRONTEND_URL}/login?error=invalid_token")
     user.is_active = True
     user.activation_token = None
-    db.commit()
+    await db.commit()
     return RedirectResponse(url=f"{settings.FRONTEND_URL}/login?activated=1")
 
 
 # ----------------------------- ログイン -----------------------------
 
 @router.post("/login")
-async def login(body: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == body.email).first()
-    if not user or not verify_password(body.password, user.hashed_password):
+async def login(
+    body: LoginRequest,
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
+):
+    user = await read_db.scalar(select(models.User).where(models.User.email == body.email))
+    verified, new_hash = False, None
+    if user:
+        try:
+            verified, new_hash = await password_hasher.verify(body.password, user.hashed_password)
+        except PasswordHasherBusy:
+            raise _busy()
+    if not verified:
         raise HTTPException(status_code=401, detail="メールアドレスまたはパスワードが間違っています。")
 
+    if new_hash:
+        # BCRYPT_ROUNDS の変更後、最初のログインで新しいコストのハッシュに置き換える
+        await db.execute(
+            update(models.User).where(models.User.id == user.id).values(hashed_password=new_hash)
+        )
+        await db.commit()
+
     if not user.is_active:
         raise HTTPException(status_code=403, detail="アカウントが有効化されていません。登録メールをご確認ください。")
 
@@ -134,8 +195,8 @@ async def logout():
 # ----------------------------- 現在ユーザー取得 -----------------------------
 
 @router.get("/me")
-async def me(request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
+async def me(request: Request, db: AsyncSession = Depends(get_read_db)):
+    user = await get_current_user(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="未認証です。")
     return {"id": user.id, "email": user.email}
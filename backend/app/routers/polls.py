@@ -1,19 +1,45 @@
+import asyncio
+import base64
+import json
+import zlib
 from datetime import datetime
-from typing import Optional
+from functools import partial
+from typing import AsyncIterator, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app import models
-from app.config import VOTING_METHODS, settings
-from app.database import get_db
-from app.routers.auth import get_current_user, require_user
+from app.config import CONDORCET_COMPLETIONS, VOTING_METHODS, settings
+from app.ballot_entries import delete_entries
+from app.database import ReadSessionLocal, get_db, get_read_db
+from app.metrics import csv_export_bytes
+from app.public_poll_cache import public_poll_cache
+from app.result_cache import result_cache
+from app.result_stream import format_event, result_broadcaster
+from app.routers.auth import require_user
 from app.schemas import CreatePollRequest, UpdatePollRequest
-from app.voting import calculate_results, votes_to_csv
+from app.tally import (
+    STREAM_BATCH_SIZE,
+    bump_results_version,
+    finalize_tally,
+    recount_state_async,
+    tally_results_async,
+)
+from app.tracing import span
+from app.voter_filter import voter_filters
+from app.voting import csv_header, csv_rows
 
 router = APIRouter(prefix="/polls", tags=["polls"])
 
+# リクエストの外（結果のバックグラウンド再計算・ライブ配信）で開く読み取り専用のセッション。
+# Depends(get_read_db) のセッションはリクエストとともに閉じるため、これで開き直す（テストでは差し替える）
+read_session_factory = ReadSessionLocal
+
 
 def _parse_dt(value: Optional[str]) -> Optional[datetime]:
     if not value:
@@ -24,6 +50,13 @@ def _parse_dt(value: Optional[str]) -> Optional[datetime]:
         return None
 
 
+def _validate_method_settings(voting_method: str, method_settings: dict) -> None:
+    if voting_method == "condorcet":
+        completion = method_settings.get("completion") or "none"
+        if completion not in CONDORCET_COMPLETIONS:
+            raise HTTPException(status_code=422, detail="無効な補完ルールです。")
+
+
 def _poll_is_active(poll: models.Poll) -> bool:
     now = datetime.utcnow()
     if poll.start_time and now < poll.start_time:
@@ -33,7 +66,7 @@ def _poll_is_active(poll: models.Poll) -> bool:
     return True
 
 
-def _serialize_poll(poll: models.Poll, include_votes: bool = False) -> dict:
+def _serialize_poll(poll: models.Poll, include_votes: bool = False, vote_count: int = 0) -> dict:
     return {
         "id": poll.id,
         "public_id": poll.public_id,
@@ -49,13 +82,45 @@ def _serialize_poll(poll: models.Poll, include_votes: bool = False) -> dict:
             {"id": o.id, "text": o.text, "order_index": o.order_index}
             for o in poll.options
         ],
-        "vote_count": len(poll.votes),
+        "vote_count": vote_count,
         "is_active": _poll_is_active(poll),
     }
 
 
-def _require_creator(poll_id: int, user: models.User, db: Session) -> models.Poll:
-    poll = db.query(models.Poll).filter(models.Poll.id == poll_id).first()
+async def _vote_counts(db: AsyncSession, poll_ids: list[int]) -> dict[int, int]:
+    """
+    投票フォームごとの投票数（含まれない投票フォームは 0 票）。
+    投票ごとに更新される poll_tallies.vote_count を読み、集計状態のない投票フォーム
+    （導入前の投票のみのもの）だけ votes を数える。投票フォームの数によらずクエリは2回まで。
+    """
+    if not poll_ids:
+        return {}
+    rows = await db.execute(
+        select(models.PollTally.poll_id, models.PollTally.vote_count)
+        .where(models.PollTally.poll_id.in_(poll_ids))
+    )
+    counts = dict(rows.all())
+    missing = [poll_id for poll_id in poll_ids if poll_id not in counts]
+    if missing:
+        rows = await db.execute(
+            select(models.Vote.poll_id, func.count())
+            .where(models.Vote.poll_id.in_(missing))
+            .group_by(models.Vote.poll_id)
+        )
+        counts.update(rows.all())
+    return counts
+
+
+async def _vote_count(db: AsyncSession, poll_id: int) -> int:
+    return (await _vote_counts(db, [poll_id])).get(poll_id, 0)
+
+
+async def _require_creator(poll_id: int, user: models.User, db: AsyncSession) -> models.Poll:
+    poll = await db.scalar(
+        select(models.Poll)
+        .where(models.Poll.id == poll_id)
+        .options(selectinload(models.Poll.options))
+    )
     if not poll:
         raise HTTPException(status_code=404, detail="投票フォームが見つかりません。")
     if poll.creator_id != user.id:
@@ -65,16 +130,49 @@ def _require_creator(poll_id: int, user: models.User, db: Session) -> models.Pol
 
 # ----------------------------- 一覧 -----------------------------
 
+def _encode_cursor(poll: models.Poll) -> str:
+    raw = f"{poll.created_at.isoformat()}|{poll.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, poll_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(poll_id)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="無効なカーソルです。")
+
+
 @router.get("/")
-async def list_polls(request: Request, db: Session = Depends(get_db)):
-    user = require_user(request, db)
-    polls = (
-        db.query(models.Poll)
-        .filter(models.Poll.creator_id == user.id)
-        .order_by(models.Poll.created_at.desc())
-        .all()
+async def list_polls(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    作成した投票フォームを新しい順に返す（キーセットページング）。
+    続きがあれば X-Next-Cursor ヘッダーのカーソルを cursor に渡すと次のページを返す。
+    """
+    user = await require_user(request, db)
+    limit = min(limit or settings.POLL_PAGE_SIZE, settings.POLL_PAGE_MAX_SIZE)
+    stmt = (
+        select(models.Poll)
+        .where(models.Poll.creator_id == user.id)
+        .order_by(models.Poll.created_at.desc(), models.Poll.id.desc())
+        .limit(limit + 1)
+        .options(selectinload(models.Poll.options))
     )
-    return [_serialize_poll(p) for p in polls]
+    if cursor:
+        stmt = stmt.where(tuple_(models.Poll.created_at, models.Poll.id) < _decode_cursor(cursor))
+    polls = (await db.scalars(stmt)).all()
+    if len(polls) > limit:
+        polls = polls[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(polls[-1])
+    counts = await _vote_counts(db, [p.id for p in polls])
+    return [_serialize_poll(p, vote_count=counts.get(p.id, 0)) for p in polls]
 
 
 # ----------------------------- 作成 -----------------------------
@@ -83,12 +181,13 @@ async def list_polls(request: Request, db: Session = Depends(get_db)):
 async def create_poll(
     body: CreatePollRequest,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = require_user(request, db)
+    user = await require_user(request, db)
 
     if body.voting_method not in VOTING_METHODS:
         raise HTTPException(status_code=422, detail="無効な投票方式です。")
+    _validate_method_settings(body.voting_method, body.method_settings)
 
     option_list = [o.strip() for o in body.options if o.strip()]
     if len(option_list) < 2:
@@ -102,25 +201,20 @@ async def create_poll(
         creator_id=user.id,
         start_time=_parse_dt(body.start_time),
         end_time=_parse_dt(body.end_time),
+        options=[models.PollOption(text=text, order_index=idx) for idx, text in enumerate(option_list)],
     )
     db.add(poll)
-    db.flush()
-
-    for idx, text in enumerate(option_list):
-        db.add(models.PollOption(poll_id=poll.id, text=text, order_index=idx))
-
-    db.commit()
-    db.refresh(poll)
+    await db.commit()
     return _serialize_poll(poll)
 
 
 # ----------------------------- 取得 -----------------------------
 
 @router.get("/{poll_id}")
-async def get_poll(poll_id: int, request: Request, db: Session = Depends(get_db)):
-    user = require_user(request, db)
-    poll = _require_creator(poll_id, user, db)
-    return _serialize_poll(poll)
+async def get_poll(poll_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    user = await require_user(request, db)
+    poll = await _require_creator(poll_id, user, db)
+    return _serialize_poll(poll, vote_count=await _vote_count(db, poll.id))
 
 
 # ----------------------------- 更新 -----------------------------
@@ -130,14 +224,15 @@ async def update_poll(
     poll_id: int,
     body: UpdatePollRequest,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = require_user(request, db)
-    poll = _require_creator(poll_id, user, db)
+    user = await require_user(request, db)
+    poll = await _require_creator(poll_id, user, db)
 
     option_list = [o.strip() for o in body.options if o.strip()]
     if len(option_list) < 2:
         raise HTTPException(status_code=422, detail="選択肢は2つ以上必要です。")
+    _validate_method_settings(poll.voting_method, body.method_settings)
 
     poll.title = body.title.strip()
     poll.description = body.description.strip()
@@ -145,79 +240,268 @@ async def update_poll(
     poll.start_time = _parse_dt(body.start_time)
     poll.end_time = _parse_dt(body.end_time)
     poll.updated_at = datetime.utcnow()
+    bump_results_version(poll)
 
-    if len(poll.votes) == 0:
-        for opt in list(poll.options):
-            db.delete(opt)
-        db.flush()
-        for idx, text in enumerate(option_list):
-            db.add(models.PollOption(poll_id=poll.id, text=text, order_index=idx))
+    vote_count = await _vote_count(db, poll.id)
+    if vote_count == 0:
+        # 置き換えた選択肢は delete-orphan により削除される
+        poll.options = [models.PollOption(text=text, order_index=idx) for idx, text in enumerate(option_list)]
     else:
         for idx, text in enumerate(option_list):
             if idx < len(poll.options):
                 poll.options[idx].text = text
                 poll.options[idx].order_index = idx
 
-    db.commit()
-    db.refresh(poll)
-    return _serialize_poll(poll)
+    await db.commit()
+    public_poll_cache.discard(poll.public_id)
+    result_broadcaster.notify(poll.id)
+    return _serialize_poll(poll, vote_count=vote_count)
 
 
 # ----------------------------- 削除 -----------------------------
 
 @router.delete("/{poll_id}")
-async def delete_poll(poll_id: int, request: Request, db: Session = Depends(get_db)):
-    user = require_user(request, db)
-    poll = _require_creator(poll_id, user, db)
-    db.delete(poll)
-    db.commit()
+async def delete_poll(poll_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    user = await require_user(request, db)
+    poll = await _require_creator(poll_id, user, db)
+    # 投票は ORM のカスケードで1件ずつ読み込まず、一括で削除する
+    await db.run_sync(delete_entries, poll.id)
+    await db.execute(delete(models.Vote).where(models.Vote.poll_id == poll.id))
+    await db.execute(delete(models.PollTallyPattern).where(models.PollTallyPattern.poll_id == poll.id))
+    await db.delete(poll)
+    await db.commit()
+    result_cache.discard(poll_id)
+    public_poll_cache.discard(poll.public_id)
+    voter_filters.discard(poll_id)
+    result_broadcaster.notify(poll_id)  # 購読中の接続に削除を知らせる
     return {"message": "削除しました。"}
 
 
 # ----------------------------- 結果 -----------------------------
 
+def _result_options(poll: models.Poll) -> list:
+    return [{"id": o.id, "text": o.text, "order_index": o.order_index} for o in poll.options]
+
+
+async def _compute_results(db: AsyncSession, poll: models.Poll, options: list) -> dict:
+    # 投票ごとに更新される集計状態から結果を確定（全票の再集計はしない）
+    # 集計状態のない投票フォームは起動時に作る（build_missing_tallies）。読み取り専用のセッションのため、
+    # それでもなければ（起動後に消された場合）全票から作るが保存はしない
+    total_votes, result = await tally_results_async(db, poll, options, persist=False)
+    return {"total_votes": total_votes, "result": result}
+
+
+async def _refresh_results(poll_id: int, session_factory) -> None:
+    """バックグラウンドで最新の結果を作り直してキャッシュに入れる（stale-while-revalidate）"""
+    try:
+        async with session_factory() as db:
+            poll = await db.get(models.Poll, poll_id, options=[selectinload(models.Poll.options)])
+            if poll is None:
+                result_cache.discard(poll_id)
+                return
+            version = poll.results_version
+            result_cache.store(poll_id, version, await _compute_results(db, poll, _result_options(poll)))
+    except Exception:
+        result_cache.release(poll_id)
+        raise
+
+
 @router.get("/{poll_id}/results")
-async def get_results(poll_id: int, request: Request, db: Session = Depends(get_db)):
-    user = require_user(request, db)
-    poll = _require_creator(poll_id, user, db)
+async def get_results(
+    poll_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    recount: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+):
+    user = await require_user(request, db)
+    poll = await _require_creator(poll_id, user, db)
+
+    options = _result_options(poll)
+    version = poll.results_version
+    cached, refresh = result_cache.lookup(poll.id, version)
+    if cached is None:
+        cached = await _compute_results(db, poll, options)
+        result_cache.store(poll.id, version, cached)
+    elif refresh:
+        background_tasks.add_task(_refresh_results, poll.id, read_session_factory)
+    total_votes, result = cached["total_votes"], cached["result"]
 
-    options = [{"id": o.id, "text": o.text, "order_index": o.order_index} for o in poll.options]
-    votes_data = [
-        {"vote_data": v.vote_data, "created_at": v.created_at.strftime("%Y-%m-%d %H:%M:%S")}
-        for v in poll.votes
-    ]
+    if recount and total_votes:
+        # 検証用: 集計状態を使わず、カーソルから読み出した全票を直接集計する
+        state = await recount_state_async(db, poll)
+        result = await asyncio.to_thread(finalize_tally, poll, state["total"], state, options)
 
-    result = None
-    if votes_data:
-        result = calculate_results(poll.voting_method, votes_data, options)
+    with span("serialize"):  # 結果の行列などは大きいため jsonable_encoder も含めて測る
+        return JSONResponse(jsonable_encoder(_results_response(poll, options, total_votes, result)))
 
+
+def _results_response(poll: models.Poll, options: list, total_votes: int, result: dict | None) -> dict:
     return {
-        "poll": _serialize_poll(poll),
+        "poll": _serialize_poll(poll, vote_count=total_votes),
         "options": options,
-        "total_votes": len(votes_data),
+        "total_votes": total_votes,
         "result": result,
         "vote_url": f"{settings.BASE_URL}/vote/{poll.public_id}",
     }
 
 
+# ----------------------------- 結果のライブ配信 (SSE) -----------------------------
+
+SSE_KEEPALIVE = b": keepalive\n\n"
+
+
+async def _results_event(db: AsyncSession, poll: models.Poll) -> bytes:
+    """最新バージョンの結果（キャッシュになければ計算して保存）を SSE のメッセージにする"""
+    options = _result_options(poll)
+    version = poll.results_version
+    cached = result_cache.get(poll.id, version)
+    if cached is None:
+        cached = await _compute_results(db, poll, options)
+        result_cache.store(poll.id, version, cached)
+    payload = _results_response(poll, options, cached["total_votes"], cached["result"])
+    with span("serialize"):
+        data = json.dumps(jsonable_encoder(payload), ensure_ascii=False)
+    return format_event("results", data, version)
+
+
+async def _compute_results_event(poll_id: int, session_factory) -> bytes | None:
+    """配信タスクから呼ぶ（購読者の数によらず1回だけ計算する）。削除されていれば None"""
+    async with session_factory() as db:
+        poll = await db.get(models.Poll, poll_id, options=[selectinload(models.Poll.options)])
+        if poll is None:
+            return None
+        return await _results_event(db, poll)
+
+
+@router.get("/{poll_id}/results/stream")
+async def stream_results(poll_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    """
+    結果を Server-Sent Events で配信する。接続直後に現在の結果を、以降は投票・編集のたびに
+    （RESULTS_STREAM_COALESCE_MS ごとにまとめて）最新の結果を results イベントで送る。
+    投票フォームが削除されると deleted イベントを送って終了する。
+    """
+    user = await require_user(request, db)
+    poll = await _require_creator(poll_id, user, db)
+    compute = partial(_compute_results_event, poll.id, read_session_factory)
+    await db.close()  # 配信中はリクエストのセッション（読み取りのスナップショット）を持たない
+
+    async def events() -> AsyncIterator[bytes]:
+        # 最初の結果より前に購読し、その間の投票も取りこぼさない
+        subscriber = result_broadcaster.subscribe(poll.id, compute)
+        try:
+            # レスポンスの送信中はリクエストのセッションを使わず、専用のセッションで計算する
+            first = await compute()
+            if first is None:
+                yield format_event("deleted", "{}")
+                return
+            yield b"retry: 3000\n" + first
+            while True:
+                message = await subscriber.next(settings.RESULTS_STREAM_KEEPALIVE_SECONDS)
+                if message is not None:
+                    yield message
+                if subscriber.closed:
+                    yield format_event("deleted", "{}")
+                    return
+                if message is None:
+                    yield SSE_KEEPALIVE
+        finally:
+            result_broadcaster.unsubscribe(poll.id, subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # nginx でバッファしない
+    )
+
+
 # ----------------------------- CSV ダウンロード -----------------------------
 
+CSV_BOM = "\ufeff".encode("utf-8")  # Excel で文字化けしないよう utf-8-sig として先頭に付ける
+
+
+def _accepts_gzip(request: Request) -> bool:
+    """Accept-Encoding に gzip が含まれるか（q=0 で明示的に拒否されている場合を除く）"""
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+async def _csv_chunks(poll: models.Poll, options: list, session_factory) -> AsyncIterator[str]:
+    """
+    ヘッダー行に続き、カーソルから STREAM_BATCH_SIZE 件ずつ読み出した投票を CSV にして返す。
+    レスポンスの送信中に読むため、リクエストのセッションではなく専用のセッションを開く
+    """
+    yield csv_header(poll, options)
+    async with session_factory() as db:
+        result = await db.stream(
+            select(models.Vote.vote_data, models.Vote.created_at)
+            .where(models.Vote.poll_id == poll.id)
+            .order_by(models.Vote.id)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        start = 1
+        async for rows in result.partitions(STREAM_BATCH_SIZE):
+            votes = [
+                {"vote_data": vote_data, "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S")}
+                for vote_data, created_at in rows
+            ]
+            yield csv_rows(poll, votes, options, start)
+            start += len(votes)
+
+
+async def _encode_csv(chunks: AsyncIterator[str], compress: bool) -> AsyncIterator[bytes]:
+    """CSV の文字列チャンクを BOM 付き UTF-8（compress=True なら gzip）のバイト列として順に返す"""
+    if not compress:
+        yield CSV_BOM
+        async for chunk in chunks:
+            yield chunk.encode("utf-8")
+        return
+
+    gz = zlib.compressobj(wbits=31)  # wbits=31: gzip 形式
+    first = True
+    async for chunk in chunks:
+        data = gz.compress((CSV_BOM if first else b"") + chunk.encode("utf-8"))
+        if first:
+            # ヘッダー行はすぐに送り出す
+            data += gz.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield gz.flush()
+
+
+async def _count_csv_bytes(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    """送ったバイト数を csv_export_bytes に加える（途中で切断された場合もそこまでの分）"""
+    sent = 0
+    try:
+        async for data in chunks:
+            sent += len(data)
+            yield data
+    finally:
+        csv_export_bytes.labels(encoding).inc(sent)
+
+
 @router.get("/{poll_id}/results/csv")
-async def download_csv(poll_id: int, request: Request, db: Session = Depends(get_db)):
-    user = require_user(request, db)
-    poll = _require_creator(poll_id, user, db)
+async def download_csv(poll_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    user = await require_user(request, db)
+    poll = await _require_creator(poll_id, user, db)
 
     options = [{"id": o.id, "text": o.text} for o in poll.options]
-    votes_data = [
-        {"vote_data": v.vote_data, "created_at": v.created_at.strftime("%Y-%m-%d %H:%M:%S")}
-        for v in poll.votes
-    ]
+    await db.close()  # 送信中はリクエストのセッション（読み取りのスナップショット）を持たない
 
-    csv_content = votes_to_csv(poll, votes_data, options)
     filename = f"votes_{poll.public_id[:8]}.csv"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    compress = _accepts_gzip(request)
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    encoding = "gzip" if compress else "identity"
 
+    # 行はカーソルから一定件数ずつ読み出し、チャンクごとに送信する（CSV 全体をメモリに持たない）
     return StreamingResponse(
-        iter([csv_content]),
+        _count_csv_bytes(_encode_csv(_csv_chunks(poll, options, read_session_factory), compress), encoding),
         media_type="text/csv; charset=utf-8-sig",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        headers=headers,
     )
@@ -3,14 +3,23 @@ import hmac
 import secrets
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app import models
 from app.config import MJ_GRADES, VOTING_METHODS, settings
-from app.database import get_db
+from app.ballot_entries import add_entries
+from app.database import get_db, get_read_db
+from app.metrics import vote_submissions
+from app.public_poll_cache import PublicPoll, make_public_poll, public_poll_cache
+from app.result_stream import result_broadcaster
 from app.schemas import VoteSubmitRequest
+from app.tally import record_vote
+from app.voter_filter import voter_filters
 
 router = APIRouter(prefix="/vote", tags=["vote"])
 
@@ -24,22 +33,43 @@ def _make_fingerprint(voter_id: str, poll_public_id: str) -> str:
     return hmac.new(key, msg, hashlib.sha256).hexdigest()
 
 
-def _is_poll_active(poll: models.Poll) -> bool:
-    now = datetime.utcnow()
-    if poll.start_time and now < poll.start_time:
+def _is_active(start_time: datetime | None, end_time: datetime | None, now: datetime | None = None) -> bool:
+    now = now or datetime.utcnow()
+    if start_time and now < start_time:
         return False
-    if poll.end_time and now > poll.end_time:
+    if end_time and now > end_time:
         return False
     return True
 
 
-def _get_poll_or_404(public_id: str, db: Session) -> models.Poll:
-    poll = db.query(models.Poll).filter(models.Poll.public_id == public_id).first()
+def _is_poll_active(poll: models.Poll) -> bool:
+    return _is_active(poll.start_time, poll.end_time)
+
+
+async def _get_poll_or_404(public_id: str, db: AsyncSession) -> models.Poll:
+    poll = await db.scalar(
+        select(models.Poll)
+        .where(models.Poll.public_id == public_id)
+        .options(selectinload(models.Poll.options))
+    )
     if not poll:
         raise HTTPException(status_code=404, detail="投票フォームが見つかりません。")
     return poll
 
 
+async def _has_voted(db: AsyncSession, poll_id: int, fingerprint: str) -> bool:
+    # ブルームフィルターに含まれなければ確実に未投票（DB を確認しない）
+    if not voter_filters.might_contain(poll_id, fingerprint):
+        return False
+    voted = select(models.Vote.id).where(
+        models.Vote.poll_id == poll_id, models.Vote.voter_fingerprint == fingerprint
+    )
+    if await db.scalar(select(voted.exists())):
+        return True
+    voter_filters.record_false_positive()
+    return False
+
+
 def _serialize_public_poll(poll: models.Poll) -> dict:
     return {
         "public_id": poll.public_id,
@@ -55,35 +85,66 @@ def _serialize_public_poll(poll: models.Poll) -> dict:
             for o in poll.options
         ],
         "mj_grades": MJ_GRADES,
-        "is_active": _is_poll_active(poll),
     }
 
 
+async def _get_public_poll(public_id: str, db: AsyncSession) -> PublicPoll:
+    """公開用の内容をキャッシュから返す（なければ DB から読み出してキャッシュする）"""
+    entry, generation = public_poll_cache.lookup(public_id)
+    if entry is None:
+        poll = await _get_poll_or_404(public_id, db)
+        entry = make_public_poll(poll.id, _serialize_public_poll(poll), poll.start_time, poll.end_time)
+        public_poll_cache.store(public_id, entry, generation)
+    return entry
+
+
+def _max_age(entry: PublicPoll, now: datetime) -> int:
+    """Cache-Control の max-age（受付の開始・終了をまたいでキャッシュされないようにする）"""
+    max_age = settings.PUBLIC_POLL_MAX_AGE
+    for boundary in (entry.start_time, entry.end_time):
+        if boundary and boundary > now:
+            max_age = min(max_age, int((boundary - now).total_seconds()))
+    return max(max_age, 0)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
 # ----------------------------- 投票フォーム取得 (公開) -----------------------------
 
 @router.get("/{public_id}")
-async def get_vote_poll(public_id: str, db: Session = Depends(get_db)):
-    poll = _get_poll_or_404(public_id, db)
-    return _serialize_public_poll(poll)
+async def get_vote_poll(public_id: str, request: Request, db: AsyncSession = Depends(get_read_db)):
+    entry = await _get_public_poll(public_id, db)
+    now = datetime.utcnow()
+    is_active = _is_active(entry.start_time, entry.end_time, now)
+    headers = {
+        "ETag": f'"{entry.digest}-{int(is_active)}"',
+        "Cache-Control": f"public, max-age={_max_age(entry, now)}",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({**entry.payload, "is_active": is_active}, headers=headers)
 
 
 # ----------------------------- 投票済みステータス確認 -----------------------------
 
 @router.get("/{public_id}/status")
-async def get_vote_status(public_id: str, request: Request, db: Session = Depends(get_db)):
-    poll = _get_poll_or_404(public_id, db)
+async def get_vote_status(public_id: str, request: Request, db: AsyncSession = Depends(get_read_db)):
+    entry = await _get_public_poll(public_id, db)
     voter_id = request.cookies.get(VOTER_COOKIE, "")
     already_voted = False
     if voter_id:
-        fp = _make_fingerprint(voter_id, poll.public_id)
-        existing = (
-            db.query(models.Vote)
-            .filter(models.Vote.poll_id == poll.id, models.Vote.voter_fingerprint == fp)
-            .first()
-        )
-        already_voted = existing is not None
+        fp = _make_fingerprint(voter_id, public_id)
+        already_voted = await _has_voted(db, entry.poll_id, fp)
 
-    return {"already_voted": already_voted, "is_active": _is_poll_active(poll)}
+    return {"already_voted": already_voted, "is_active": _is_active(entry.start_time, entry.end_time)}
 
 
 # ----------------------------- 投票送信 -----------------------------
@@ -93,11 +154,12 @@ async def submit_vote(
     public_id: str,
     body: VoteSubmitRequest,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    poll = _get_poll_or_404(public_id, db)
+    poll = await _get_poll_or_404(public_id, db)
 
     if not _is_poll_active(poll):
+        vote_submissions.labels("inactive").inc()
         raise HTTPException(status_code=400, detail="この投票は現在受け付けていません。")
 
     voter_id = request.cookies.get(VOTER_COOKIE)
@@ -107,21 +169,38 @@ async def submit_vote(
 
     fp = _make_fingerprint(voter_id, poll.public_id)
 
-    existing = (
-        db.query(models.Vote)
-        .filter(models.Vote.poll_id == poll.id, models.Vote.voter_fingerprint == fp)
-        .first()
-    )
-    if existing:
+    if await _has_voted(db, poll.id, fp):
+        vote_submissions.labels("duplicate").inc()
         raise HTTPException(status_code=409, detail="すでにこの投票に参加済みです。")
 
-    vote = models.Vote(
-        poll_id=poll.id,
-        voter_fingerprint=fp,
-        vote_data=body.vote_data,
+    # 集計状態の更新は投票の保存と同じトランザクションで行う
+    try:
+        await db.run_sync(record_vote, poll, body.vote_data)
+    except (TypeError, ValueError, AttributeError):
+        await db.rollback()
+        vote_submissions.labels("invalid").inc()
+        raise HTTPException(status_code=422, detail="投票データの形式が正しくありません。")
+    # 同じ投票者の同時の送信は一意インデックスで1件だけが保存される（確認と書き込みを1文で行う）
+    vote_id = await db.scalar(
+        insert(models.Vote)
+        .values(
+            poll_id=poll.id,
+            voter_fingerprint=fp,
+            vote_data=body.vote_data,
+            entries_written=True,
+        )
+        .on_conflict_do_nothing(index_elements=["poll_id", "voter_fingerprint"])
+        .returning(models.Vote.id)
     )
-    db.add(vote)
-    db.commit()
+    if vote_id is None:
+        await db.rollback()  # 集計状態への加算も取り消す
+        vote_submissions.labels("duplicate").inc()
+        raise HTTPException(status_code=409, detail="すでにこの投票に参加済みです。")
+    await db.run_sync(add_entries, poll, vote_id, body.vote_data)
+    await db.commit()
+    vote_submissions.labels("accepted").inc()
+    voter_filters.add(poll.id, fp)
+    result_broadcaster.notify(poll.id)
 
     response = JSONResponse({"success": True})
     if is_new_voter:
@@ -0,0 +1,349 @@
+"""
+集計状態（タリー）の永続化
+
+投票送信時に submit_vote と同じトランザクションで poll_tallies を更新し、
+結果表示時は保存済みの state を finalize するだけで済ませる。
+結果表示のコストは投票数に依存せず、選択肢数のみに比例する
+（コンドルセは選択肢数², IRV は異なる順位パターン数に比例）。
+
+順位付き投票（ボルダ・IRV・コンドルセ）の投票パターンごとの票数（PATTERN_KEYS）は
+poll_tallies.state の JSON には入れず、poll_tally_patterns の (poll_id, pattern) → 票数 の行に持つ。
+投票ごとに書くのは該当するパターンの1行のみで（UPSERT）、行を読み込むのは結果を確定するときのみ。
+以前の版が JSON に保存したパターンは、次の投票・再集計で行に移す。パターンを保存していなかった版の
+ボルダ・コンドルセの集計状態は、起動時（build_missing_tallies）に全票から作り直す。
+
+集計状態が存在しない投票フォーム（この仕組みの導入前の投票など）は
+初回アクセス時に全票から再集計して作成する。
+
+全票の読み出しは vote_data 列のみをサーバーサイドカーソルで一定件数ずつ取得する
+（Vote の ORM オブジェクトは作らない）ため、メモリ使用量は投票数に依存しない。
+
+API（AsyncSession）からは、DB の読み書きは AsyncSession.run_sync 経由で同じ関数を使い、
+加算・finalize などの計算はワーカースレッドで行う（末尾の *_async 関数）。
+"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
+from app import models
+from app.ballot_entries import sql_state
+from app.metrics import observe_calculation
+from app.tracing import span
+from app.voting import TALLIES
+from app.voting_parallel import parallel_state
+
+logger = logging.getLogger(__name__)
+
+STREAM_BATCH_SIZE = 1000
+
+# 集計状態のうち poll_tally_patterns の行に持つキー（方式 → {パターン: 票数} のキー）
+PATTERN_KEYS = {"borda": "ballots", "irv": "ballots", "condorcet": "ballots"}
+
+
+def stream_vote_data(
+    db: Session,
+    poll_id: int,
+    batch_size: int = STREAM_BATCH_SIZE,
+    after_id: int = 0,
+    upto_id: int | None = None,
+) -> Iterator[dict]:
+    """
+    投票フォームの vote_data を投票順に batch_size 件ずつカーソルから読み出す
+    （投票IDが after_id より大きく、upto_id 以下のもの）
+    """
+    stmt = (
+        select(models.Vote.vote_data)
+        .where(models.Vote.poll_id == poll_id, models.Vote.id > after_id)
+        .order_by(models.Vote.id)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    if upto_id is not None:
+        stmt = stmt.where(models.Vote.id <= upto_id)
+    yield from db.execute(stmt).scalars()
+
+
+def last_vote_id(db: Session, poll_id: int) -> int:
+    """投票フォームの最後の投票ID（投票がなければ 0）"""
+    return db.scalar(select(func.max(models.Vote.id)).where(models.Vote.poll_id == poll_id)) or 0
+
+
+def stream_votes(db: Session, poll_id: int, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[dict]:
+    """calculate_results に渡す形式 {"vote_data": ...} のジェネレーター"""
+    for vote_data in stream_vote_data(db, poll_id, batch_size):
+        yield {"vote_data": vote_data}
+
+
+def recount_state(db: Session, poll: models.Poll, workers: int | None = None, upto_id: int | None = None) -> dict:
+    """
+    保存済みの全投票（upto_id を指定すればその投票IDまで）から集計状態を作り直す。
+    workers が 2 以上ならチャンクごとにプロセス並列で集計して合算する。
+    """
+    vote_datas = stream_vote_data(db, poll.id, upto_id=upto_id)
+    if workers and workers > 1:
+        return parallel_state(poll.voting_method, vote_datas, workers)
+    tally = TALLIES[poll.voting_method]
+    state = tally.init()
+    for vote_data in vote_datas:
+        tally.accumulate(state, vote_data)
+    return state
+
+
+def _store_state(poll: models.Poll, state: dict) -> models.PollTally:
+    row = poll.tally
+    if row is None:
+        row = models.PollTally(poll_id=poll.id)
+        poll.tally = row
+    row.voting_method = poll.voting_method
+    row.state = state
+    row.vote_count = state["total"]
+    return row
+
+
+def _load_patterns(db: Session, poll_id: int) -> dict:
+    pattern = models.PollTallyPattern
+    return dict(db.execute(select(pattern.pattern, pattern.count).where(pattern.poll_id == poll_id)).all())
+
+
+def _add_patterns(db: Session, poll_id: int, patterns: dict) -> None:
+    """パターンごとの票数を加算する（行がなければ作る）"""
+    table = models.PollTallyPattern.__table__
+    for key, count in patterns.items():
+        stmt = insert(table).values(poll_id=poll_id, pattern=key, count=count)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["poll_id", "pattern"], set_={"count": table.c.count + stmt.excluded.count}
+        ))
+
+
+def _move_patterns(db: Session, poll: models.Poll, row: models.PollTally) -> None:
+    """
+    全票から作った（または以前の版が保存した）state の JSON にあるパターンを poll_tally_patterns の行に
+    置き換える。書き込み用のセッションで保存する前に呼ぶ
+    """
+    key = PATTERN_KEYS.get(poll.voting_method)
+    if key is None or key not in row.state:
+        return
+    patterns = row.state[key]
+    row.state = {k: v for k, v in row.state.items() if k != key}  # 呼び出し側が持つ元の dict は変えない
+    db.execute(delete(models.PollTallyPattern).where(models.PollTallyPattern.poll_id == poll.id))
+    if patterns:
+        db.execute(
+            models.PollTallyPattern.__table__.insert(),
+            [{"poll_id": poll.id, "pattern": k, "count": count} for k, count in patterns.items()],
+        )
+
+
+def has_json_patterns(poll: models.Poll) -> bool:
+    """以前の版の形式（パターンを poll_tallies.state の JSON に保存）の集計状態か"""
+    key = PATTERN_KEYS.get(poll.voting_method)
+    return key is not None and poll.tally is not None and key in poll.tally.state
+
+
+def _full_state(db: Session, poll: models.Poll, row: models.PollTally) -> dict:
+    """保存済みの集計状態に poll_tally_patterns の行を加えた、finalize に渡せる state"""
+    key = PATTERN_KEYS.get(poll.voting_method)
+    if key is None or key in row.state:
+        return row.state
+    return {**row.state, key: _load_patterns(db, poll.id)}
+
+
+def get_tally(db: Session, poll: models.Poll) -> models.PollTally:
+    """投票フォームの集計状態を取得（存在しなければ全票から再集計して作成）"""
+    row = poll.tally
+    if row is None or row.voting_method != poll.voting_method:
+        # 対象の方式で ballot_entries の展開が済んでいれば GROUP BY で作る
+        state = sql_state(db, poll)
+        if state is None:
+            state = recount_state(db, poll)
+        row = _store_state(poll, state)
+    return row
+
+
+def build_missing_tallies(bind) -> int:
+    """
+    投票があるのに集計状態がない（この仕組みの導入前の投票など）投票フォームの集計状態を作って保存し、
+    作った数を返す。起動時に書き込み用のエンジンで1度実行し、結果の表示（読み取り専用のセッションで
+    保存しない）のたびに全票を再集計しないようにする。
+    投票パターンを記録する方式で、パターンが行にも JSON にもない集計状態（パターンを保存していなかった版の
+    ボルダ・コンドルセ）も全票から作り直す。
+    """
+    has_patterns = (
+        select(models.PollTallyPattern.poll_id).where(models.PollTallyPattern.poll_id == models.Poll.id).exists()
+    )
+    stmt = (
+        select(models.Poll)
+        .outerjoin(models.PollTally)
+        .where(or_(
+            models.PollTally.poll_id.is_(None),
+            models.PollTally.voting_method != models.Poll.voting_method,
+            and_(models.Poll.voting_method.in_(list(PATTERN_KEYS)), ~has_patterns),
+        ))
+        .where(select(models.Vote.id).where(models.Vote.poll_id == models.Poll.id).exists())
+        .order_by(models.Poll.id)
+    )
+    built = 0
+    with Session(bind) as db:
+        for poll in db.scalars(stmt).all():
+            row = get_tally(db, poll)
+            key = PATTERN_KEYS.get(poll.voting_method)
+            if key is not None and key not in row.state:
+                row = _store_state(poll, recount_state(db, poll))
+                bump_results_version(poll)
+            _move_patterns(db, poll, row)
+            db.commit()
+            built += 1
+    if built:
+        logger.warning("Built missing tallies for %d polls", built)
+    return built
+
+
+def record_vote(db: Session, poll: models.Poll, vote_data: dict) -> None:
+    """
+    1票を集計状態に加算する。
+    Vote の追加（flush）より前に呼ぶこと（再集計時に二重計上しないため）。
+    """
+    row = get_tally(db, poll)
+    _move_patterns(db, poll, row)
+    key = PATTERN_KEYS.get(poll.voting_method)
+    if key is None:
+        TALLIES[poll.voting_method].accumulate(row.state, vote_data)
+    else:
+        # この1票のパターンだけを加算し、JSON には総投票数などのみを書く
+        state = {**row.state, key: {}}
+        TALLIES[poll.voting_method].accumulate(state, vote_data)
+        _add_patterns(db, poll.id, state.pop(key))
+        row.state = state
+    row.vote_count = row.state["total"]
+    flag_modified(row, "state")
+    bump_results_version(poll)
+
+
+def bump_results_version(poll: models.Poll) -> None:
+    """結果キャッシュを無効にする（同時に更新されても取りこぼさないよう SQL 式で加算）"""
+    poll.results_version = models.Poll.results_version + 1
+
+
+def load_tally(db: Session, poll: models.Poll, persist: bool = True) -> tuple[int, dict]:
+    """
+    保存済みの集計状態 (総投票数, state) を返す（存在しなければ作成し、persist=True ならコミット）。
+    読み取り専用のセッションでは persist=False とし、作成した state は保存しない
+    （起動時の build_missing_tallies で保存されるため、起動後に集計状態が消えた場合のみ）。
+    """
+    created = poll.tally is None
+    row = get_tally(db, poll)
+    state = _full_state(db, poll, row)
+    if created and persist:
+        _move_patterns(db, poll, row)
+        db.commit()
+    return row.vote_count, state
+
+
+def finalize_tally(poll: models.Poll, vote_count: int, state: dict, options: list) -> dict | None:
+    """集計状態から結果を確定する。投票がなければ None"""
+    if vote_count == 0:
+        return None
+    start = time.perf_counter()
+    with span("calculate", method=poll.voting_method, ballots=vote_count, options=len(options)):
+        result = TALLIES[poll.voting_method].finalize(state, options, poll.method_settings or {})
+    observe_calculation(poll.voting_method, vote_count, time.perf_counter() - start)
+    return result
+
+
+def tally_results(db: Session, poll: models.Poll, options: list) -> tuple[int, dict | None]:
+    """保存済みの集計状態から (総投票数, 結果) を返す。投票がなければ結果は None"""
+    vote_count, state = load_tally(db, poll)
+    return vote_count, finalize_tally(poll, vote_count, state, options)
+
+
+def check_poll(db: Session, poll: models.Poll, workers: int | None = None) -> tuple[bool, dict, int]:
+    """
+    全票から再集計し、保存済みの集計状態と一致するか確認する（書き込みはしない）。
+    (一致したか, 再集計した state, 再集計に含めた最後の投票ID) を返す。
+    読み取り専用のセッション（SyncReadSessionLocal）で呼べば、1つのスナップショットの投票と集計状態を
+    比べ、再集計の間も投票送信を待たせない。
+    """
+    upto_id = last_vote_id(db, poll.id)
+    state = recount_state(db, poll, workers, upto_id)
+    row = poll.tally
+    matched = (
+        row is not None
+        and row.voting_method == poll.voting_method
+        and _full_state(db, poll, row) == state
+        and row.vote_count == state["total"]
+    )
+    return matched, state, upto_id
+
+
+def replace_tally(db: Session, poll: models.Poll, state: dict, upto_id: int) -> None:
+    """
+    check_poll で再集計した state で集計状態を置き換える。書き込み用のセッションで呼び、すぐにコミットする。
+    再集計の後に受け付けた投票（投票IDが upto_id より大きいもの）はここで加算するため、
+    書き込みのロックを持つのはその分の読み出しと置き換えの間だけ。
+    """
+    accumulate = TALLIES[poll.voting_method].accumulate
+    for vote_data in stream_vote_data(db, poll.id, after_id=upto_id):
+        accumulate(state, vote_data)
+    row = _store_state(poll, state)
+    bump_results_version(poll)
+    _move_patterns(db, poll, row)
+
+
+def recount_poll(db: Session, poll: models.Poll, fix: bool = True, workers: int | None = None) -> bool:
+    """
+    check_poll と replace_tally を1つのセッションで行う（fix=True なら不一致のとき再集計結果で上書きし、
+    以前の版が JSON に保存したパターンを行に移す）。一致していれば True を返す。
+    """
+    matched, state, upto_id = check_poll(db, poll, workers)
+    if fix:
+        if matched:
+            _move_patterns(db, poll, poll.tally)
+        else:
+            replace_tally(db, poll, state, upto_id)
+    return matched
+
+
+# ---------------------------------------------------------------------------
+# AsyncSession 用（API のリクエスト処理）
+# ---------------------------------------------------------------------------
+async def stream_vote_data_batches(
+    db: AsyncSession, poll_id: int, batch_size: int = STREAM_BATCH_SIZE
+) -> AsyncIterator[list]:
+    """投票フォームの vote_data を投票順に batch_size 件ずつのリストで返す"""
+    stmt = (
+        select(models.Vote.vote_data)
+        .where(models.Vote.poll_id == poll_id)
+        .order_by(models.Vote.id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream_scalars(stmt)
+    async for batch in result.partitions(batch_size):
+        yield batch
+
+
+def _accumulate_all(voting_method: str, state: dict, vote_datas: list) -> None:
+    accumulate = TALLIES[voting_method].accumulate
+    for vote_data in vote_datas:
+        accumulate(state, vote_data)
+
+
+async def recount_state_async(db: AsyncSession, poll: models.Poll) -> dict:
+    """全票から集計状態を作る（読み出しは非同期、加算はバッチごとにワーカースレッドで行う）"""
+    state = TALLIES[poll.voting_method].init()
+    async for batch in stream_vote_data_batches(db, poll.id):
+        await asyncio.to_thread(_accumulate_all, poll.voting_method, state, batch)
+    return state
+
+
+async def tally_results_async(
+    db: AsyncSession, poll: models.Poll, options: list, persist: bool = True
+) -> tuple[int, dict | None]:
+    """tally_results の非同期版（finalize はワーカースレッドで行う）"""
+    vote_count, state = await db.run_sync(load_tally, poll, persist)
+    result = await asyncio.to_thread(finalize_tally, poll, vote_count, state, options)
+    return vote_count, result
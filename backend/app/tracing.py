@@ -0,0 +1,321 @@
+"""
+リクエストごとのトレース（スパン）と遅い SQL のログ
+
+- TracingMiddleware（ASGI）: リクエストごとにトレースID を振り、ルートのテンプレート・ステータスを
+  持つルートスパンを作る。応答に X-Trace-Id ヘッダーを付け、終わったトレースのスパンを
+  JSON Lines のファイル（TRACE_FILE）に1行1スパンで書き出す（書き込みは専用のスレッドで行う）。
+  traceparent ヘッダー（W3C Trace Context）があればそのトレースID・サンプリングを引き継ぐ。
+- span(): 処理の区間を子スパンにする（結果の確定・JSON へのシリアライズなど）。
+  トレース中でなければ何もしない。contextvars で伝わるため asyncio.to_thread の中でも使える。
+- trace_engine: SQLAlchemy のエンジンのイベントで SQL 文ごとに子スパンを作る。
+  SLOW_QUERY_MS 以上かかった文は EXPLAIN QUERY PLAN の結果とともに警告としてログに出す
+  （トレースしていないリクエストでも出す）。時間は文の実行のみで、サーバーサイドカーソルの
+  読み出しは含まない。
+
+TRACING_ENABLED=False（既定）ではミドルウェアを入れず、SQL のイベントは遅い文の判定のみ。
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+
+from app.config import settings
+from app.metrics import route_template, statement_operation
+
+logger = logging.getLogger(__name__)
+
+MAX_SPANS_PER_TRACE = 1000  # 結果のライブ配信など長く続くリクエストで増え続けないよう打ち切る
+MAX_PENDING_TRACES = 10000  # 書き出し待ちのトレース数の上限（ディスクが遅くてもメモリを使い続けない）
+MAX_STATEMENT_LENGTH = 2000
+EXPLAINABLE = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"))
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """1リクエストのスパン（終わった順）"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: list[dict] = []
+        self.dropped = 0
+        self.finished = False
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start", "_t0")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def end(self) -> None:
+        trace = self.trace
+        if trace.finished:  # リクエストの後まで続いたバックグラウンドの処理
+            return
+        if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+            trace.dropped += 1
+            return
+        trace.spans.append({
+            "trace_id": trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((time.perf_counter() - self._t0) * 1000, 3),
+            "attributes": self.attributes,
+        })
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """現在のスパンの子スパンを始める（トレース中でなければ None）。終わったら end() を呼ぶ"""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """with の区間を子スパンにする。中で作ったスパンはこのスパンの子になる"""
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+class TracedJSONResponse(JSONResponse):
+    """dict などを返すルートの JSON へのシリアライズを "serialize" スパンにする"""
+
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return super().render(content)
+
+
+# ----------------------------- エクスポート -----------------------------
+
+class JsonLinesExporter:
+    """
+    終わったトレースのスパンをファイルに1行1スパンで追記する。
+    export() はキューに入れるだけで、JSON への変換とファイルへの書き込みは専用のスレッドが
+    たまった分をまとめて行う（リクエストの処理・イベントループはディスクを待たない）。
+    キューが上限（max_pending）に達している間のトレースは捨てて dropped に数える。
+    """
+
+    def __init__(self, path: str, max_pending: int = MAX_PENDING_TRACES):
+        self.path = path
+        self._queue: queue.Queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.exported = 0
+        self.dropped = 0
+
+    def export(self, spans: list[dict]) -> None:
+        if not spans:
+            return
+        self._start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def flush(self) -> None:
+        """キューに入れたスパンを書き終えるまで待つ（終了時・テスト用）"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                thread.start()
+                self._thread = thread
+                atexit.register(self.flush)  # 終了時にキューに残ったスパンを書き出す
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = "".join(
+                    json.dumps(s, ensure_ascii=False, default=str) + "\n" for spans in batch for s in spans
+                )
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+                self.exported += sum(len(spans) for spans in batch)
+            except Exception:
+                logger.exception("Failed to write %d traces to %s", len(batch), self.path)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+# ----------------------------- HTTP -----------------------------
+
+class TracingMiddleware:
+    """
+    ASGI のミドルウェア。サンプリングしたリクエスト（TRACE_SAMPLE_RATE）のスパンを exporter に渡す。
+    ルートスパンの名前はルーティング後に決まる "GET /api/polls/{poll_id}" の形にする。
+    """
+
+    def __init__(self, app, exporter: Optional[JsonLinesExporter] = None, sample_rate: Optional[float] = None):
+        self.app = app
+        self.exporter = exporter or JsonLinesExporter(settings.TRACE_FILE)
+        self.sample_rate = settings.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id, sampled = _incoming_context(scope)
+        if sampled is None:
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(trace_id or secrets.token_hex(16))
+        root = Span(trace, scope["method"], parent_id, {"method": scope["method"], "path": scope["path"]})
+        status = 500  # 応答を始める前に例外で終わった場合
+
+        async def send_with_trace_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+
+        token = _current_span.set(root)
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            _current_span.reset(token)
+            route = route_template(scope)
+            root.name = f"{scope['method']} {route}"
+            root.attributes.update(route=route, status=status)
+            if trace.dropped:
+                root.attributes["dropped_spans"] = trace.dropped
+            root.end()
+            trace.finished = True
+            self.exporter.export(trace.spans)
+
+
+def _incoming_context(scope) -> tuple[Optional[str], Optional[str], Optional[bool]]:
+    """traceparent ヘッダーの (トレースID, 親のスパンID, サンプリングするか)。なければ全て None"""
+    for name, value in scope["headers"]:
+        if name == b"traceparent":
+            match = _TRACEPARENT.match(value.decode("latin-1").strip().lower())
+            if match and match.group(1) != "0" * 32:
+                return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+    return None, None, None
+
+
+# ----------------------------- DB -----------------------------
+
+_QUERY_START = "tracing_query_start"
+_QUERY_SPAN = "tracing_query_span"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info[_QUERY_START] = time.perf_counter()
+    conn.info[_QUERY_SPAN] = start_span("sql")
+
+
+def explain_query_plan(dbapi_connection, statement: str, parameters) -> list[str]:
+    """SQLite の EXPLAIN QUERY PLAN を、親子関係を字下げで表した行のリストで返す"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def trace_engine(engine, name: str) -> None:
+    """エンジン（同期・非同期）で実行する SQL 文をトレースの子スパンにし、遅い文をログに出す"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop(_QUERY_START, None)
+        query_span = conn.info.pop(_QUERY_SPAN, None)
+        if start is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        plan = None
+        if 0 < settings.SLOW_QUERY_MS <= elapsed_ms:
+            plan = _log_slow_query(conn, name, statement, parameters, executemany, elapsed_ms, query_span)
+        if query_span is not None:
+            attributes = query_span.attributes
+            attributes.update(
+                engine=name, operation=statement_operation(statement), statement=statement[:MAX_STATEMENT_LENGTH]
+            )
+            if executemany:
+                attributes["executemany"] = len(parameters)
+            if cursor.rowcount >= 0:
+                attributes["rows"] = cursor.rowcount
+            if plan is not None:
+                attributes["slow"] = True
+                attributes["plan"] = plan
+            query_span.end()
+
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+
+def _log_slow_query(conn, name, statement, parameters, executemany, elapsed_ms, query_span) -> Optional[list[str]]:
+    head = statement.lstrip()[:8].split(None, 1)
+    plan = None
+    if head and head[0].upper() in EXPLAINABLE:
+        try:
+            plan = explain_query_plan(conn.connection, statement, parameters[0] if executemany else parameters)
+        except Exception as e:  # 計画が取れなくても元の文の結果には影響させない
+            logger.debug("EXPLAIN QUERY PLAN failed: %s", e)
+    trace_id = query_span.trace.trace_id if query_span is not None else current_trace_id()
+    logger.warning(
+        "Slow query on %s engine: %.1f ms (trace %s)\n%s\nQUERY PLAN\n%s",
+        name, elapsed_ms, trace_id or "-", statement[:MAX_STATEMENT_LENGTH],
+        "\n".join(plan) if plan is not None else "(unavailable)",
+    )
+    return plan
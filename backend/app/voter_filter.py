@@ -0,0 +1,172 @@
+"""
+投票済みフィンガープリントのブルームフィルター（投票送信・投票済みステータス確認用）
+
+投票フォームごとに、投票済みのフィンガープリントをブルームフィルターに入れておく。
+フィルターに含まれない（＝確実に未投票の）フィンガープリントは DB を確認せずに
+「未投票」と判定できるため、大半を占める新しい投票者の確認が DB アクセスなしで済む。
+含まれる可能性がある場合（偽陽性を含む）は DB で確認する。
+
+- 重複投票の防止そのものは votes の一意インデックス（INSERT ... ON CONFLICT）が保証する。
+  フィルターは事前確認を省くためだけに使い、判定を誤っても二重投票にはならない
+- フィルターは投票フォームごとに初回の確認時に、バックグラウンドのタスクが読み取り用のセッション
+  （ReadSessionLocal）で DB の全フィンガープリントから作る。作り終えるまでの確認は DB で行う
+  （投票送信の書き込みのトランザクション中に全件を読み、他の書き込みを待たせないため）。
+  以降は投票の保存（コミット）ごとに追加する。プロセスごとに持つ（app/result_cache.py と同じ）
+- 投票数が作成時の容量を超えたら破棄し、次の確認時により大きな容量で作り直す
+- 保持する投票フォーム数は VOTER_FILTER_MAX_POLLS まで（最後に使われてから最も時間が経ったものから破棄）
+"""
+import asyncio
+import hashlib
+import logging
+import math
+from collections import OrderedDict
+
+from sqlalchemy import func, select
+
+from app import models
+from app.config import settings
+from app.database import ReadSessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        # ビット数 m = -n ln p / (ln 2)^2、ハッシュ関数の数 k = m / n ln 2
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # 2つのハッシュ値の線形結合で k 個の位置を作る（Kirsch–Mitzenmacher）
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class VoterFilters:
+    """
+    投票フォームIDごとの BloomFilter。イベントループ上（API のリクエスト処理）からのみ使う。
+    作成中に保存された投票は覚えておき、作り終えたフィルターに加えるため取りこぼさない。
+    """
+
+    def __init__(self, max_polls: int, error_rate: float = 0.01, min_capacity: int = 1024, session_factory=None):
+        self.max_polls = max_polls
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self.session_factory = session_factory  # フィルターを作るときの読み取り用のセッション
+        self._filters: OrderedDict[int, BloomFilter] = OrderedDict()
+        # 作成中の投票フォームID → 作成中に保存された投票のフィンガープリント
+        self._loading: dict[int, list[str]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.skipped = self.lookups = self.false_positives = self.rebuilds = 0
+
+    def might_contain(self, poll_id: int, fingerprint: str) -> bool:
+        """
+        False なら確実に未投票（DB の確認は不要）。True なら投票済みの可能性があり DB で確認する。
+        フィルターがなければバックグラウンドで作り始め、作り終えるまでは True を返して DB で確認させる。
+        """
+        bloom = self._filters.get(poll_id)
+        if bloom is None:
+            self._start_load(poll_id)
+        if bloom is None or fingerprint in bloom:
+            self.lookups += 1
+            return True
+        self._filters.move_to_end(poll_id)
+        self.skipped += 1
+        return False
+
+    def record_false_positive(self) -> None:
+        self.false_positives += 1
+
+    def add(self, poll_id: int, fingerprint: str) -> None:
+        """保存した投票を追加する（フィルターがない投票フォームでは次の作成時に DB から読む）"""
+        if poll_id in self._loading:
+            self._loading[poll_id].append(fingerprint)
+            return
+        bloom = self._filters.get(poll_id)
+        if bloom is None:
+            return
+        bloom.add(fingerprint)
+        if bloom.count > bloom.capacity:
+            # 容量を超えると偽陽性率が上がるため破棄し、次の確認時に作り直す
+            del self._filters[poll_id]
+
+    def discard(self, poll_id: int) -> None:
+        self._filters.pop(poll_id, None)
+        self._loading.pop(poll_id, None)  # 作成中のものは作り終えても保持しない
+
+    def clear(self) -> None:
+        self._filters.clear()
+        self._loading.clear()
+        self.skipped = self.lookups = self.false_positives = self.rebuilds = 0
+
+    def stats(self) -> dict:
+        return {
+            "polls": len(self._filters),
+            "skipped_lookups": self.skipped,
+            "lookups": self.lookups,
+            "false_positives": self.false_positives,
+            "rebuilds": self.rebuilds,
+        }
+
+    async def join(self) -> None:
+        """作成中のフィルターを作り終えるまで待つ"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _start_load(self, poll_id: int) -> None:
+        if poll_id in self._loading or self.max_polls <= 0:
+            return
+        self._loading[poll_id] = []
+        task = asyncio.create_task(self._load(poll_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, poll_id: int) -> None:
+        bloom = None
+        try:
+            async with self.session_factory() as db:
+                count = await db.scalar(
+                    select(func.count()).select_from(models.Vote).where(models.Vote.poll_id == poll_id)
+                )
+                building = BloomFilter(max(self.min_capacity, count * 2), self.error_rate)
+                result = await db.stream_scalars(
+                    select(models.Vote.voter_fingerprint).where(models.Vote.poll_id == poll_id)
+                )
+                async for fingerprint in result:
+                    building.add(fingerprint)
+            bloom = building
+        except Exception:
+            logger.exception("Failed to build the voter filter for poll %d", poll_id)
+        finally:
+            pending = self._loading.pop(poll_id, None)
+        if bloom is None or pending is None:  # 失敗した・作成中に discard された
+            return
+        # 読み出しのスナップショットより後にコミットされた投票を加える（重複して加えても判定は変わらない）
+        for fingerprint in pending:
+            bloom.add(fingerprint)
+        self._filters[poll_id] = bloom
+        self.rebuilds += 1
+        while len(self._filters) > self.max_polls:
+            self._filters.popitem(last=False)
+
+
+voter_filters = VoterFilters(
+    max_polls=settings.VOTER_FILTER_MAX_POLLS,
+    error_rate=settings.VOTER_FILTER_ERROR_RATE,
+    min_capacity=settings.VOTER_FILTER_MIN_CAPACITY,
+    session_factory=ReadSessionLocal,
+)
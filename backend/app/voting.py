@@ -2,9 +2,10 @@
 9種類の投票方式の集計アルゴリズム
 
 各関数のシグネチャ:
-  calculate_*(votes: list[dict], options: list[dict]) -> dict
+  calculate_*(votes: list[dict], options: list[dict], method_settings: dict | None) -> dict
   votes: [{"vote_data": {...}}, ...]
   options: [{"id": int, "text": str, "order_index": int}, ...]
+  method_settings: 投票フォームの方式固有の設定（例: コンドルセの補完ルール）
 
 返り値:
   {
@@ -14,8 +15,14 @@
   }
 """
 
-from collections import defaultdict
-from typing import Any
+from bisect import bisect_right
+from collections import Counter
+from functools import cmp_to_key
+from typing import Any, Callable, NamedTuple
+
+import numpy as np
+
+from app.config import CONDORCET_COMPLETIONS, settings
 
 
 def _make_result(options_map: dict, scores: dict, details: dict = None) -> dict:
@@ -34,79 +41,266 @@ def _make_result(options_map: dict, scores: dict, details: dict = None) -> dict:
     return {"ranked": ranked, "winner_id": winner_id, "details": details or {}}
 
 
+# ---------------------------------------------------------------------------
+# 集計状態（タリー）
+#
+# 各方式は init / accumulate / merge / finalize の段階で集計する。
+#   init()                      -> state   空の集計状態
+#   accumulate(state, vote_data)            1票を state に加算（state を直接更新）
+#   merge(state, other)                     別の投票の集計状態 other を state に合算
+#   finalize(state, options, method_settings)
+#                               -> dict     state から結果フォーマットを生成
+#
+# state は JSON にそのまま保存できる dict（キーは選択肢IDの文字列）で、
+# 選択肢の一覧に依存しない。poll_tallies テーブルに永続化され、
+# 投票ごとに加算、結果表示時に finalize される（app/tally.py）。
+# 投票を分割して別々に集計した state を merge すれば、全票を1度に集計した
+# state と一致する（再集計のプロセス並列集計: app/voting_parallel.py）。
+# ---------------------------------------------------------------------------
+class Tally(NamedTuple):
+    init: Callable[[], dict]
+    accumulate: Callable[[dict, dict], None]
+    merge: Callable[[dict, dict], None]
+    finalize: Callable[[dict, list, dict | None], dict]
+
+
+def _key(oid: Any) -> str:
+    """選択肢IDを state のキー（正規化した文字列）に変換"""
+    return str(int(oid))
+
+
+def _add(counter: dict, key: str, value=1) -> None:
+    counter[key] = counter.get(key, 0) + value
+
+
+def _merge_counts(state: dict, other: dict) -> None:
+    """
+    票数・合計のみからなる state を合算する（state を直接更新）。
+    値は数値、同じ形の dict（再帰的に合算）、または同じ長さの数値リスト（要素ごとに合算）。
+    """
+    for key, value in other.items():
+        if isinstance(value, dict):
+            _merge_counts(state.setdefault(key, {}), value)
+        elif isinstance(value, list):
+            current = state.get(key)
+            state[key] = [a + b for a, b in zip(current, value)] if current else list(value)
+        else:
+            state[key] = state.get(key, 0) + value
+
+
+def _run_tally(tally: Tally, votes, options: list, method_settings: dict | None = None) -> dict:
+    state = tally.init()
+    for v in votes:
+        tally.accumulate(state, v["vote_data"])
+    return tally.finalize(state, options, method_settings)
+
+
+# ---------------------------------------------------------------------------
+# 順位付き投票のプロファイル（ボルダ・IRV・コンドルセ共通）
+#
+# 同一内容の投票を1つにまとめた {正規化した投票: 票数} の重み付き表現。
+# 順位付き投票は同じ並びが多いため、各方式はこのプロファイルを入力として
+# 異なる投票パターンごとに1度だけ計算する（計算量は重複率に比例して減る）。
+# ---------------------------------------------------------------------------
+def _canonical_order(ballot: tuple) -> tuple:
+    """順位リスト [opt_id, ...] → (int, ...)"""
+    return tuple(int(x) for x in ballot)
+
+
+def _canonical_rankings(ballot: tuple) -> tuple:
+    """{"opt_id": rank} の項目 → ((opt_id, rank), ...) を選択肢ID順に並べたもの"""
+    return tuple(sorted((int(oid), int(rank)) for oid, rank in ballot))
+
+
+PROFILE_FIELDS = {
+    "borda": ("rankings", _canonical_rankings),
+    "irv": ("order", _canonical_order),
+    "condorcet": ("order", _canonical_order),
+}
+
+
+def build_profile(voting_method: str, votes) -> Counter:
+    """
+    投票の列から {正規化した投票: 票数} を作る。
+    まず投票データのままの値でまとめ、正規化（int 変換・並べ替え）は異なる値ごとに1度だけ行う。
+    """
+    field, canonical = PROFILE_FIELDS[voting_method]
+    raw = Counter()
+    for v in votes:
+        value = v["vote_data"].get(field) or ()
+        raw[tuple(value.items()) if isinstance(value, dict) else tuple(value)] += 1
+    profile = Counter()
+    for ballot, count in raw.items():
+        profile[canonical(ballot)] += count
+    return profile
+
+
+def profile_stats(total: int, distinct: int) -> dict:
+    """details に含める重複率（総投票数 / 異なる投票パターン数）"""
+    return {
+        "ballots": total,
+        "distinct_ballots": distinct,
+        "duplication_ratio": round(total / distinct, 2) if distinct else 0.0,
+    }
+
+
 # ---------------------------------------------------------------------------
 # 1. 単記投票（Plurality）
 # ---------------------------------------------------------------------------
-def calculate_plurality(votes: list, options: list) -> dict:
+def _plurality_init() -> dict:
+    return {"total": 0, "counts": {}}
+
+
+def _plurality_accumulate(state: dict, vote_data: dict) -> None:
+    state["total"] += 1
+    oid = vote_data.get("option_id")
+    if oid is not None:
+        _add(state["counts"], _key(oid))
+
+
+def _plurality_finalize(state: dict, options: list, method_settings: dict | None = None) -> dict:
     options_map = {o["id"]: o["text"] for o in options}
-    counts = defaultdict(int)
-    for v in votes:
-        oid = v["vote_data"].get("option_id")
-        if oid is not None:
-            counts[int(oid)] += 1
-    scores = {oid: counts[oid] for oid in options_map}
-    return _make_result(options_map, scores, {"total_votes": len(votes)})
+    scores = {oid: state["counts"].get(_key(oid), 0) for oid in options_map}
+    return _make_result(options_map, scores, {"total_votes": state["total"]})
+
+
+def calculate_plurality(votes: list, options: list, method_settings: dict | None = None) -> dict:
+    return _run_tally(TALLIES["plurality"], votes, options, method_settings)
 
 
 # ---------------------------------------------------------------------------
 # 2. 承認投票（Approval Voting）
 # ---------------------------------------------------------------------------
-def calculate_approval(votes: list, options: list) -> dict:
+def _approval_init() -> dict:
+    return {"total": 0, "counts": {}}
+
+
+def _approval_accumulate(state: dict, vote_data: dict) -> None:
+    state["total"] += 1
+    for oid in vote_data.get("option_ids", []):
+        _add(state["counts"], _key(oid))
+
+
+def _approval_finalize(state: dict, options: list, method_settings: dict | None = None) -> dict:
     options_map = {o["id"]: o["text"] for o in options}
-    counts = defaultdict(int)
-    for v in votes:
-        for oid in v["vote_data"].get("option_ids", []):
-            counts[int(oid)] += 1
-    scores = {oid: counts[oid] for oid in options_map}
-    return _make_result(options_map, scores, {"total_voters": len(votes)})
+    scores = {oid: state["counts"].get(_key(oid), 0) for oid in options_map}
+    return _make_result(options_map, scores, {"total_voters": state["total"]})
+
+
+def calculate_approval(votes: list, options: list, method_settings: dict | None = None) -> dict:
+    return _run_tally(TALLIES["approval"], votes, options, method_settings)
 
 
 # ---------------------------------------------------------------------------
 # 3. ボルダ・カウント（Borda Count）
 # ---------------------------------------------------------------------------
-def calculate_borda(votes: list, options: list) -> dict:
+def _borda_init() -> dict:
+    # 選択肢ごとの「順位が付いた回数」と「順位の合計」を保持し、
+    # 得点 = n × 回数 − 順位合計 を finalize 時に計算する。
+    # ballots は投票パターンごとの票数（{"1:1,2:2": 票数}）で重複率の算出に使う
+    # （保存時は poll_tally_patterns の行に持つ: app/tally.py の PATTERN_KEYS）
+    return {"total": 0, "counts": {}, "rank_sums": {}, "ballots": {}}
+
+
+def _borda_accumulate(state: dict, vote_data: dict) -> None:
+    state["total"] += 1
+    rankings = vote_data.get("rankings", {})  # {"opt_id": rank(1始まり)}
+    for oid_str, rank in rankings.items():
+        key = _key(oid_str)
+        _add(state["counts"], key)
+        _add(state["rank_sums"], key, int(rank))
+    ballot = _canonical_rankings(tuple(rankings.items()))
+    _add(state["ballots"], ",".join(f"{oid}:{rank}" for oid, rank in ballot))
+
+
+def _borda_result(state: dict, options: list, distinct: int) -> dict:
     """1位 = n-1点, 2位 = n-2点, ..., 最下位 = 0点"""
     options_map = {o["id"]: o["text"] for o in options}
     n = len(options)
-    scores = defaultdict(int)
-    for v in votes:
-        rankings = v["vote_data"].get("rankings", {})  # {"opt_id": rank(1始まり)}
-        for oid_str, rank in rankings.items():
-            oid = int(oid_str)
-            if oid in options_map:
-                scores[oid] += n - int(rank)
-    final_scores = {oid: scores[oid] for oid in options_map}
-    return _make_result(options_map, final_scores, {"max_score": (n - 1) * len(votes)})
+    scores = {
+        oid: n * state["counts"].get(_key(oid), 0) - state["rank_sums"].get(_key(oid), 0)
+        for oid in options_map
+    }
+    return _make_result(
+        options_map,
+        scores,
+        {"max_score": (n - 1) * state["total"], "profile": profile_stats(state["total"], distinct)},
+    )
+
+
+def _borda_finalize(state: dict, options: list, method_settings: dict | None = None) -> dict:
+    return _borda_result(state, options, len(state["ballots"]))
+
+
+def borda_from_profile(profile: dict, options: list, method_settings: dict | None = None) -> dict:
+    state = _borda_init()
+    counts, rank_sums = state["counts"], state["rank_sums"]
+    for ballot, weight in profile.items():
+        state["total"] += weight
+        for oid, rank in ballot:
+            _add(counts, str(oid), weight)
+            _add(rank_sums, str(oid), weight * rank)
+    return _borda_result(state, options, len(profile))
+
+
+def calculate_borda(votes: list, options: list, method_settings: dict | None = None) -> dict:
+    return borda_from_profile(build_profile("borda", votes), options, method_settings)
 
 
 # ---------------------------------------------------------------------------
 # 4. 代替投票（IRV: Instant Runoff Voting）
 # ---------------------------------------------------------------------------
-def calculate_irv(votes: list, options: list) -> dict:
+def _irv_init() -> dict:
+    # 同一の優先順位をまとめて {"1,3,2": 票数} の形で保持する
+    return {"total": 0, "ballots": {}}
+
+
+def _irv_accumulate(state: dict, vote_data: dict) -> None:
+    state["total"] += 1
+    order = [_key(x) for x in vote_data.get("order", [])]
+    _add(state["ballots"], ",".join(order))
+
+
+def irv_from_profile(profile: dict, options: list, method_settings: dict | None = None) -> dict:
+    """
+    同一の優先順位をまとめた投票 {順位タプル: 票数} ごとに「現在の第1候補」への位置を保持し、
+    各ラウンドでは除外された候補に積まれていた投票だけを次の候補へ移す。
+    各パターンの順位リストは全ラウンドを通して1度しか走査しない。
+    """
     options_map = {o["id"]: o["text"] for o in options}
     remaining = set(options_map.keys())
-    all_orders = []
-    for v in votes:
-        order = [int(x) for x in v["vote_data"].get("order", [])]
-        all_orders.append(order)
+
+    orders = []
+    weights = []
+    positions = []
+    piles = {oid: [] for oid in remaining}  # 候補 → その候補を現在の第1候補とする投票パターン
+    counts = {oid: 0 for oid in remaining}
+
+    def move_to_next(b: int, start: int) -> None:
+        order = orders[b]
+        for pos in range(start, len(order)):
+            oid = order[pos]
+            if oid in remaining:
+                positions[b] = pos
+                piles[oid].append(b)
+                counts[oid] += weights[b]
+                return
+        positions[b] = len(order)  # 有効な候補が残っていない（無効票）
+
+    for order, weight in profile.items():
+        orders.append(order)
+        weights.append(weight)
+        positions.append(0)
+        move_to_next(len(orders) - 1, 0)
 
     rounds = []
     eliminated = []
+    stats = profile_stats(sum(weights), len(orders))
 
     while len(remaining) > 1:
-        counts = defaultdict(int)
-        for order in all_orders:
-            for oid in order:
-                if oid in remaining:
-                    counts[oid] += 1
-                    break
-
-        total = sum(counts.values())
-        round_info = {
-            "counts": {oid: counts[oid] for oid in remaining},
-            "total": total,
-        }
-        rounds.append(round_info)
+        round_counts = {oid: counts[oid] for oid in remaining}
+        total = sum(round_counts.values())
+        rounds.append({"counts": round_counts, "total": total})
 
         # 過半数チェック
         for oid in remaining:
@@ -116,77 +310,206 @@ def calculate_irv(votes: list, options: list) -> dict:
                         {"id": oid, "text": options_map[oid], "score": counts[oid], "rank": 1}
                     ],
                     "winner_id": oid,
-                    "details": {"rounds": rounds, "eliminated": eliminated},
+                    "details": {"rounds": rounds, "eliminated": eliminated, "profile": stats},
                 }
 
-        # 最低票候補を除外
-        if not counts:
-            break
+        # 最低票候補を除外し、その候補の票だけを次の候補へ移す
         min_count = min(counts[oid] for oid in remaining)
         to_eliminate = [oid for oid in remaining if counts[oid] == min_count]
         for oid in to_eliminate:
             remaining.discard(oid)
             eliminated.append({"id": oid, "text": options_map[oid]})
+        for oid in to_eliminate:
+            del counts[oid]
+            for b in piles.pop(oid):
+                move_to_next(b, positions[b] + 1)
 
     winner_id = next(iter(remaining)) if remaining else None
     ranked = []
     if winner_id:
         ranked = [{"id": winner_id, "text": options_map[winner_id], "score": 0, "rank": 1}]
-    return {"ranked": ranked, "winner_id": winner_id, "details": {"rounds": rounds, "eliminated": eliminated}}
+    return {
+        "ranked": ranked,
+        "winner_id": winner_id,
+        "details": {"rounds": rounds, "eliminated": eliminated, "profile": stats},
+    }
+
+
+def _irv_finalize(state: dict, options: list, method_settings: dict | None = None) -> dict:
+    # 保持している集計状態がそのままプロファイル
+    profile = {
+        tuple(int(x) for x in key.split(",")) if key else (): weight
+        for key, weight in state["ballots"].items()
+    }
+    return irv_from_profile(profile, options, method_settings)
+
+
+def calculate_irv(votes: list, options: list, method_settings: dict | None = None) -> dict:
+    return irv_from_profile(build_profile("irv", votes), options, method_settings)
 
 
 # ---------------------------------------------------------------------------
 # 5. コンドルセ方式（Condorcet Method）
 # ---------------------------------------------------------------------------
-def calculate_condorcet(votes: list, options: list) -> dict:
+def _condorcet_init() -> dict:
+    # pairwise[a][b] = Aを好む投票者数（0 のペアは保持しない）
+    # ballots は投票パターンごとの票数（{"1,3,2": 票数}）で重複率の算出に使う（ボルダと同じく行に保存）
+    return {"total": 0, "pairwise": {}, "ballots": {}}
+
+
+def _condorcet_accumulate(state: dict, vote_data: dict) -> None:
+    state["total"] += 1
+    pairwise = state["pairwise"]
+    order = [_key(x) for x in vote_data.get("order", [])]
+    for i, a in enumerate(order):
+        row = pairwise.setdefault(a, {})
+        for b in order[i + 1:]:
+            _add(row, b)
+    _add(state["ballots"], ",".join(order))
+
+
+def _schulze(d: np.ndarray) -> np.ndarray:
+    """
+    シュルツ方式: 最強経路の強さ p[a][b] を Floyd–Warshall 型の更新で求め、
+    「a が b に勝つ」(p[a][b] > p[b][a]) の関係行列を返す。
+    """
+    p = np.where(d > d.T, d, 0)
+    for k in range(len(d)):
+        p = np.maximum(p, np.minimum(p[:, k:k + 1], p[k:k + 1, :]))
+    np.fill_diagonal(p, 0)
+    return p > p.T
+
+
+def _ranked_pairs(d: np.ndarray) -> tuple[np.ndarray, list]:
+    """
+    ランクドペア方式: 勝ちペアを強い順（勝ち票数の降順 → 負け票数の昇順）に並べ、
+    循環を作らない限り確定していく。確定済みの到達可能性（推移閉包）を保持するので、
+    循環の判定は O(1)、確定時の更新は O(選択肢数²) のベクトル演算。
+    返り値: (reach[a][b] = a から b へ確定済みの経路がある, 確定したペアの一覧)
+    """
+    m = len(d)
+    winners, losers = np.nonzero(d > d.T)
+    order = np.lexsort((losers, winners, d[losers, winners], -d[winners, losers]))
+    reach = np.zeros((m, m), dtype=bool)
+    locked = []
+    for idx in order:
+        a, b = int(winners[idx]), int(losers[idx])
+        if reach[b, a]:
+            continue  # 確定すると循環ができる
+        locked.append((a, b))
+        if not reach[a, b]:
+            sources = reach[:, a].copy()
+            sources[a] = True
+            targets = reach[b, :].copy()
+            targets[b] = True
+            reach |= np.outer(sources, targets)
+    return reach, locked
+
+
+def _condorcet_from_matrix(d: np.ndarray, options: list, total: int, method_settings: dict) -> dict:
+    """一対比較行列 d[a][b] = a を b より好む投票者数（行・列は options の順）から結果を確定"""
     options_map = {o["id"]: o["text"] for o in options}
     opt_list = list(options_map.keys())
-    # pairwise[a][b] = Aを好む投票者数
-    pairwise = {a: {b: 0 for b in opt_list} for a in opt_list}
-
-    for v in votes:
-        order = [int(x) for x in v["vote_data"].get("order", [])]
-        for i, a in enumerate(order):
-            for b in order[i + 1:]:
-                if a in pairwise and b in pairwise[a]:
-                    pairwise[a][b] += 1
+    completion = (method_settings or {}).get("completion") or "none"
+    if completion not in CONDORCET_COMPLETIONS:
+        raise ValueError(f"Unknown condorcet completion: {completion}")
 
     # コンドルセ勝者を探す
-    win_counts = {}
-    for a in opt_list:
-        wins = sum(1 for b in opt_list if a != b and pairwise[a][b] > pairwise[b][a])
-        win_counts[a] = wins
-
+    beats = d > d.T
+    win_counts = beats.sum(axis=1)
     condorcet_winner = None
-    for a in opt_list:
-        if win_counts[a] == len(opt_list) - 1:
+    for j, a in enumerate(opt_list):
+        if win_counts[j] == len(opt_list) - 1:
             condorcet_winner = a
             break
 
-    scores = {oid: win_counts[oid] for oid in options_map}
-    result = _make_result(options_map, scores)
-    result["winner_id"] = condorcet_winner
-    result["details"] = {
-        "pairwise": {str(a): {str(b): pairwise[a][b] for b in opt_list} for a in opt_list},
+    details = {
+        "pairwise": {
+            str(a): {str(b): int(d[i, j]) for j, b in enumerate(opt_list)}
+            for i, a in enumerate(opt_list)
+        },
         "condorcet_winner": condorcet_winner,
-        "has_cycle": condorcet_winner is None and len(votes) > 0,
+        "has_cycle": condorcet_winner is None and total > 0,
     }
+
+    if completion == "none" or total == 0:
+        scores = {a: int(win_counts[j]) for j, a in enumerate(opt_list)}
+        result = _make_result(options_map, scores)
+        result["winner_id"] = condorcet_winner
+        result["details"] = details
+        return result
+
+    # 循環があっても勝者を決める補完ルール（コンドルセ勝者がいれば必ず一致する）
+    if completion == "schulze":
+        relation = _schulze(d)
+    else:
+        relation, locked = _ranked_pairs(d)
+        details["locked_pairs"] = [[opt_list[a], opt_list[b]] for a, b in locked]
+    scores = {a: int(relation[j].sum()) for j, a in enumerate(opt_list)}
+    result = _make_result(options_map, scores)
+    unbeaten = [a for j, a in enumerate(opt_list) if not relation[:, j].any()]
+    details["completion"] = completion
+    details["completion_winner"] = unbeaten[0] if len(unbeaten) == 1 else None
+    result["winner_id"] = condorcet_winner or details["completion_winner"]
+    result["details"] = details
+    return result
+
+
+def _condorcet_finalize(state: dict, options: list, method_settings: dict | None = None) -> dict:
+    stored = state["pairwise"]
+    keys = [_key(o["id"]) for o in options]
+    d = np.array(
+        [[stored.get(a, {}).get(b, 0) for b in keys] for a in keys],
+        dtype=np.int64,
+    ).reshape(len(keys), len(keys))
+    result = _condorcet_from_matrix(d, options, state["total"], method_settings)
+    result["details"]["profile"] = profile_stats(state["total"], len(state["ballots"]))
+    return result
+
+
+def condorcet_from_profile(profile: dict, options: list, method_settings: dict | None = None) -> dict:
+    """
+    投票パターンごとに順位の位置から一対比較行列をベクトル演算で（票数倍して）更新する。
+    順位を付けた選択肢どうしのみ比較し、順位のない選択肢は比較に含めない。
+    """
+    m = len(options)
+    column = {o["id"]: j for j, o in enumerate(options)}
+    ahead = np.triu(np.ones((m, m), dtype=np.int64), 1)  # ahead[i][j] = 位置 i が位置 j より上位
+    d = np.zeros((m, m), dtype=np.int64)
+    total = 0
+    for order, weight in profile.items():
+        total += weight
+        ranked = [column[oid] for oid in order if oid in column]
+        if len(ranked) > 1:
+            d[np.ix_(ranked, ranked)] += weight * ahead[: len(ranked), : len(ranked)]
+    result = _condorcet_from_matrix(d, options, total, method_settings)
+    result["details"]["profile"] = profile_stats(total, len(profile))
     return result
 
 
+def calculate_condorcet(votes: list, options: list, method_settings: dict | None = None) -> dict:
+    return condorcet_from_profile(build_profile("condorcet", votes), options, method_settings)
+
+
 # ---------------------------------------------------------------------------
 # 6. スコア投票（Score Voting）
 # ---------------------------------------------------------------------------
-def calculate_score(votes: list, options: list) -> dict:
+def _score_init() -> dict:
+    return {"total": 0, "totals": {}, "counts": {}}
+
+
+def _score_accumulate(state: dict, vote_data: dict) -> None:
+    state["total"] += 1
+    for oid_str, score in vote_data.get("scores", {}).items():
+        key = _key(oid_str)
+        _add(state["totals"], key, float(score))
+        _add(state["counts"], key)
+
+
+def _score_finalize(state: dict, options: list, method_settings: dict | None = None) -> dict:
     options_map = {o["id"]: o["text"] for o in options}
-    totals = defaultdict(float)
-    counts = defaultdict(int)
-    for v in votes:
-        for oid_str, score in v["vote_data"].get("scores", {}).items():
-            oid = int(oid_str)
-            if oid in options_map:
-                totals[oid] += float(score)
-                counts[oid] += 1
+    totals = {oid: state["totals"][_key(oid)] for oid in options_map if _key(oid) in state["totals"]}
+    counts = {oid: state["counts"].get(_key(oid), 0) for oid in options_map}
 
     averages = {}
     for oid in options_map:
@@ -195,12 +518,16 @@ def calculate_score(votes: list, options: list) -> dict:
     result = _make_result(options_map, averages)
     result["details"] = {
         "averages": averages,
-        "totals": dict(totals),
-        "vote_counts": dict(counts),
+        "totals": totals,
+        "vote_counts": counts,
     }
     return result
 
 
+def calculate_score(votes: list, options: list, method_settings: dict | None = None) -> dict:
+    return _run_tally(TALLIES["score"], votes, options, method_settings)
+
+
 # ---------------------------------------------------------------------------
 # 7. マジョリティ・ジャッジメント（Majority Judgement）
 # ---------------------------------------------------------------------------
@@ -208,116 +535,237 @@ MJ_GRADE_LABELS = ["拒否", "不良", "許容", "良い", "とても良い", "
 MJ_GRADE_VALUES = {label: i for i, label in enumerate(MJ_GRADE_LABELS)}
 
 
-def _mj_median_with_tiebreak(grade_list: list) -> float:
+def _mj_cumulative(histogram: list) -> list:
+    """評価段階ごとの票数から累積票数を作る（cumulative[g] = 評価 g 以下の票数）"""
+    cumulative = []
+    total = 0
+    for count in histogram:
+        total += count
+        cumulative.append(total)
+    return cumulative
+
+
+def _mj_median(cumulative: list) -> int:
+    """中央値（票数が偶数のときは下側の中央値）。未評価なら -1"""
+    n = cumulative[-1]
+    if n == 0:
+        return -1
+    return bisect_right(cumulative, (n - 1) // 2)
+
+
+def _mj_value_at(cumulative: list, t: int) -> int | None:
+    """
+    多数派評価列（中央値の評価を1票ずつ取り除きながら並べた評価の列）の t 番目。
+    昇順に並べた評価を g[0..n-1]、中央値の位置を m とすると列は
+      票数が奇数: g[m], g[m-1], g[m+1], g[m-2], g[m+2], ...
+      票数が偶数: g[m], g[m+1], g[m-1], g[m+2], g[m-2], ...
+    となるので、取り除く操作をせずに累積票数から直接求められる。
+    """
+    n = cumulative[-1]
+    if t >= n:
+        return None
+    m = (n - 1) // 2
+    j = (t + 1) // 2
+    if t == 0:
+        index = m
+    elif (t % 2 == 1) == (n % 2 == 1):
+        index = m - j
+    else:
+        index = m + j
+    return bisect_right(cumulative, index)
+
+
+def _mj_breakpoints(cumulative: list) -> set:
+    """多数派評価列の (下側, 上側) の評価が変わる取り除き回数 j の集合"""
+    n = cumulative[-1]
+    m = (n - 1) // 2
+    points = {1}
+    for c in cumulative:
+        points.add(m - c + 1)  # 下側 g[m-j] の評価が変わる位置
+        points.add(c - m)      # 上側 g[m+j] の評価が変わる位置
+    return {j for j in points if j >= 1}
+
+
+def _mj_compare(a: list, b: list) -> int:
     """
-    MJの中央値評価を計算（タイブレーク付き）
-    タイが続く場合はスコアに±0.1を加算してランクを安定化
+    累積票数 a, b の選択肢を多数派評価列の辞書式順序で比較する（a が上位なら正）。
+    列は評価段階ごとの区間で一定なので、区間の先頭だけを比べればよく、
+    計算量は票数に依存せず O(評価段階数)。
     """
-    if not grade_list:
+    na, nb = a[-1], b[-1]
+    if na == 0 or nb == 0:
+        return (na > 0) - (nb > 0)
+    length = min(na, nb)
+    positions = {0}
+    for j in _mj_breakpoints(a) | _mj_breakpoints(b):
+        positions.update((2 * j - 1, 2 * j))
+    for t in sorted(positions):
+        if t >= length:
+            break
+        diff = _mj_value_at(a, t) - _mj_value_at(b, t)
+        if diff:
+            return diff
+    return 0
+
+
+def _mj_gauge(cumulative: list) -> float:
+    """
+    表示用のスコア: 中央値 + (中央値より上の割合 − 下の割合) / 2
+    順位は _mj_compare による多数派評価列の比較で決まる。
+    """
+    n = cumulative[-1]
+    median = _mj_median(cumulative)
+    if median < 0:
         return -1.0
-    sorted_grades = sorted(grade_list)
-    n = len(sorted_grades)
-    # 中央値インデックス
-    mid = n // 2
-    base = float(sorted_grades[mid])
-    # タイブレーク: 中央値より上の割合 vs 下の割合
-    upper = sum(1 for g in sorted_grades if g > sorted_grades[mid])
-    lower = sum(1 for g in sorted_grades if g < sorted_grades[mid])
-    if upper > lower:
-        base += 0.1
-    elif lower > upper:
-        base -= 0.1
-    return base
-
-
-def calculate_majority_judgement(votes: list, options: list) -> dict:
+    upper = n - cumulative[median]
+    lower = cumulative[median - 1] if median > 0 else 0
+    return round(median + (upper - lower) / (2 * n), 2)
+
+
+def _mj_init() -> dict:
+    # 選択肢ごとに評価段階別の票数 [拒否, 不良, 許容, 良い, とても良い, 優秀] を保持
+    return {"total": 0, "histograms": {}}
+
+
+def _mj_accumulate(state: dict, vote_data: dict) -> None:
+    state["total"] += 1
+    histograms = state["histograms"]
+    for oid_str, grade in vote_data.get("grades", {}).items():
+        grade_val = MJ_GRADE_VALUES.get(grade, -1)
+        if grade_val >= 0:
+            key = _key(oid_str)
+            if key not in histograms:
+                histograms[key] = [0] * len(MJ_GRADE_LABELS)
+            histograms[key][grade_val] += 1
+
+
+def _mj_finalize(state: dict, options: list, method_settings: dict | None = None) -> dict:
+    """評価分布（ヒストグラム）のみから、票数に依存しない計算量で順位を確定する"""
     options_map = {o["id"]: o["text"] for o in options}
-    grade_lists: dict[int, list] = {oid: [] for oid in options_map}
+    empty = [0] * len(MJ_GRADE_LABELS)
+    cumulatives = {
+        oid: _mj_cumulative(state["histograms"].get(_key(oid), empty)) for oid in options_map
+    }
 
-    for v in votes:
-        for oid_str, grade in v["vote_data"].get("grades", {}).items():
-            oid = int(oid_str)
-            if oid in grade_lists:
-                grade_val = MJ_GRADE_VALUES.get(grade, -1)
-                if grade_val >= 0:
-                    grade_lists[oid].append(grade_val)
-
-    medians = {}
+    order = sorted(
+        options_map,
+        key=cmp_to_key(lambda a, b: _mj_compare(cumulatives[b], cumulatives[a])),
+    )
+    ranked = [
+        {
+            "id": oid,
+            "text": options_map[oid],
+            "score": _mj_gauge(cumulatives[oid]),
+            "rank": i + 1,
+        }
+        for i, oid in enumerate(order)
+    ]
+
+    medians = {oid: _mj_median(cumulatives[oid]) for oid in options_map}
     grade_distributions = {}
     for oid in options_map:
-        medians[oid] = _mj_median_with_tiebreak(grade_lists[oid])
-        dist = defaultdict(int)
-        for g in grade_lists[oid]:
-            dist[MJ_GRADE_LABELS[g]] += 1
-        grade_distributions[oid] = dict(dist)
+        histogram = state["histograms"].get(_key(oid), empty)
+        grade_distributions[oid] = {
+            MJ_GRADE_LABELS[g]: count for g, count in enumerate(histogram) if count > 0
+        }
 
-    result = _make_result(options_map, medians)
-    result["details"] = {
-        "grade_distributions": {str(k): v for k, v in grade_distributions.items()},
-        "median_labels": {
-            str(oid): MJ_GRADE_LABELS[int(medians[oid])] if medians[oid] >= 0 else "未評価"
-            for oid in options_map
+    return {
+        "ranked": ranked,
+        "winner_id": ranked[0]["id"] if ranked else None,
+        "details": {
+            "grade_distributions": {str(k): v for k, v in grade_distributions.items()},
+            "median_labels": {
+                str(oid): MJ_GRADE_LABELS[medians[oid]] if medians[oid] >= 0 else "未評価"
+                for oid in options_map
+            },
         },
     }
-    return result
+
+
+def calculate_majority_judgement(votes: list, options: list, method_settings: dict | None = None) -> dict:
+    return _run_tally(TALLIES["majority_judgement"], votes, options, method_settings)
 
 
 # ---------------------------------------------------------------------------
 # 8. クアドラティック・ボーティング（Quadratic Voting）
 # ---------------------------------------------------------------------------
-def calculate_quadratic(votes: list, options: list) -> dict:
+def _quadratic_init() -> dict:
+    return {"total": 0, "totals": {}}
+
+
+def _quadratic_accumulate(state: dict, vote_data: dict) -> None:
+    state["total"] += 1
+    for oid_str, num_votes in vote_data.get("votes", {}).items():
+        _add(state["totals"], _key(oid_str), int(num_votes))
+
+
+def _quadratic_finalize(state: dict, options: list, method_settings: dict | None = None) -> dict:
+    options_map = {o["id"]: o["text"] for o in options}
+    scores = {oid: state["totals"].get(_key(oid), 0) for oid in options_map}
+    return _make_result(options_map, scores, {"total_voters": state["total"]})
+
+
+def calculate_quadratic(votes: list, options: list, method_settings: dict | None = None) -> dict:
     """
     各投票者がクレジット予算内で票を配分。コスト = 票数²
     投票データ: {"votes": {"opt_id": num_votes, ...}}  (正の整数)
     """
-    options_map = {o["id"]: o["text"] for o in options}
-    totals = defaultdict(int)
-    for v in votes:
-        for oid_str, num_votes in v["vote_data"].get("votes", {}).items():
-            oid = int(oid_str)
-            if oid in options_map:
-                totals[oid] += int(num_votes)
-
-    scores = {oid: totals[oid] for oid in options_map}
-    return _make_result(options_map, scores, {"total_voters": len(votes)})
+    return _run_tally(TALLIES["quadratic"], votes, options, method_settings)
 
 
 # ---------------------------------------------------------------------------
 # 9. 負の投票（Negative Voting）
 # ---------------------------------------------------------------------------
-def calculate_negative(votes: list, options: list) -> dict:
-    """
-    各投票者が各候補に +1 または -1 を投じられる。
-    投票データ: {"votes": {"opt_id": 1|-1, ...}}
-    """
-    options_map = {o["id"]: o["text"] for o in options}
-    totals = defaultdict(int)
-    positives = defaultdict(int)
-    negatives = defaultdict(int)
+def _negative_init() -> dict:
+    return {"total": 0, "totals": {}, "positives": {}, "negatives": {}}
 
-    for v in votes:
-        for oid_str, val in v["vote_data"].get("votes", {}).items():
-            oid = int(oid_str)
-            val = int(val)
-            if oid in options_map:
-                totals[oid] += val
-                if val > 0:
-                    positives[oid] += 1
-                elif val < 0:
-                    negatives[oid] += 1
-
-    scores = {oid: totals[oid] for oid in options_map}
+
+def _negative_accumulate(state: dict, vote_data: dict) -> None:
+    state["total"] += 1
+    for oid_str, val in vote_data.get("votes", {}).items():
+        key = _key(oid_str)
+        val = int(val)
+        _add(state["totals"], key, val)
+        if val > 0:
+            _add(state["positives"], key)
+        elif val < 0:
+            _add(state["negatives"], key)
+
+
+def _negative_finalize(state: dict, options: list, method_settings: dict | None = None) -> dict:
+    options_map = {o["id"]: o["text"] for o in options}
+    scores = {oid: state["totals"].get(_key(oid), 0) for oid in options_map}
     result = _make_result(options_map, scores)
     result["details"] = {
-        "positives": {str(k): positives[k] for k in options_map},
-        "negatives": {str(k): negatives[k] for k in options_map},
+        "positives": {str(k): state["positives"].get(_key(k), 0) for k in options_map},
+        "negatives": {str(k): state["negatives"].get(_key(k), 0) for k in options_map},
     }
     return result
 
 
+def calculate_negative(votes: list, options: list, method_settings: dict | None = None) -> dict:
+    """
+    各投票者が各候補に +1 または -1 を投じられる。
+    投票データ: {"votes": {"opt_id": 1|-1, ...}}
+    """
+    return _run_tally(TALLIES["negative"], votes, options, method_settings)
+
+
 # ---------------------------------------------------------------------------
 # ディスパッチャ
 # ---------------------------------------------------------------------------
+TALLIES = {
+    "plurality": Tally(_plurality_init, _plurality_accumulate, _merge_counts, _plurality_finalize),
+    "approval": Tally(_approval_init, _approval_accumulate, _merge_counts, _approval_finalize),
+    "borda": Tally(_borda_init, _borda_accumulate, _merge_counts, _borda_finalize),
+    "irv": Tally(_irv_init, _irv_accumulate, _merge_counts, _irv_finalize),
+    "condorcet": Tally(_condorcet_init, _condorcet_accumulate, _merge_counts, _condorcet_finalize),
+    "score": Tally(_score_init, _score_accumulate, _merge_counts, _score_finalize),
+    "majority_judgement": Tally(_mj_init, _mj_accumulate, _merge_counts, _mj_finalize),
+    "quadratic": Tally(_quadratic_init, _quadratic_accumulate, _merge_counts, _quadratic_finalize),
+    "negative": Tally(_negative_init, _negative_accumulate, _merge_counts, _negative_finalize),
+}
+
 CALCULATORS = {
     "plurality": calculate_plurality,
     "approval": calculate_approval,
@@ -331,11 +779,44 @@ CALCULATORS = {
 }
 
 
-def calculate_results(voting_method: str, votes: list, options: list) -> dict:
+def _choose_engine(voting_method: str, votes) -> str:
+    if not hasattr(votes, "__len__"):
+        return "python"
+    if voting_method not in settings.numpy_engine_methods_list or len(votes) < settings.NUMPY_ENGINE_MIN_VOTES:
+        return "python"
+    return "numpy"
+
+
+def calculate_results(
+    voting_method: str,
+    votes: list,
+    options: list,
+    method_settings: dict | None = None,
+    engine: str = "auto",
+) -> dict:
+    """
+    投票の一覧から結果を求める（API の結果は保存済みの集計状態から確定する: app/tally.py）。
+    engine:
+      "python" ... 各方式の calculate_*
+      "numpy"  ... NumPy 投票行列エンジン（承認・ボルダ・スコア・クアドラティック・負の投票のみ）
+      "auto"   ... 方式と票数から自動選択
+    全票のプロセス並列集計は集計状態の単位で行う（app/voting_parallel.py の parallel_state）。
+    """
     calculator = CALCULATORS.get(voting_method)
     if calculator is None:
         raise ValueError(f"Unknown voting method: {voting_method}")
-    return calculator(votes, options)
+
+    if engine == "auto":
+        engine = _choose_engine(voting_method, votes)
+    if engine == "numpy":
+        from app.voting_numpy import NUMPY_CALCULATORS
+
+        calculator = NUMPY_CALCULATORS.get(voting_method)
+        if calculator is None:
+            raise ValueError(f"NumPy engine does not support: {voting_method}")
+    elif engine != "python":
+        raise ValueError(f"Unknown engine: {engine}")
+    return calculator(votes, options, method_settings)
 
 
 # ---------------------------------------------------------------------------
@@ -343,68 +824,98 @@ def calculate_results(voting_method: str, votes: list, options: list) -> dict:
 # ---------------------------------------------------------------------------
 import csv
 import io
+from itertools import islice
 
 
-def votes_to_csv(poll, votes: list, options: list) -> str:
-    """投票データをCSV文字列に変換"""
-    output = io.StringIO()
-    writer = csv.writer(output)
+CSV_ROWS_PER_CHUNK = 500
 
-    opt_texts = {str(o["id"]): o["text"] for o in options}
-    opt_ids = [str(o["id"]) for o in options]
-
-    method = poll.voting_method
 
-    # ヘッダー
+def _csv_header(method: str, opt_ids: list, opt_texts: dict) -> list:
     if method in ("plurality",):
-        header = ["投票番号", "投票日時", "選択肢"]
-    elif method in ("approval", "negative", "quadratic", "score"):
-        header = ["投票番号", "投票日時"] + [opt_texts.get(oid, oid) for oid in opt_ids]
+        return ["投票番号", "投票日時", "選択肢"]
+    if method in ("approval", "negative", "quadratic", "score"):
+        return ["投票番号", "投票日時"] + [opt_texts.get(oid, oid) for oid in opt_ids]
+    if method in ("borda", "irv", "condorcet"):
+        return ["投票番号", "投票日時"] + [opt_texts.get(oid, oid) for oid in opt_ids]
+    if method == "majority_judgement":
+        return ["投票番号", "投票日時"] + [opt_texts.get(oid, oid) for oid in opt_ids]
+    return ["投票番号", "投票日時", "投票データ"]
+
+
+def _csv_row(method: str, i: int, v: dict, opt_ids: list, opt_texts: dict) -> list:
+    ts = v.get("created_at", "")
+    data = v.get("vote_data", {})
+    row = [i, ts]
+
+    if method == "plurality":
+        selected_id = str(data.get("option_id", ""))
+        row.append(opt_texts.get(selected_id, selected_id))
+
+    elif method == "approval":
+        selected = [str(x) for x in data.get("option_ids", [])]
+        row += ["1" if oid in selected else "0" for oid in opt_ids]
+
     elif method in ("borda", "irv", "condorcet"):
-        header = ["投票番号", "投票日時"] + [opt_texts.get(oid, oid) for oid in opt_ids]
+        rankings = {}
+        if "rankings" in data:
+            rankings = {str(k): str(v_r) for k, v_r in data["rankings"].items()}
+        elif "order" in data:
+            rankings = {str(oid): str(idx + 1) for idx, oid in enumerate(data["order"])}
+        row += [rankings.get(oid, "") for oid in opt_ids]
+
+    elif method == "score":
+        scores_d = {str(k): str(v_s) for k, v_s in data.get("scores", {}).items()}
+        row += [scores_d.get(oid, "") for oid in opt_ids]
+
     elif method == "majority_judgement":
-        header = ["投票番号", "投票日時"] + [opt_texts.get(oid, oid) for oid in opt_ids]
+        grades_d = {str(k): str(g) for k, g in data.get("grades", {}).items()}
+        row += [grades_d.get(oid, "") for oid in opt_ids]
+
+    elif method in ("quadratic", "negative"):
+        votes_d = {str(k): str(v_v) for k, v_v in data.get("votes", {}).items()}
+        row += [votes_d.get(oid, "0") for oid in opt_ids]
+
     else:
-        header = ["投票番号", "投票日時", "投票データ"]
+        row.append(str(data))
 
-    writer.writerow(header)
+    return row
 
-    for i, v in enumerate(votes, 1):
-        ts = v.get("created_at", "")
-        data = v.get("vote_data", {})
-        row = [i, ts]
 
-        if method == "plurality":
-            selected_id = str(data.get("option_id", ""))
-            row.append(opt_texts.get(selected_id, selected_id))
+def _csv_text(rows) -> str:
+    output = io.StringIO()
+    csv.writer(output).writerows(rows)
+    return output.getvalue()
 
-        elif method == "approval":
-            selected = [str(x) for x in data.get("option_ids", [])]
-            row += ["1" if oid in selected else "0" for oid in opt_ids]
 
-        elif method in ("borda", "irv", "condorcet"):
-            rankings = {}
-            if "rankings" in data:
-                rankings = {str(k): str(v_r) for k, v_r in data["rankings"].items()}
-            elif "order" in data:
-                rankings = {str(oid): str(idx + 1) for idx, oid in enumerate(data["order"])}
-            row += [rankings.get(oid, "") for oid in opt_ids]
+def csv_header(poll, options: list) -> str:
+    """CSV のヘッダー行"""
+    opt_texts = {str(o["id"]): o["text"] for o in options}
+    opt_ids = [str(o["id"]) for o in options]
+    return _csv_text([_csv_header(poll.voting_method, opt_ids, opt_texts)])
 
-        elif method == "score":
-            scores_d = {str(k): str(v_s) for k, v_s in data.get("scores", {}).items()}
-            row += [scores_d.get(oid, "") for oid in opt_ids]
 
-        elif method == "majority_judgement":
-            grades_d = {str(k): str(g) for k, g in data.get("grades", {}).items()}
-            row += [grades_d.get(oid, "") for oid in opt_ids]
+def csv_rows(poll, votes, options: list, start: int = 1) -> str:
+    """投票データの CSV 行（投票番号は start から）"""
+    opt_texts = {str(o["id"]): o["text"] for o in options}
+    opt_ids = [str(o["id"]) for o in options]
+    method = poll.voting_method
+    return _csv_text(_csv_row(method, i, v, opt_ids, opt_texts) for i, v in enumerate(votes, start))
 
-        elif method in ("quadratic", "negative"):
-            votes_d = {str(k): str(v_v) for k, v_v in data.get("votes", {}).items()}
-            row += [votes_d.get(oid, "0") for oid in opt_ids]
 
-        else:
-            row.append(str(data))
+def iter_votes_csv(poll, votes, options: list, rows_per_chunk: int = CSV_ROWS_PER_CHUNK):
+    """
+    投票データを CSV の文字列チャンクとして順に返すジェネレーター。
+    votes はジェネレーターでもよく、保持するのは rows_per_chunk 行分のバッファのみ。
+    最初のチャンク（ヘッダー行）は投票の読み出しより前に返す。
+    """
+    yield csv_header(poll, options)
+    iterator = iter(votes)
+    start = 1
+    while batch := list(islice(iterator, rows_per_chunk)):
+        yield csv_rows(poll, batch, options, start)
+        start += len(batch)
 
-        writer.writerow(row)
 
-    return output.getvalue()
+def votes_to_csv(poll, votes: list, options: list) -> str:
+    """投票データをCSV文字列に変換"""
+    return "".join(iter_votes_csv(poll, votes, options))
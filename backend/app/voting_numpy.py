@@ -0,0 +1,188 @@
+"""
+NumPy による投票行列エンジン（承認・ボルダ・スコア・クアドラティック・負の投票）
+
+投票データを最初に1度だけ (投票数 × 選択肢数) の密行列へ展開し、
+合計・件数・平均・正負の内訳を列方向の集約で求める。
+返り値の形式は app/voting.py の calculate_* と同一。
+
+投票数が多い投票フォームでは app/voting.py の calculate_results が
+自動的にこちらを選択する（settings.NUMPY_ENGINE_MIN_VOTES を参照）。
+"""
+import numpy as np
+
+from app.voting import _make_result, profile_stats
+
+
+def _column_index(options: list) -> dict:
+    """選択肢ID（int・文字列の両方）→ 列番号"""
+    index = {}
+    for j, o in enumerate(options):
+        index[o["id"]] = j
+        index[str(o["id"])] = j
+    return index
+
+
+def _columns(index: dict, keys: list) -> np.ndarray:
+    """選択肢IDの列を列番号の配列に変換（選択肢に存在しないIDは -1）"""
+    cols = [index.get(k, -2) for k in keys]
+    for pos, j in enumerate(cols):
+        if j == -2:
+            # "01" のような正規化されていないIDは int() で解釈する
+            cols[pos] = index.get(int(keys[pos]), -1)
+    return np.asarray(cols, dtype=np.int64)
+
+
+def _to_array(values: list, dtype) -> np.ndarray:
+    try:
+        return np.asarray(values).astype(dtype)
+    except (TypeError, ValueError):
+        cast = float if dtype == np.float64 else int
+        return np.array([cast(v) for v in values], dtype=dtype)
+
+
+def _decode_entries(containers: list, options: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    各投票の選択肢ID群（dict のキー または list）を平坦化し、
+    (行番号, 列番号, 平坦化した要素のうち有効なもののマスク) を返す。
+    選択肢に存在しないIDは除外する。
+    """
+    keys = []
+    lengths = []
+    for container in containers:
+        keys.extend(container)
+        lengths.append(len(container))
+    rows = np.repeat(np.arange(len(containers)), lengths)
+    cols = _columns(_column_index(options), keys)
+    valid = cols >= 0
+    return rows[valid], cols[valid], valid
+
+
+def _decode(vote_datas: list, options: list, field: str, dtype) -> tuple[np.ndarray, np.ndarray]:
+    """
+    vote_data[field] = {"opt_id": 値} を (投票数 × 選択肢数) の値行列と入力件数の行列に展開する。
+    選択肢に存在しないIDは無視する。
+    """
+    containers = [data.get(field, {}) for data in vote_datas]
+    rows, cols, valid = _decode_entries(containers, options)
+    values = []
+    for container in containers:
+        values.extend(container.values())
+
+    shape = (len(vote_datas), len(options))
+    matrix = np.zeros(shape, dtype=dtype)
+    filled = np.zeros(shape, dtype=np.int64)
+    if len(rows):
+        np.add.at(matrix, (rows, cols), _to_array(values, dtype)[valid])
+        np.add.at(filled, (rows, cols), 1)
+    return matrix, filled
+
+
+def _vote_datas(votes) -> list:
+    return [v["vote_data"] for v in votes]
+
+
+# ---------------------------------------------------------------------------
+# 承認投票
+# ---------------------------------------------------------------------------
+def calculate_approval(votes, options: list, method_settings: dict | None = None) -> dict:
+    vote_datas = _vote_datas(votes)
+    rows, cols, _ = _decode_entries([data.get("option_ids", []) for data in vote_datas], options)
+
+    approved = np.zeros((len(vote_datas), len(options)), dtype=np.int64)
+    if len(rows):
+        np.add.at(approved, (rows, cols), 1)
+    counts = approved.sum(axis=0)
+
+    options_map = {o["id"]: o["text"] for o in options}
+    scores = {o["id"]: int(counts[j]) for j, o in enumerate(options)}
+    return _make_result(options_map, scores, {"total_voters": len(vote_datas)})
+
+
+# ---------------------------------------------------------------------------
+# ボルダ・カウント
+# ---------------------------------------------------------------------------
+def calculate_borda(votes, options: list, method_settings: dict | None = None) -> dict:
+    """1位 = n-1点, 2位 = n-2点, ..., 最下位 = 0点"""
+    vote_datas = _vote_datas(votes)
+    n = len(options)
+    ranks, filled = _decode(vote_datas, options, "rankings", np.int64)
+    points = (n * filled - ranks).sum(axis=0)
+    # 異なる投票パターン数（選択肢に存在しないIDは区別しない）
+    distinct = len(np.unique(np.hstack([ranks, filled]), axis=0)) if len(vote_datas) else 0
+
+    options_map = {o["id"]: o["text"] for o in options}
+    scores = {o["id"]: int(points[j]) for j, o in enumerate(options)}
+    result = _make_result(options_map, scores, {"max_score": (n - 1) * len(vote_datas)})
+    result["details"]["profile"] = profile_stats(len(vote_datas), distinct)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# スコア投票
+# ---------------------------------------------------------------------------
+def calculate_score(votes, options: list, method_settings: dict | None = None) -> dict:
+    scores_matrix, filled = _decode(_vote_datas(votes), options, "scores", np.float64)
+    column_totals = scores_matrix.sum(axis=0)
+    column_counts = filled.sum(axis=0)
+
+    options_map = {o["id"]: o["text"] for o in options}
+    totals = {}
+    counts = {}
+    averages = {}
+    for j, o in enumerate(options):
+        oid = o["id"]
+        counts[oid] = int(column_counts[j])
+        if counts[oid] > 0:
+            totals[oid] = float(column_totals[j])
+            averages[oid] = round(totals[oid] / counts[oid], 2)
+        else:
+            averages[oid] = 0.0
+
+    result = _make_result(options_map, averages)
+    result["details"] = {
+        "averages": averages,
+        "totals": totals,
+        "vote_counts": counts,
+    }
+    return result
+
+
+# ---------------------------------------------------------------------------
+# クアドラティック・ボーティング
+# ---------------------------------------------------------------------------
+def calculate_quadratic(votes, options: list, method_settings: dict | None = None) -> dict:
+    vote_datas = _vote_datas(votes)
+    allocations, _ = _decode(vote_datas, options, "votes", np.int64)
+    totals = allocations.sum(axis=0)
+
+    options_map = {o["id"]: o["text"] for o in options}
+    scores = {o["id"]: int(totals[j]) for j, o in enumerate(options)}
+    return _make_result(options_map, scores, {"total_voters": len(vote_datas)})
+
+
+# ---------------------------------------------------------------------------
+# 負の投票
+# ---------------------------------------------------------------------------
+def calculate_negative(votes, options: list, method_settings: dict | None = None) -> dict:
+    values, _ = _decode(_vote_datas(votes), options, "votes", np.int64)
+    totals = values.sum(axis=0)
+    positives = (values > 0).sum(axis=0)
+    negatives = (values < 0).sum(axis=0)
+
+    options_map = {o["id"]: o["text"] for o in options}
+    scores = {o["id"]: int(totals[j]) for j, o in enumerate(options)}
+    result = _make_result(options_map, scores)
+    result["details"] = {
+        "positives": {str(o["id"]): int(positives[j]) for j, o in enumerate(options)},
+        "negatives": {str(o["id"]): int(negatives[j]) for j, o in enumerate(options)},
+    }
+    return result
+
+
+NUMPY_CALCULATORS = {
+    "approval": calculate_approval,
+    "borda": calculate_borda,
+    "score": calculate_score,
+    "quadratic": calculate_quadratic,
+    "negative": calculate_negative,
+}
@@ -0,0 +1,62 @@
+"""
+プロセス並列による全票集計（大規模な投票フォームの再集計・監査用）
+
+投票を一定数ごとのチャンクに分け、各チャンクをワーカープロセスで
+init / accumulate して部分集計状態を作り、merge する。
+ワーカーへは vote_data のみを送り、未完了のチャンク数はワーカー数の2倍までに
+抑えるため、投票をジェネレーターで渡せばメモリ使用量はチャンクサイズに比例する。
+
+並列集計の実装はここだけで、再集計（app/tally.py の recount_state・scripts/recount）から使う。
+結果は合算した集計状態を TALLIES の finalize で確定する（保存済みの集計状態と同じ経路）。
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable
+
+from app.config import settings
+from app.voting import TALLIES
+
+
+def worker_count(workers: int | None = None) -> int:
+    """ワーカー数（未指定・0 なら settings.PARALLEL_WORKERS、それも 0 なら CPU 数）"""
+    return workers or settings.PARALLEL_WORKERS or os.cpu_count() or 1
+
+
+def _chunks(vote_datas: Iterable[dict], size: int):
+    iterator = iter(vote_datas)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _tally_chunk(voting_method: str, vote_datas: list) -> dict:
+    """ワーカープロセスで1チャンク分の部分集計状態を作る"""
+    tally = TALLIES[voting_method]
+    state = tally.init()
+    for vote_data in vote_datas:
+        tally.accumulate(state, vote_data)
+    return state
+
+
+def parallel_state(
+    voting_method: str,
+    vote_datas: Iterable[dict],
+    workers: int | None = None,
+    chunk_size: int | None = None,
+) -> dict:
+    """vote_data の列を並列に集計し、合算した集計状態を返す（全票を1度に集計した state と一致）"""
+    tally = TALLIES[voting_method]
+    workers = worker_count(workers)
+    chunk_size = chunk_size or settings.PARALLEL_CHUNK_SIZE
+    state = tally.init()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _chunks(vote_datas, chunk_size):
+            pending.append(pool.submit(_tally_chunk, voting_method, chunk))
+            if len(pending) >= workers * 2:
+                tally.merge(state, pending.popleft().result())
+        while pending:
+            tally.merge(state, pending.popleft().result())
+    return state
@@ -0,0 +1,220 @@
+"""
+9種類の集計（app/voting.py の CALCULATORS）の規模別ベンチマーク
+
+方式・投票の分布・投票数・選択肢数ごとに、シード付きで生成した投票を
+CALCULATORS の各関数で集計し、所要時間と集計中のピークメモリを測る。
+
+投票の分布:
+- uniform    : 各投票者が選択肢から一様に選んで並べる
+- polarized  : 投票者が2つの陣営に分かれ、陣営ごとに逆の好みで並べる
+- duplicated : 少数（--patterns）の投票パターンだけが繰り返し投じられる
+
+各投票で順位・評価を付ける選択肢は最大 --max-marked 個（選択肢が 500 でも全候補を並べる
+投票者はいないため）。所要時間が --interactive-ms を超えた組み合わせは対話的に使えないものとし、
+方式・選択肢数ごとに対話的に使える最大の投票数を最後に表示する。
+--stop-seconds を超えた組み合わせより大きい投票数は測らない。
+
+結果は --save で JSON に保存でき、--compare で保存した結果と比べて
+--tolerance 倍より遅くなった組み合わせがあれば終了コード 1 で終わる。
+
+使い方 (backend ディレクトリで実行):
+  python -m benchmarks.bench_calculators
+  python -m benchmarks.bench_calculators --full --save benchmarks/baseline_calculators.json
+  python -m benchmarks.bench_calculators --methods irv condorcet --compare benchmarks/baseline_calculators.json
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from app.voting import CALCULATORS
+from scripts.vote_generators import DISTRIBUTIONS, orderings, vote_data_for
+
+DEFAULT_BALLOTS = [1_000, 10_000, 100_000]
+DEFAULT_OPTIONS = [2, 10, 50]
+FULL_BALLOTS = [1_000, 10_000, 100_000, 1_000_000]
+FULL_OPTIONS = [2, 10, 50, 500]
+
+
+# ----------------------------- 投票の生成 -----------------------------
+
+def make_ballots(
+    method: str,
+    distribution: str,
+    n_ballots: int,
+    n_options: int,
+    seed: int = 0,
+    max_marked: int = 10,
+    n_patterns: int = 50,
+) -> tuple[list, list]:
+    """(votes, options) を返す。同じ並びの投票は同じ vote_data を共有する（メモリの節約）"""
+    rng = random.Random(f"{seed}:{method}:{distribution}:{n_ballots}:{n_options}")
+    options = [{"id": i, "text": f"候補{i}", "order_index": i - 1} for i in range(1, n_options + 1)]
+    ids = [o["id"] for o in options]
+    shared: dict[int, dict] = {}
+    votes = []
+    for order in orderings(distribution, n_ballots, ids, max_marked, n_patterns, rng):
+        vote = shared.get(id(order)) if distribution == "duplicated" else None
+        if vote is None:
+            vote = {"vote_data": vote_data_for(method, order)}
+            if distribution == "duplicated":
+                shared[id(order)] = vote
+        votes.append(vote)
+    return votes, options
+
+
+# ----------------------------- 計測 -----------------------------
+
+def measure(method: str, votes: list, options: list, memory: bool) -> dict:
+    calculator = CALCULATORS[method]
+    gc.collect()
+    start = time.perf_counter()
+    calculator(votes, options)
+    seconds = time.perf_counter() - start
+
+    peak_mib = None
+    if memory:
+        # tracemalloc は処理を遅くするため、時間とは別に1回実行して測る
+        gc.collect()
+        tracemalloc.start()
+        calculator(votes, options)
+        peak_mib = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return {"seconds": seconds, "peak_mib": peak_mib}
+
+
+def _case_key(case: dict) -> tuple:
+    return case["method"], case["distribution"], case["ballots"], case["options"]
+
+
+def run(args) -> list[dict]:
+    cases = []
+    for method in args.methods:
+        for distribution in args.distributions:
+            for n_options in args.options:
+                for n_ballots in sorted(args.ballots):
+                    votes, options = make_ballots(
+                        method, distribution, n_ballots, n_options, args.seed, args.max_marked, args.patterns
+                    )
+                    m = measure(method, votes, options, not args.no_memory)
+                    del votes
+                    case = {
+                        "method": method,
+                        "distribution": distribution,
+                        "ballots": n_ballots,
+                        "options": n_options,
+                        **m,
+                    }
+                    cases.append(case)
+                    peak = f"{m['peak_mib']:9.2f} MiB" if m["peak_mib"] is not None else ""
+                    print(
+                        f"  {method:<18} {distribution:<10} 投票 {n_ballots:>9,} 選択肢 {n_options:>3}: "
+                        f"{m['seconds'] * 1000:10.1f} ms {peak}",
+                        flush=True,
+                    )
+                    if m["seconds"] > args.stop_seconds:
+                        break  # これより多い投票数は測らない
+    return cases
+
+
+# ----------------------------- 集計・比較 -----------------------------
+
+def interactive_limits(cases: list[dict], threshold_seconds: float) -> dict:
+    """方式・選択肢数ごとに、全分布で threshold_seconds 以内だった最大の投票数（なければ 0）"""
+    measured: dict[tuple, dict[int, float]] = {}
+    for c in cases:
+        slot = measured.setdefault((c["method"], c["options"]), {})
+        slot[c["ballots"]] = max(slot.get(c["ballots"], 0.0), c["seconds"])
+    limits = {}
+    for key, by_ballots in measured.items():
+        limit = 0
+        for n_ballots in sorted(by_ballots):
+            if by_ballots[n_ballots] > threshold_seconds:
+                break
+            limit = n_ballots
+        limits[key] = limit
+    return limits
+
+
+def compare(cases: list[dict], baseline: dict, tolerance: float) -> list[tuple[dict, float]]:
+    """baseline より tolerance 倍を超えて遅くなった (組み合わせ, 倍率) の一覧"""
+    previous = {_case_key(c): c for c in baseline["results"]}
+    regressions = []
+    for case in cases:
+        before = previous.get(_case_key(case))
+        if before is None or before["seconds"] <= 0:
+            continue
+        ratio = case["seconds"] / before["seconds"]
+        if ratio > tolerance:
+            regressions.append((case, ratio))
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="9種類の集計の規模別ベンチマーク")
+    parser.add_argument("--methods", nargs="+", choices=list(CALCULATORS), default=list(CALCULATORS))
+    parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    parser.add_argument("--ballots", type=int, nargs="+", default=None)
+    parser.add_argument("--options", type=int, nargs="+", default=None)
+    parser.add_argument("--full", action="store_true", help="投票数 10^3〜10^6・選択肢数 2〜500 で測る")
+    parser.add_argument("--max-marked", type=int, default=10, help="1票で順位・評価を付ける選択肢の最大数")
+    parser.add_argument("--patterns", type=int, default=50, help="duplicated の投票パターン数")
+    parser.add_argument("--interactive-ms", type=float, default=200)
+    parser.add_argument("--stop-seconds", type=float, default=10)
+    parser.add_argument("--no-memory", action="store_true", help="ピークメモリを測らない（時間のみ）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="結果を保存する JSON のパス")
+    parser.add_argument("--compare", help="比較する保存済みの JSON のパス")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="この倍率より遅ければ退行とする")
+    args = parser.parse_args(argv)
+    args.ballots = args.ballots or (FULL_BALLOTS if args.full else DEFAULT_BALLOTS)
+    args.options = args.options or (FULL_OPTIONS if args.full else DEFAULT_OPTIONS)
+
+    print(f"投票数={args.ballots} 選択肢数={args.options} 1票の最大選択数={args.max_marked} シード={args.seed}")
+    cases = run(args)
+
+    print(f"\n対話的に使える最大の投票数（全分布で {args.interactive_ms:.0f} ms 以内。+ は測った最大の投票数でも以内）")
+    limits = interactive_limits(cases, args.interactive_ms / 1000)
+    largest = max(args.ballots)
+    for method in args.methods:
+        row = "  ".join(
+            f"選択肢 {n:>3}: {limits.get((method, n), 0):>9,}{'+' if limits.get((method, n)) == largest else ' '}"
+            for n in args.options
+        )
+        print(f"  {method:<18} {row}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "max_marked": args.max_marked,
+                "patterns": args.patterns,
+                "results": cases,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を {args.save} に保存しました")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(cases, baseline, args.tolerance)
+        print(f"\n{args.compare}（{baseline.get('created_at', '?')}）との比較: 退行 {len(regressions)} 件")
+        for case, ratio in regressions:
+            print(
+                f"  {case['method']:<18} {case['distribution']:<10} 投票 {case['ballots']:>9,} "
+                f"選択肢 {case['options']:>3}: {ratio:.2f} 倍"
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
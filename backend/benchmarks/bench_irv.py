@@ -0,0 +1,89 @@
+"""
+IRV 集計のベンチマーク
+
+全ラウンドで全投票の順位リストを先頭から走査し直す従来の実装と、
+同一パターンをまとめて除外候補の票だけを移す現在の実装（app/voting.py）を比較する。
+
+使い方 (backend ディレクトリで実行):
+  python -m benchmarks.bench_irv
+  python -m benchmarks.bench_irv --ballots 200000 --options 100 --patterns 5000
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+
+from app.voting import calculate_irv
+
+
+def rescan_irv(votes: list, options: list) -> dict:
+    """比較用: ラウンドごとに全投票を再走査する従来の実装"""
+    options_map = {o["id"]: o["text"] for o in options}
+    remaining = set(options_map.keys())
+    all_orders = [[int(x) for x in v["vote_data"].get("order", [])] for v in votes]
+    rounds = []
+    eliminated = []
+    while len(remaining) > 1:
+        counts = defaultdict(int)
+        for order in all_orders:
+            for oid in order:
+                if oid in remaining:
+                    counts[oid] += 1
+                    break
+        total = sum(counts.values())
+        rounds.append({"counts": {oid: counts[oid] for oid in remaining}, "total": total})
+        for oid in remaining:
+            if total > 0 and counts[oid] > total / 2:
+                return {"winner_id": oid, "details": {"rounds": rounds, "eliminated": eliminated}}
+        min_count = min(counts[oid] for oid in remaining)
+        for oid in [oid for oid in remaining if counts[oid] == min_count]:
+            remaining.discard(oid)
+            eliminated.append({"id": oid, "text": options_map[oid]})
+    winner_id = next(iter(remaining)) if remaining else None
+    return {"winner_id": winner_id, "details": {"rounds": rounds, "eliminated": eliminated}}
+
+
+def make_election(n_ballots: int, n_options: int, n_patterns: int, seed: int) -> tuple[list, list]:
+    """候補の人気に偏りを持たせた順位パターンを作り、重複を含む投票を生成する"""
+    rng = random.Random(seed)
+    options = [{"id": i, "text": f"候補{i}", "order_index": i - 1} for i in range(1, n_options + 1)]
+    ids = [o["id"] for o in options]
+    popularity = [rng.random() ** 2 for _ in ids]
+    patterns = []
+    for _ in range(n_patterns):
+        keyed = sorted(ids, key=lambda oid: -popularity[oid - 1] * rng.random())
+        patterns.append(keyed[: rng.randint(1, n_options)])
+    votes = [{"vote_data": {"order": rng.choice(patterns)}} for _ in range(n_ballots)]
+    return votes, options
+
+
+def _timed(fn, *args) -> tuple[float, dict]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="IRV 集計のベンチマーク")
+    parser.add_argument("--ballots", type=int, default=100000)
+    parser.add_argument("--options", type=int, default=50)
+    parser.add_argument("--patterns", type=int, default=2000, help="異なる順位パターンの数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    votes, options = make_election(args.ballots, args.options, args.patterns, args.seed)
+    print(f"投票数={args.ballots} 選択肢数={args.options} パターン数={args.patterns}")
+
+    rescan_time, expected = _timed(rescan_irv, votes, options)
+    current_time, result = _timed(calculate_irv, votes, options)
+    assert result["winner_id"] == expected["winner_id"]
+    assert {k: v for k, v in result["details"].items() if k != "profile"} == expected["details"]
+
+    print(f"  ラウンド数        : {len(result['details']['rounds'])}")
+    print(f"  従来（全票再走査）: {rescan_time:8.3f} 秒")
+    print(f"  現在（差分移動）  : {current_time:8.3f} 秒")
+    print(f"  高速化            : {rescan_time / current_time:8.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+投票・結果 API の負荷試験
+
+アプリ（app/main.py の app）を httpx.ASGITransport で同じプロセス内から、または --url で
+起動済みのサーバー（uvicorn など）に対して、以下の利用者を同時に動かす。
+
+- 投票者（--voters 人）: 新しい voter_id の Cookie で
+  GET /api/vote/{public_id} → GET /api/vote/{public_id}/status → POST /api/vote/{public_id} を繰り返す
+- 作成者（--creators 人）: GET /api/polls/{id}/results を繰り返し、--csv-every 回ごとに
+  GET /api/polls/{id}/results/csv も取得する
+
+ルートごとのリクエスト数・スループット・エラー数・p50/p95/p99 の応答時間と、1秒あたりの投票数を表示する。
+最後に受け付けた投票数と結果の総投票数を比べ、一致しなければ（集計状態の更新の取りこぼし）
+終了コード 1 で終わる（--url では他の投票も数えられうるため表示のみ）。
+結果は --save で JSON に保存でき、--compare で保存した結果と比べて、投票数/秒が 1/--tolerance 倍を
+下回るか p95 が --tolerance 倍を超えたルートがあれば終了コード 1 で終わる。
+
+同じプロセス内で動かす場合は一時ファイルの SQLite（本番と同じ configure_sqlite の設定）を使い、
+作成者は DB に直接作ったユーザーのトークンでログインする。
+--url の場合は --email / --password の有効なアカウントでログインして投票フォームを作る。
+
+使い方 (backend ディレクトリで実行):
+  python -m benchmarks.bench_load
+  python -m benchmarks.bench_load --voters 100 --creators 10 --seconds 30 --save load.json
+  python -m benchmarks.bench_load --url http://localhost:8000 --email me@example.com --password '...'
+"""
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models
+from app.auth import create_access_token
+from app.database import Base, configure_sqlite, get_db, get_read_db
+from app.main import app
+from app.routers import polls as polls_router
+from app.voter_filter import voter_filters
+from scripts.vote_generators import vote_data_for
+
+VOTE_ROUTES = ("GET /api/vote/{public_id}", "GET /api/vote/{public_id}/status", "POST /api/vote/{public_id}")
+CREATOR_ROUTES = ("GET /api/polls/{id}/results", "GET /api/polls/{id}/results/csv")
+
+
+class RouteStats:
+    """ルートごとの応答時間（秒）とエラー数（2xx 以外・通信エラー）"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.is_success
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.latencies.setdefault(route, []).append(time.perf_counter() - start)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+    def successes(self, route: str) -> int:
+        return len(self.latencies.get(route, [])) - self.errors.get(route, 0)
+
+    def summary(self, seconds: float) -> dict:
+        routes = {}
+        for route, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            routes[route] = {
+                "requests": len(latencies),
+                "rps": len(latencies) / seconds,
+                "errors": self.errors.get(route, 0),
+                "p50_ms": _percentile(latencies, 50) * 1000,
+                "p95_ms": _percentile(latencies, 95) * 1000,
+                "p99_ms": _percentile(latencies, 99) * 1000,
+            }
+        return {"seconds": seconds, "votes_per_sec": self.successes(VOTE_ROUTES[2]) / seconds, "routes": routes}
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    """最近接順位法のパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+# ----------------------------- 利用者 -----------------------------
+
+async def voter(client: httpx.AsyncClient, stats: RouteStats, poll: dict, method: str, deadline: float, rng: random.Random):
+    base = f"/api/vote/{poll['public_id']}"
+    while time.perf_counter() < deadline:
+        client.cookies.clear()
+        client.cookies.set("voter_id", secrets.token_urlsafe(16))  # 毎回新しい投票者
+        await stats.request(client, VOTE_ROUTES[0], "GET", base)
+        await stats.request(client, VOTE_ROUTES[1], "GET", f"{base}/status")
+        order = rng.sample(poll["option_ids"], rng.randint(1, len(poll["option_ids"])))
+        await stats.request(client, VOTE_ROUTES[2], "POST", base, json={"vote_data": vote_data_for(method, order)})
+
+
+async def creator(client: httpx.AsyncClient, stats: RouteStats, poll: dict, csv_every: int, deadline: float):
+    base = f"/api/polls/{poll['id']}/results"
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        await stats.request(client, CREATOR_ROUTES[0], "GET", base)
+        if csv_every and n % csv_every == 0:
+            await stats.request(client, CREATOR_ROUTES[1], "GET", f"{base}/csv")
+
+
+# ----------------------------- 接続先 -----------------------------
+
+@asynccontextmanager
+async def in_process(args):
+    """一時ファイルの SQLite を使うアプリへの (transport, base_url, 作成者の Cookie)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{Path(tmp) / 'load.db'}"
+        write_engine = create_async_engine(url, pool_size=1, max_overflow=0)  # app/database.py の async_engine と同じ
+        configure_sqlite(write_engine)
+        read_engine = create_async_engine(url)
+        configure_sqlite(read_engine, read_only=True, snapshot=True)
+        async with write_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        writes = async_sessionmaker(write_engine, autoflush=False, expire_on_commit=False)
+        reads = async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
+        async with writes() as db:
+            user = models.User(email="load@example.com", hashed_password="-", is_active=True)
+            db.add(user)
+            await db.commit()
+
+        async def override_db():
+            async with writes() as db:
+                yield db
+
+        async def override_read_db():
+            async with reads() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = override_db
+        app.dependency_overrides[get_read_db] = override_read_db
+        read_session_factory = polls_router.read_session_factory
+        filter_session_factory = voter_filters.session_factory
+        # リクエストの外（バックグラウンド・送信中）で開くセッション
+        polls_router.read_session_factory = voter_filters.session_factory = reads
+        try:
+            cookies = {"access_token": create_access_token({"sub": str(user.id)})}
+            # アプリの例外（500）も送出せずにエラーとして数える
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            yield transport, "http://testserver", cookies
+        finally:
+            app.dependency_overrides.clear()
+            polls_router.read_session_factory = read_session_factory
+            voter_filters.session_factory = filter_session_factory
+            await write_engine.dispose()
+            await read_engine.dispose()
+
+
+@asynccontextmanager
+async def remote(args):
+    async with httpx.AsyncClient(base_url=args.url) as client:
+        resp = await client.post("/api/auth/login", json={"email": args.email, "password": args.password})
+        resp.raise_for_status()
+        cookies = dict(client.cookies)
+    yield None, args.url, cookies
+
+
+async def create_poll(client: httpx.AsyncClient, method: str, n_options: int) -> dict:
+    resp = await client.post("/api/polls/", json={
+        "title": "負荷試験",
+        "description": "",
+        "voting_method": method,
+        "options": [f"候補{i}" for i in range(1, n_options + 1)],
+        "method_settings": {},
+        "start_time": None,
+        "end_time": None,
+    })
+    resp.raise_for_status()
+    poll = resp.json()
+    return {"id": poll["id"], "public_id": poll["public_id"], "option_ids": [o["id"] for o in poll["options"]]}
+
+
+async def run(args) -> dict:
+    target = remote(args) if args.url else in_process(args)
+    async with target as (transport, base_url, creator_cookies):
+        def make_client(cookies=None) -> httpx.AsyncClient:
+            limits = httpx.Limits(max_connections=args.voters + args.creators)
+            return httpx.AsyncClient(transport=transport, base_url=base_url, cookies=cookies, limits=limits, timeout=60)
+
+        creators = [make_client(creator_cookies) for _ in range(max(1, args.creators))]
+        voters = [make_client() for _ in range(args.voters)]
+        try:
+            poll = await create_poll(creators[0], args.method, args.options)
+            stats = RouteStats()
+            rng = random.Random(args.seed)
+            start = time.perf_counter()
+            deadline = start + args.seconds
+            await asyncio.gather(
+                *[voter(c, stats, poll, args.method, deadline, random.Random(rng.random())) for c in voters],
+                *[creator(c, stats, poll, args.csv_every, deadline) for c in creators[: args.creators]],
+            )
+            summary = stats.summary(time.perf_counter() - start)
+            # 集計状態の更新の取りこぼし（同時の投票での上書き）がないかを確かめる
+            resp = await creators[0].get(f"/api/polls/{poll['id']}/results")
+            resp.raise_for_status()
+            summary["accepted_votes"] = stats.successes(VOTE_ROUTES[2])
+            summary["tallied_votes"] = resp.json()["total_votes"]
+            return summary
+        finally:
+            for client in creators + voters:
+                await client.aclose()
+
+
+# ----------------------------- 表示・比較 -----------------------------
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list[str]:
+    """baseline からの退行の説明の一覧"""
+    regressions = []
+    if summary["votes_per_sec"] * tolerance < baseline["votes_per_sec"]:
+        regressions.append(f"投票数/秒 {baseline['votes_per_sec']:.1f} → {summary['votes_per_sec']:.1f}")
+    for route, now in summary["routes"].items():
+        before = baseline["routes"].get(route)
+        if before and before["p95_ms"] > 0 and now["p95_ms"] > before["p95_ms"] * tolerance:
+            regressions.append(f"{route} p95 {before['p95_ms']:.1f} ms → {now['p95_ms']:.1f} ms")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="投票・結果 API の負荷試験")
+    parser.add_argument("--url", help="起動済みのサーバーの URL（省略時は同じプロセス内のアプリ）")
+    parser.add_argument("--email", help="--url のときに投票フォームを作るアカウント")
+    parser.add_argument("--password")
+    parser.add_argument("--voters", type=int, default=50)
+    parser.add_argument("--creators", type=int, default=5)
+    parser.add_argument("--csv-every", type=int, default=5, help="作成者が CSV も取得する間隔（結果の取得回数）")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--method", choices=["plurality", "approval", "borda", "irv", "condorcet", "score",
+                                             "majority_judgement", "quadratic", "negative"], default="plurality")
+    parser.add_argument("--options", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="結果を保存する JSON のパス")
+    parser.add_argument("--compare", help="比較する保存済みの JSON のパス")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args(argv)
+    if args.url and not (args.email and args.password):
+        parser.error("--url には --email と --password が必要です")
+
+    target = args.url or "同じプロセス内（ASGITransport）"
+    print(f"接続先={target} 投票者={args.voters} 作成者={args.creators} 時間={args.seconds}秒 方式={args.method}")
+    summary = asyncio.run(run(args))
+
+    print(f"\n  {'ルート':<36} {'件数':>7} {'件/秒':>8} {'エラー':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route in VOTE_ROUTES + CREATOR_ROUTES:
+        r = summary["routes"].get(route)
+        if r:
+            print(
+                f"  {route:<36} {r['requests']:>7} {r['rps']:>8.1f} {r['errors']:>6} "
+                f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}"
+            )
+    print(f"\n  投票数: {summary['votes_per_sec']:.1f} 票/秒")
+    consistent = summary["tallied_votes"] == summary["accepted_votes"]
+    print(
+        f"  集計: 受け付けた投票 {summary['accepted_votes']} 票 / 結果の総投票数 {summary['tallied_votes']} 票"
+        f"{'' if consistent else '（不一致: 集計状態の更新の取りこぼし）'}"
+    )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "target": target,
+                "voters": args.voters,
+                "creators": args.creators,
+                "method": args.method,
+                **summary,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を {args.save} に保存しました")
+
+    failed = not consistent and not args.url  # 起動済みのサーバーでは他の投票も数えられうる
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, args.tolerance)
+        print(f"\n{args.compare}（{baseline.get('created_at', '?')}）との比較: 退行 {len(regressions)} 件")
+        for line in regressions:
+            print(f"  {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
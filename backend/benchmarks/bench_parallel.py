@@ -0,0 +1,64 @@
+"""
+並列集計のベンチマーク
+
+1プロセスでの全票集計（calculate_results の python エンジン）と、
+チャンクごとの部分集計をプロセス並列で作って合算する集計（app/voting_parallel.py）を
+ワーカー数を変えて比較する。
+
+使い方 (backend ディレクトリで実行):
+  python -m benchmarks.bench_parallel
+  python -m benchmarks.bench_parallel --method condorcet --ballots 2000000 --workers 2 4 8
+"""
+import argparse
+import random
+import time
+
+from app.voting import TALLIES, calculate_results
+from app.voting_parallel import parallel_state
+from benchmarks.bench_irv import make_election
+
+
+def make_votes(method: str, n_ballots: int, n_options: int, seed: int) -> tuple[list, list]:
+    votes, options = make_election(n_ballots, n_options, 5000, seed)
+    if method in ("irv", "condorcet"):
+        return votes, options
+    rng = random.Random(seed)
+    for v in votes:
+        chosen = v["vote_data"]["order"]
+        if method == "borda":
+            v["vote_data"] = {"rankings": {str(oid): rank for rank, oid in enumerate(chosen, 1)}}
+        else:
+            v["vote_data"] = {"scores": {str(oid): rng.randint(0, 10) for oid in chosen}}
+    return votes, options
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="並列集計のベンチマーク")
+    parser.add_argument("--method", choices=["irv", "condorcet", "borda", "score"], default="irv")
+    parser.add_argument("--ballots", type=int, default=1000000)
+    parser.add_argument("--options", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    votes, options = make_votes(args.method, args.ballots, args.options, args.seed)
+    print(f"方式={args.method} 投票数={args.ballots} 選択肢数={args.options}")
+
+    start = time.perf_counter()
+    expected = calculate_results(args.method, votes, options, engine="python")
+    single = time.perf_counter() - start
+    print(f"  1プロセス         : {single:8.3f} 秒")
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        vote_datas = (v["vote_data"] for v in votes)
+        state = parallel_state(args.method, vote_datas, workers=workers, chunk_size=args.chunk_size)
+        result = TALLIES[args.method].finalize(state, options)
+        elapsed = time.perf_counter() - start
+        assert result["winner_id"] == expected["winner_id"]
+        print(f"  {workers:2d} プロセス        : {elapsed:8.3f} 秒 ({single / elapsed:.1f} 倍)")
+
+
+if __name__ == "__main__":
+    main()
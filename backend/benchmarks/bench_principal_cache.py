@@ -0,0 +1,124 @@
+"""
+ログイン中のユーザーのキャッシュ（app/principal_cache.py）の有無による DB アクセス回数のベンチマーク
+
+一時ファイルの SQLite にユーザーと投票フォームを作り、httpx.ASGITransport 経由で
+作成者がダッシュボード・投票フォーム・結果の API を繰り返し呼んだときの
+1リクエストあたりの SQL 文の数（うち users の読み出し）と所要時間を比較する。
+
+- キャッシュなし: PRINCIPAL_CACHE_MAX_ENTRIES=0 と同じ（リクエストごとに users を読む）
+- キャッシュあり: 既定の設定
+
+使い方 (backend ディレクトリで実行):
+  python -m benchmarks.bench_principal_cache
+  python -m benchmarks.bench_principal_cache --requests 2000 --votes 1000
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models
+from app.auth import create_access_token
+from app.database import Base, configure_sqlite, get_db, get_read_db
+from app.main import app
+from app.principal_cache import principal_cache
+from app.result_cache import result_cache
+
+ENDPOINTS = ("/api/polls/", "/api/polls/{id}", "/api/polls/{id}/results")
+
+
+async def seed(sessions, n_votes: int) -> tuple[int, int]:
+    async with sessions() as db:
+        user = models.User(email="bench@example.com", hashed_password="-", is_active=True)
+        poll = models.Poll(title="bench", description="", voting_method="plurality", creator=user)
+        poll.options = [models.PollOption(text=f"候補{i}", order_index=i) for i in range(5)]
+        db.add(poll)
+        await db.flush()
+        db.add_all(
+            models.Vote(poll_id=poll.id, voter_fingerprint=f"v{i}", vote_data={"option_id": poll.options[i % 5].id})
+            for i in range(n_votes)
+        )
+        await db.commit()
+        return user.id, poll.id
+
+
+async def bench(cached: bool, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}"
+        write_engine = create_async_engine(url)
+        configure_sqlite(write_engine)
+        read_engine = create_async_engine(url)
+        configure_sqlite(read_engine, read_only=True)
+        async with write_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        writes = async_sessionmaker(write_engine, autoflush=False, expire_on_commit=False)
+        reads = async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
+        user_id, poll_id = await seed(writes, args.votes)
+
+        async def override_db():
+            async with writes() as db:
+                yield db
+
+        async def override_read_db():
+            async with reads() as db:
+                yield db
+
+        counts = {"statements": 0, "users": 0}
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            counts["statements"] += 1
+            counts["users"] += "FROM users" in statement
+
+        for engine in (write_engine, read_engine):
+            event.listen(engine.sync_engine, "before_cursor_execute", count)
+        app.dependency_overrides[get_db] = override_db
+        app.dependency_overrides[get_read_db] = override_read_db
+        principal_cache.clear()
+        result_cache.clear()
+        max_entries = principal_cache.max_entries
+        principal_cache.max_entries = max_entries if cached else 0
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                client.cookies.set("access_token", create_access_token({"sub": str(user_id)}))
+                paths = [p.format(id=poll_id) for p in ENDPOINTS]
+                start = time.perf_counter()
+                for i in range(args.requests):
+                    resp = await client.get(paths[i % len(paths)])
+                    resp.raise_for_status()
+                elapsed = time.perf_counter() - start
+        finally:
+            principal_cache.max_entries = max_entries
+            app.dependency_overrides.clear()
+            await write_engine.dispose()
+            await read_engine.dispose()
+
+        return {
+            "statements_per_request": counts["statements"] / args.requests,
+            "users_per_request": counts["users"] / args.requests,
+            "ms_per_request": elapsed / args.requests * 1000,
+        }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="ログイン中のユーザーのキャッシュによる DB アクセス回数の比較")
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--votes", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    print(f"リクエスト数={args.requests}（{', '.join(ENDPOINTS)} を順に） 投票数={args.votes}")
+    for label, cached in (("キャッシュなし", False), ("キャッシュあり", True)):
+        r = asyncio.run(bench(cached, args))
+        print(
+            f"  {label:<7}: SQL {r['statements_per_request']:5.2f} 回/リクエスト"
+            f"（users {r['users_per_request']:4.2f}）  {r['ms_per_request']:6.2f} ms/リクエスト"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+GROUP BY 集計（ballot_entries）と vote_data からの集計の比較ベンチマーク
+
+一時ファイルの SQLite に投票と ballot_entries を投入し、
+- 全票の vote_data を読み出して app/voting.py の calculate_results で集計する従来の経路
+- ballot_entries の GROUP BY で集計状態を作り finalize する経路（app/ballot_entries.py）
+の所要時間を比較する。
+
+使い方 (backend ディレクトリで実行):
+  python -m benchmarks.bench_sql_tally
+  python -m benchmarks.bench_sql_tally --method score --ballots 500000 --options 20
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.ballot_entries import ENTRY_BUILDERS, sql_state
+from app.database import Base
+from app.tally import stream_votes
+from app.voting import TALLIES, calculate_results
+
+
+def make_vote_data(method: str, option_ids: list, rng: random.Random) -> dict:
+    chosen = rng.sample(option_ids, rng.randint(1, len(option_ids)))
+    if method == "plurality":
+        return {"option_id": chosen[0]}
+    if method == "approval":
+        return {"option_ids": chosen}
+    if method == "score":
+        return {"scores": {str(oid): rng.randint(0, 10) for oid in chosen}}
+    if method == "quadratic":
+        return {"votes": {str(oid): rng.randint(0, 5) for oid in chosen}}
+    return {"votes": {str(oid): rng.choice([-1, 0, 1]) for oid in chosen}}
+
+
+def seed(session, method: str, n_ballots: int, n_options: int, seed_value: int) -> models.Poll:
+    rng = random.Random(seed_value)
+    user = models.User(email="bench@example.com", hashed_password="-", is_active=True)
+    session.add(user)
+    session.flush()
+    poll = models.Poll(title="bench", description="", voting_method=method, creator_id=user.id)
+    session.add(poll)
+    session.flush()
+    session.add_all(models.PollOption(poll_id=poll.id, text=f"候補{i}", order_index=i) for i in range(n_options))
+    session.flush()
+    option_ids = [o.id for o in poll.options]
+
+    build = ENTRY_BUILDERS[method]
+    votes = []
+    entries = []
+    for vote_id in range(1, n_ballots + 1):
+        vote_data = make_vote_data(method, option_ids, rng)
+        votes.append({
+            "id": vote_id, "poll_id": poll.id, "voter_fingerprint": f"fp{vote_id}",
+            "vote_data": vote_data, "entries_written": True,
+        })
+        entries += [
+            {"vote_id": vote_id, "poll_id": poll.id, "option_id": oid, "value": value}
+            for oid, value in build(vote_data)
+        ]
+    session.execute(models.Vote.__table__.insert(), votes)
+    session.execute(models.BallotEntry.__table__.insert(), entries)
+    session.commit()
+    return poll
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="GROUP BY 集計と vote_data からの集計の比較")
+    parser.add_argument("--method", choices=list(ENTRY_BUILDERS), default="approval")
+    parser.add_argument("--ballots", type=int, default=200000)
+    parser.add_argument("--options", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(bind=engine)()
+        poll = seed(session, args.method, args.ballots, args.options, args.seed)
+        options = [{"id": o.id, "text": o.text, "order_index": o.order_index} for o in poll.options]
+        print(f"方式={args.method} 投票数={args.ballots} 選択肢数={args.options}")
+
+        start = time.perf_counter()
+        expected = calculate_results(args.method, stream_votes(session, poll.id), options)
+        python_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = TALLIES[args.method].finalize(sql_state(session, poll), options)
+        sql_time = time.perf_counter() - start
+        assert result == expected
+
+        print(f"  vote_data から集計 : {python_time:8.3f} 秒")
+        print(f"  GROUP BY で集計    : {sql_time:8.3f} 秒")
+        print(f"  高速化             : {python_time / sql_time:8.1f} 倍")
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+SQLite の接続設定（WAL・PRAGMA・読み取り専用エンジン）の有無による同時読み書きのベンチマーク
+
+一時ファイルの SQLite に投票を投入し、一定時間
+- 読み取りスレッド: 投票フォームの全票を読み出す（CSV 出力・再集計と同じクエリ）
+- 書き込みスレッド: 1票ずつ投票を追加してコミットする（submit_vote と同じ）
+を同時に実行して、読み取り・書き込みそれぞれの処理件数と書き込みの待ち時間を比較する。
+
+- 既定: create_engine の既定値のみ（ロールバックジャーナル。読み取り中は書き込みが待たされる）
+- 調整後: app/database.py の configure_sqlite（WAL など）と読み取り専用エンジン
+
+使い方 (backend ディレクトリで実行):
+  python -m benchmarks.bench_sqlite_profile
+  python -m benchmarks.bench_sqlite_profile --ballots 200000 --readers 4 --writers 4 --seconds 10
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.database import Base, configure_sqlite
+
+
+def seed(engine, n_ballots: int, seed_value: int) -> int:
+    rng = random.Random(seed_value)
+    with sessionmaker(bind=engine)() as session:
+        user = models.User(email="bench@example.com", hashed_password="-", is_active=True)
+        poll = models.Poll(title="bench", description="", voting_method="approval", creator=user)
+        poll.options = [models.PollOption(text=f"候補{i}", order_index=i) for i in range(10)]
+        session.add(poll)
+        session.flush()
+        option_ids = [o.id for o in poll.options]
+        session.execute(models.Vote.__table__.insert(), [
+            {
+                "poll_id": poll.id,
+                "voter_fingerprint": f"seed{i}",
+                "vote_data": {"option_ids": rng.sample(option_ids, rng.randint(1, 5))},
+            }
+            for i in range(n_ballots)
+        ])
+        session.commit()
+        return poll.id
+
+
+def run(write_engine, read_engine, poll_id: int, readers: int, writers: int, seconds: float) -> dict:
+    stop = threading.Event()
+    lock = threading.Lock()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    latencies = []
+
+    def read_loop():
+        while not stop.is_set():
+            with read_engine.connect() as conn:
+                conn.execute(
+                    select(models.Vote.vote_data, models.Vote.created_at)
+                    .where(models.Vote.poll_id == poll_id)
+                    .order_by(models.Vote.id)
+                ).all()
+            with lock:
+                counts["reads"] += 1
+
+    def write_loop(worker: int):
+        Session = sessionmaker(bind=write_engine)
+        n = 0
+        while not stop.is_set():
+            n += 1
+            start = time.perf_counter()
+            try:
+                with Session() as session:
+                    session.add(models.Vote(
+                        poll_id=poll_id,
+                        voter_fingerprint=f"w{worker}-{n}",
+                        vote_data={"option_ids": [1]},
+                    ))
+                    session.commit()
+            except OperationalError:
+                with lock:
+                    counts["errors"] += 1
+                continue
+            with lock:
+                counts["writes"] += 1
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=read_loop) for _ in range(readers)]
+    threads += [threading.Thread(target=write_loop, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    return {
+        "reads_per_sec": counts["reads"] / seconds,
+        "writes_per_sec": counts["writes"] / seconds,
+        "errors": counts["errors"],
+        "write_p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "write_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+    }
+
+
+def bench_profile(tuned: bool, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        write_engine = create_engine(url, connect_args={"check_same_thread": False})
+        read_engine = write_engine
+        if tuned:
+            configure_sqlite(write_engine)
+            read_engine = create_engine(url, connect_args={"check_same_thread": False})
+            configure_sqlite(read_engine, read_only=True)
+        Base.metadata.create_all(bind=write_engine)
+        poll_id = seed(write_engine, args.ballots, args.seed)
+        result = run(write_engine, read_engine, poll_id, args.readers, args.writers, args.seconds)
+        write_engine.dispose()
+        read_engine.dispose()
+        return result
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="SQLite の接続設定による同時読み書きの比較")
+    parser.add_argument("--ballots", type=int, default=50000)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"投票数={args.ballots} 読み取り={args.readers} 書き込み={args.writers} 時間={args.seconds}秒")
+    for label, tuned in (("既定", False), ("調整後", True)):
+        r = bench_profile(tuned, args)
+        print(
+            f"  {label:<4}: 読み取り {r['reads_per_sec']:7.1f} 回/秒  書き込み {r['writes_per_sec']:8.1f} 票/秒  "
+            f"書き込み p50 {r['write_p50_ms']:7.1f} ms  p95 {r['write_p95_ms']:7.1f} ms  ロックエラー {r['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
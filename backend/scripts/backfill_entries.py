@@ -0,0 +1,49 @@
+"""
+既存の投票を ballot_entries に展開するコマンド（稼働中に実行できる）
+
+投票ID順に一定件数ずつ展開し、バッチごとにコミットする。新しい投票は
+送信時に展開されるため、実行中に投票を受け付けても取りこぼしは起きない。
+中断しても再実行すれば未展開の投票から続きを処理する。
+
+使い方 (backend ディレクトリで実行):
+  python -m scripts.backfill_entries                     # 未展開の投票をすべて展開
+  python -m scripts.backfill_entries --batch-size 5000   # 1回のコミットで展開する件数
+  python -m scripts.backfill_entries --pause 0.1         # バッチ間で待機し、投票の書き込みを優先する
+"""
+import argparse
+import sys
+import time
+
+from app.ballot_entries import backfill_batch
+from app.database import Base, SessionLocal, engine, upgrade_schema
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="既存の投票を ballot_entries に展開します。")
+    parser.add_argument("--batch-size", type=int, default=1000, help="1回のコミットで処理する投票数")
+    parser.add_argument("--pause", type=float, default=0.0, help="バッチ間の待機秒数")
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    db = SessionLocal()
+    try:
+        last_id = scanned = written = 0
+        while True:
+            last_id, batch_scanned, batch_written = backfill_batch(db, last_id, args.batch_size)
+            if batch_scanned == 0:
+                break
+            scanned += batch_scanned
+            written += batch_written
+            print(f"  投票ID {last_id} まで処理（展開 {written} 件）")
+            if args.pause:
+                time.sleep(args.pause)
+        skipped = scanned - written
+        print(f"{written} 件を展開しました。" + (f"{skipped} 件は投票データが不正なため展開できませんでした。" if skipped else ""))
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
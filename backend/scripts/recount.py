@@ -0,0 +1,65 @@
+"""
+集計状態（poll_tallies）の全票再集計・検証コマンド
+
+使い方 (backend ディレクトリで実行):
+  python -m scripts.recount                # 全投票フォームを再集計し、差分があれば上書き
+  python -m scripts.recount --check        # 差分の確認のみ（不一致があれば終了コード 1）
+  python -m scripts.recount --poll-id 12   # 指定した投票フォームのみ
+  python -m scripts.recount --workers 8    # 8 プロセスで並列に再集計（大規模な投票フォーム向け）
+
+全票の読み出し・比較は読み取り専用の接続（投票フォームごとに1つのスナップショット）で行い、
+書き込みのロックを取るのは不一致だった投票フォームの集計状態を置き換える間だけ。
+稼働中の API に対して実行しても投票送信を待たせない。
+"""
+import argparse
+import sys
+
+from sqlalchemy import select
+
+from app import models
+from app.database import Base, SessionLocal, SyncReadSessionLocal, engine, upgrade_schema
+from app.tally import check_poll, has_json_patterns, replace_tally
+from app.voting_parallel import worker_count
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="集計状態を全票から再集計して検証します。")
+    parser.add_argument("--poll-id", type=int, action="append", help="対象の投票フォームID（複数指定可）")
+    parser.add_argument("--check", action="store_true", help="検証のみ行い、集計状態を更新しない")
+    parser.add_argument("--workers", type=int, default=1, help="並列集計のプロセス数（0 で CPU 数）")
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    workers = worker_count(args.workers)
+    checked = mismatched = 0
+    with SyncReadSessionLocal() as read_db:
+        stmt = select(models.Poll.id).order_by(models.Poll.id)
+        if args.poll_id:
+            stmt = stmt.where(models.Poll.id.in_(args.poll_id))
+        poll_ids = read_db.scalars(stmt).all()
+
+        for poll_id in poll_ids:
+            read_db.rollback()  # 投票フォームごとに新しいスナップショットを読む
+            poll = read_db.get(models.Poll, poll_id)
+            if poll is None:
+                continue  # 一覧の取得後に削除された
+            checked += 1
+            matched, state, upto_id = check_poll(read_db, poll, workers)
+            if not matched:
+                mismatched += 1
+                action = "不一致" if args.check else "再構築"
+                print(f"[{action}] poll_id={poll.id} method={poll.voting_method}")
+            if not args.check and (not matched or has_json_patterns(poll)):
+                with SessionLocal() as db:
+                    poll = db.get(models.Poll, poll_id)
+                    if poll is not None:
+                        replace_tally(db, poll, state, upto_id)
+                        db.commit()
+        print(f"{checked} 件を検証、{mismatched} 件が不一致でした。")
+
+    return 1 if args.check and mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+大規模なデータベースを作るコマンド（本番規模の再現・ベンチマーク・プロファイリング用）
+
+app/models.py のスキーマに、ユーザー・方式ごとの投票フォーム・選択肢・投票を書き込む。
+ORM のオブジェクトは作らず、テーブルごとに --batch-size 行ずつ executemany で INSERT し、
+--commit-every 行ごとにコミットする（数千万行でも数分で入る）。
+
+- 投票データは benchmarks/bench_calculators.py と同じ方法（scripts/vote_generators.py。--distribution の分布）で方式ごとに作る
+- 投票と同じく ballot_entries（対象の方式）と poll_tallies・poll_tally_patterns（IRV）も書き込むため、API・結果表示・
+  python -m scripts.recount --check をそのまま使える
+- 既存のデータには追加する（ID は各テーブルの最大値の続きから振る）
+- ユーザーのパスワードはすべて SEED_PASSWORD（ログインして結果を確認できる）
+- 書き込み中は synchronous=OFF で接続する（途中で止まった DB は作り直すこと）
+
+使い方 (backend ディレクトリで実行):
+  python -m scripts.seed                                                     # 9方式 × 10件・1件あたり 1,000 票
+  python -m scripts.seed --users 1000 --polls-per-method 100 --votes 10000   # 900 万票
+  python -m scripts.seed --database sqlite:///./big.db --methods irv condorcet --options 20 --distribution polarized
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, make_url
+
+from app import models
+from app.auth import hash_password
+from app.ballot_entries import ENTRY_BUILDERS
+from app.config import settings
+from app.database import Base, configure_sqlite, upgrade_schema
+from app.tally import PATTERN_KEYS
+from app.voting import TALLIES
+from scripts.vote_generators import DISTRIBUTIONS, orderings, vote_data_for
+
+SEED_PASSWORD = "Seed1234!"
+
+# テーブルごとに書き込む列（app/models.py にない列名なら KeyError になる）
+COLUMNS = {
+    models.User.__table__: ("id", "email", "hashed_password", "is_active", "created_at"),
+    models.Poll.__table__: (
+        "id", "public_id", "title", "description", "voting_method", "method_settings",
+        "creator_id", "created_at", "updated_at", "results_version",
+    ),
+    models.PollOption.__table__: ("id", "poll_id", "text", "order_index"),
+    models.Vote.__table__: ("id", "poll_id", "voter_fingerprint", "vote_data", "created_at", "entries_written"),
+    models.BallotEntry.__table__: ("id", "vote_id", "poll_id", "option_id", "value"),
+    models.PollTally.__table__: ("poll_id", "voting_method", "state", "vote_count", "updated_at"),
+    models.PollTallyPattern.__table__: ("poll_id", "pattern", "count"),
+}
+
+
+def _timestamp(dt: datetime) -> str:
+    """SQLAlchemy の SQLite の DateTime 型と同じ書式"""
+    return dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class BulkWriter:
+    """テーブルごとに行をためて executemany で書き込み、commit_every 行ごとにコミットする"""
+
+    def __init__(self, dbapi_connection, batch_size: int, commit_every: int):
+        self.conn = dbapi_connection
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.pending = {table: [] for table in COLUMNS}
+        self.written = {table: 0 for table in COLUMNS}
+        self.sql = {
+            table: "INSERT INTO {} ({}) VALUES ({})".format(
+                table.name, ", ".join(table.c[c].name for c in columns), ", ".join("?" * len(columns))
+            )
+            for table, columns in COLUMNS.items()
+        }
+        self.uncommitted = 0
+        self.commits = 0
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def next_id(self, table) -> int:
+        return self.conn.execute(f"SELECT coalesce(max(id), 0) + 1 FROM {table.name}").fetchone()[0]
+
+    def add(self, table, row: tuple) -> None:
+        rows = self.pending[table]
+        rows.append(row)
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+            self.conn.execute("BEGIN IMMEDIATE")
+        elif len(rows) >= self.batch_size:
+            self._flush(table)
+
+    def commit(self) -> None:
+        for table in COLUMNS:  # 参照される側のテーブルから書く
+            self._flush(table)
+        self.conn.execute("COMMIT")
+        self.uncommitted = 0
+        self.commits += 1
+
+    def _flush(self, table) -> None:
+        rows = self.pending[table]
+        if rows:
+            self.conn.executemany(self.sql[table], rows)
+            self.written[table] += len(rows)
+            rows.clear()
+
+
+def seed(dbapi_connection, args) -> dict:
+    """args の件数のデータを書き込み、テーブル名ごとの書き込んだ行数を返す"""
+    writer = BulkWriter(dbapi_connection, args.batch_size, args.commit_every)
+    user_id = writer.next_id(models.User.__table__)
+    poll_id = writer.next_id(models.Poll.__table__)
+    option_id = writer.next_id(models.PollOption.__table__)
+    vote_id = writer.next_id(models.Vote.__table__)
+    entry_id = writer.next_id(models.BallotEntry.__table__)
+    # 追加で実行しても公開ID・フィンガープリントが既存のものと重ならないよう、最初の ID も混ぜる
+    rng = random.Random(f"{args.seed}:{poll_id}")
+    now = datetime.utcnow()
+
+    hashed = hash_password(SEED_PASSWORD)  # bcrypt は遅いため全員で共有する
+    user_ids = list(range(user_id, user_id + args.users))
+    for uid in user_ids:
+        created = now - timedelta(days=rng.uniform(30, 365))
+        writer.add(models.User.__table__, (uid, f"seed{uid}@example.com", hashed, True, _timestamp(created)))
+
+    n_polls = args.polls_per_method * len(args.methods)
+    start = time.perf_counter()
+    done = commits = 0
+    for method in args.methods:
+        tally = TALLIES[method]
+        entries = ENTRY_BUILDERS.get(method)
+        for i in range(args.polls_per_method):
+            created = now - timedelta(days=rng.uniform(0, 30))
+            option_ids = list(range(option_id, option_id + args.options))
+            option_id += args.options
+            state = tally.init()
+            writer.add(models.Poll.__table__, (
+                poll_id, str(uuid.UUID(int=rng.getrandbits(128), version=4)), f"{method} #{i + 1}", "",
+                method, "{}", rng.choice(user_ids), _timestamp(created), _timestamp(created), 1,
+            ))
+            for index, oid in enumerate(option_ids):
+                writer.add(models.PollOption.__table__, (oid, poll_id, f"候補{index + 1}", index))
+
+            for order in orderings(args.distribution, args.votes, option_ids, args.max_marked, args.patterns, rng):
+                vote_data = vote_data_for(method, order)
+                tally.accumulate(state, vote_data)
+                voted_at = created + timedelta(seconds=rng.uniform(0, 86400))
+                writer.add(models.Vote.__table__, (
+                    vote_id, poll_id, f"{rng.getrandbits(256):064x}", json.dumps(vote_data), _timestamp(voted_at), True,
+                ))
+                if entries is not None:
+                    for oid, value in entries(vote_data):
+                        writer.add(models.BallotEntry.__table__, (entry_id, vote_id, poll_id, oid, value))
+                        entry_id += 1
+                vote_id += 1
+            if method in PATTERN_KEYS:
+                for pattern, count in state.pop(PATTERN_KEYS[method]).items():
+                    writer.add(models.PollTallyPattern.__table__, (poll_id, pattern, count))
+            writer.add(models.PollTally.__table__, (poll_id, method, json.dumps(state), state["total"], _timestamp(now)))
+            poll_id += 1
+
+            done += 1
+            if writer.commits != commits:
+                commits = writer.commits
+                _progress(writer, done, n_polls, start)
+    writer.commit()
+    _progress(writer, done, n_polls, start)
+    return {table.name: count for table, count in writer.written.items()}
+
+
+def _progress(writer: BulkWriter, done: int, n_polls: int, start: float) -> None:
+    votes = writer.written[models.Vote.__table__]
+    rate = votes / max(time.perf_counter() - start, 1e-9)
+    print(f"  投票フォーム {done:,}/{n_polls:,}  投票 {votes:,} 件（{rate:,.0f} 件/秒）", flush=True)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="大規模なデータベースを作ります（ユーザー・投票フォーム・投票）。")
+    parser.add_argument("--database", default=settings.DATABASE_URL, help="書き込む DB の URL（既定は DATABASE_URL）")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--methods", nargs="+", choices=list(TALLIES), default=list(TALLIES))
+    parser.add_argument("--polls-per-method", type=int, default=10)
+    parser.add_argument("--options", type=int, default=5, help="1つの投票フォームの選択肢数")
+    parser.add_argument("--votes", type=int, default=1000, help="1つの投票フォームの投票数")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--max-marked", type=int, default=10, help="1票で順位・評価を付ける選択肢の最大数")
+    parser.add_argument("--patterns", type=int, default=50, help="duplicated の投票パターン数")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="1回の executemany で書き込む行数")
+    parser.add_argument("--commit-every", type=int, default=500_000, help="1回のコミットで書き込む行数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if make_url(args.database).get_backend_name() != "sqlite":
+        parser.error("--database は SQLite の URL を指定してください")
+    if args.users < 1 or args.options < 1:
+        parser.error("--users と --options は 1 以上を指定してください")
+
+    engine = create_engine(args.database)
+    configure_sqlite(engine)
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+
+    n_votes = len(args.methods) * args.polls_per_method * args.votes
+    print(
+        f"ユーザー {args.users:,} 人・投票フォーム {len(args.methods)} 方式 × {args.polls_per_method:,} 件"
+        f"（選択肢 {args.options}）・投票 {n_votes:,} 票（{args.distribution}）を {args.database} に書き込みます"
+    )
+    start = time.perf_counter()
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        conn.isolation_level = None  # BEGIN・COMMIT は BulkWriter が発行する
+        conn.execute("PRAGMA synchronous=OFF")
+        written = seed(conn, args)
+    finally:
+        raw.close()
+        engine.dispose()
+
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.1f} 秒で書き込みました（パスワードは {SEED_PASSWORD}）。")
+    for name, count in written.items():
+        print(f"  {name:<15} {count:>12,} 行")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
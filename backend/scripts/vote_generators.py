@@ -0,0 +1,63 @@
+"""
+テスト用の投票の生成（scripts/seed.py の DB 作成と benchmarks/ のベンチマークで共有する）
+
+投票の分布（DISTRIBUTIONS）:
+- uniform    : 各投票者が選択肢から一様に選んで並べる
+- polarized  : 投票者が2つの陣営に分かれ、陣営ごとに逆の好みで並べる
+- duplicated : 少数（n_patterns）の投票パターンだけが繰り返し投じられる
+
+orderings で投票者ごとの選択肢の並びを作り、vote_data_for で方式ごとの vote_data にする。
+"""
+import random
+
+from app.voting import MJ_GRADE_LABELS
+
+DISTRIBUTIONS = ("uniform", "polarized", "duplicated")
+
+
+def orderings(distribution: str, n_ballots: int, ids: list, max_marked: int, n_patterns: int, rng: random.Random):
+    """投票者ごとの選択肢の並び（好きな順）を生成する"""
+    def marked() -> int:
+        return rng.randint(1, min(max_marked, len(ids)))
+
+    if distribution == "uniform":
+        for _ in range(n_ballots):
+            yield rng.sample(ids, marked())
+    elif distribution == "polarized":
+        # 陣営 A は ID の小さい候補、陣営 B は大きい候補を好む（好みにノイズを加える）
+        n = len(ids)
+        for _ in range(n_ballots):
+            camp = rng.random() < 0.5
+            chosen = rng.sample(ids, marked())
+            yield sorted(chosen, key=lambda oid: (oid if camp else n - oid) + rng.random() * n / 4)
+    elif distribution == "duplicated":
+        patterns = [rng.sample(ids, marked()) for _ in range(n_patterns)]
+        for _ in range(n_ballots):
+            yield rng.choice(patterns)
+    else:
+        raise ValueError(f"Unknown distribution: {distribution}")
+
+
+def vote_data_for(method: str, order: list) -> dict:
+    """並びを方式ごとの vote_data にする（上位ほど高い評価）"""
+    if method == "plurality":
+        return {"option_id": order[0]}
+    if method == "approval":
+        return {"option_ids": order}
+    if method == "borda":
+        return {"rankings": {str(oid): rank for rank, oid in enumerate(order, 1)}}
+    if method in ("irv", "condorcet"):
+        return {"order": order}
+    if method == "score":
+        return {"scores": {str(oid): max(0, 10 - i) for i, oid in enumerate(order)}}
+    if method == "majority_judgement":
+        top = len(MJ_GRADE_LABELS) - 1
+        return {"grades": {str(oid): MJ_GRADE_LABELS[max(0, top - i)] for i, oid in enumerate(order)}}
+    if method == "quadratic":
+        return {"votes": {str(oid): max(0, 3 - i) for i, oid in enumerate(order)}}
+    if method == "negative":
+        data = {str(order[0]): 1}
+        if len(order) > 1:
+            data[str(order[-1])] = -1
+        return {"votes": data}
+    raise ValueError(f"Unknown voting method: {method}")
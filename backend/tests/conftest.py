@@ -3,14 +3,25 @@
 - インメモリ SQLite + テーブル自動作成
 - TestClient（同期）を使用
 - ユーザー登録・ログイン済みクライアントを提供
+
+アプリは AsyncSession（aiosqlite）で、テストからの DB の確認は同期 Session で
+同じ共有キャッシュのインメモリ DB を参照する。読み取り専用のルート（get_read_db）は
+本番と同じく query_only の接続を使い、誤って書き込むとテストが失敗する。
 """
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
-from app.database import Base, get_db
+from app.database import Base, configure_sqlite, get_db, get_read_db
 from app.main import app
+from app.principal_cache import principal_cache
+from app.routers import polls as polls_router
+from app.public_poll_cache import public_poll_cache
+from app.result_cache import result_cache
+from app.voter_filter import voter_filters
 
 # インメモリ SQLite（テスト専用）- 共有キャッシュで全接続が同一DBを参照
 TEST_DATABASE_URL = "sqlite:///file::memory:?cache=shared&uri=true"
@@ -21,8 +32,39 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient はテストごとにイベントループを作るため、接続はプールしない
+# （同期エンジンのプールが接続を保持している間、インメモリ DB は残る）
+async_engine = create_async_engine(
+    "sqlite+aiosqlite:///file::memory:?cache=shared&uri=true",
+    poolclass=NullPool,
+)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+read_engine = create_async_engine(
+    "sqlite+aiosqlite:///file::memory:?cache=shared&uri=true",
+    poolclass=NullPool,
+)
+# 共有キャッシュのインメモリ DB はテーブル単位のロックのため、読み取りのトランザクション中は書き込めない。
+# テストの読み取り用エンジンは snapshot=True にしない（スナップショットは test_tally.py のファイルの DB で確認する）
+configure_sqlite(read_engine, read_only=True)
+TestingReadSessionLocal = async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
+
+# 投票済みフィルターはリクエストの書き込みと同時にバックグラウンドで読むため、テーブル単位のロックを取らない
+# read_uncommitted で読む（コミット前の投票が入っても偽陽性になるだけ。本番の WAL では不要）
+filter_read_engine = create_async_engine(
+    "sqlite+aiosqlite:///file::memory:?cache=shared&uri=true",
+    poolclass=NullPool,
+)
+event.listen(
+    filter_read_engine.sync_engine,
+    "connect",
+    lambda dbapi_connection, _: dbapi_connection.execute("PRAGMA read_uncommitted=ON"),
+)
+TestingFilterSessionLocal = async_sessionmaker(filter_read_engine, autoflush=False, expire_on_commit=False)
+
 
 def override_get_db():
+    """テストから DB を確認するための同期 Session"""
     db = TestingSessionLocal()
     try:
         yield db
@@ -30,18 +72,35 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+async def override_get_read_db():
+    async with TestingReadSessionLocal() as db:
+        yield db
+
+
 @pytest.fixture(autouse=True)
 def setup_db():
-    """各テスト前にテーブルを再作成し、後に削除"""
+    """各テスト前にテーブルを再作成し、後に削除（投票フォーム・ユーザーのIDが再利用されるためキャッシュ・投票済みフィルターも空にする）"""
     Base.metadata.create_all(bind=engine)
+    principal_cache.clear()
+    result_cache.clear()
+    public_poll_cache.clear()
+    voter_filters.clear()
     yield
     Base.metadata.drop_all(bind=engine)
 
 
 @pytest.fixture
-def client():
-    """DB依存をオーバーライドした TestClient"""
-    app.dependency_overrides[get_db] = override_get_db
+def client(monkeypatch):
+    """DB依存をオーバーライドした TestClient（リクエストの外で開く読み取り用のセッションも差し替える）"""
+    app.dependency_overrides[get_db] = override_get_async_db
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    monkeypatch.setattr(polls_router, "read_session_factory", TestingReadSessionLocal)
+    monkeypatch.setattr(voter_filters, "session_factory", TestingFilterSessionLocal)
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
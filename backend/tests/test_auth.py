@@ -7,11 +7,30 @@
 - POST /api/auth/login
 - POST /api/auth/logout
 - GET  /api/auth/me
+- パスワードのハッシュ化・照合の専用スレッドプール（app/password_hasher.py）と
+  コスト変更後のログイン時の再ハッシュ
+- 照合の間は書き込みのロックを持たないこと（同時の書き込みを待たせない）
 """
+import asyncio
+import threading
+import time
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
+from passlib.hash import bcrypt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models
+from app import password_hasher as hasher_module
+from app.auth import verify_and_update_password
+from app.config import settings
+from app.database import Base, configure_sqlite, get_db, get_read_db
+from app.main import app
+from app.password_hasher import PasswordHasher, PasswordHasherBusy
 
-from .conftest import login, register_and_activate
+from .conftest import login, override_get_db, register_and_activate
 
 EMAIL = "user@example.com"
 PASSWORD = "Test1234!"
@@ -146,3 +165,159 @@ class TestMeAndLogout:
         # ログアウト後は /me が 401
         resp2 = auth_client.get("/api/auth/me")
         assert resp2.status_code == 401
+
+
+# --------------------------------------------------------------------------
+# パスワードのハッシュ化
+# --------------------------------------------------------------------------
+
+HEALTH_DEADLINE_SECONDS = 0.5  # 照合の実行中でもこの時間内に他のリクエストへ応答する
+
+
+def _blocking_verify(release: threading.Event):
+    def verify(plain, hashed):
+        release.wait(5)
+        return verify_and_update_password(plain, hashed)
+    return verify
+
+
+class TestPasswordHasher:
+    async def test_bounded_queue_rejects(self, monkeypatch):
+        release = threading.Event()
+        monkeypatch.setattr(hasher_module, "verify_and_update_password", _blocking_verify(release))
+        hasher = PasswordHasher(workers=1, max_queue=1)
+        hashed = bcrypt.using(rounds=4).hash(PASSWORD)
+
+        running = [asyncio.create_task(hasher.verify(PASSWORD, hashed)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert hasher.stats()["active"] == 1
+        assert hasher.stats()["queued"] == 1
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.verify(PASSWORD, hashed)
+
+        release.set()
+        assert [ok for ok, _ in await asyncio.gather(*running)] == [True, True]
+        stats = hasher.stats()
+        assert (stats["active"], stats["queued"], stats["peak_queued"]) == (0, 0, 1)
+        assert (stats["rejected"], stats["operations"]) == (1, 2)
+
+    def test_busy_returns_503(self, client: TestClient, monkeypatch):
+        register_and_activate(client, EMAIL, PASSWORD)
+        monkeypatch.setattr(hasher_module.password_hasher, "_run", _always_busy)
+        resp = client.post("/api/auth/login", json={"email": EMAIL, "password": PASSWORD})
+        assert resp.status_code == 503
+        assert resp.headers["retry-after"] == "1"
+
+    async def test_login_does_not_block_event_loop(self, client: TestClient, monkeypatch):
+        register_and_activate(client, EMAIL, PASSWORD)
+        release = threading.Event()
+        monkeypatch.setattr(hasher_module, "verify_and_update_password", _blocking_verify(release))
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as c:
+            pending = asyncio.create_task(
+                c.post("/api/auth/login", json={"email": EMAIL, "password": PASSWORD})
+            )
+            while hasher_module.password_hasher.stats()["active"] == 0:
+                assert not pending.done(), (await pending).text
+                await asyncio.sleep(0.01)
+
+            begin = time.perf_counter()
+            health = await c.get("/api/stats")
+            elapsed = time.perf_counter() - begin
+            assert health.status_code == 200
+            assert health.json()["password_hasher"]["active"] == 1
+            assert elapsed < HEALTH_DEADLINE_SECONDS
+
+            release.set()
+            assert (await pending).status_code == 200
+
+    def test_login_rehashes_on_cost_change(self, client: TestClient):
+        register_and_activate(client, EMAIL, PASSWORD)
+        db = next(override_get_db())
+        user = db.query(models.User).filter(models.User.email == EMAIL).one()
+        user.hashed_password = bcrypt.using(rounds=4).hash(PASSWORD)  # 以前のコストで保存されたハッシュ
+        db.commit()
+
+        login(client, EMAIL, PASSWORD)
+        db.expire_all()
+        rehashed = db.query(models.User).filter(models.User.email == EMAIL).one().hashed_password
+        db.close()
+        assert rehashed.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+        login(client, EMAIL, PASSWORD)
+
+    def test_wrong_password_does_not_rehash(self, client: TestClient):
+        register_and_activate(client, EMAIL, PASSWORD)
+        db = next(override_get_db())
+        user = db.query(models.User).filter(models.User.email == EMAIL).one()
+        old = user.hashed_password = bcrypt.using(rounds=4).hash(PASSWORD)
+        db.commit()
+
+        resp = client.post("/api/auth/login", json={"email": EMAIL, "password": "Wrong1234!"})
+        assert resp.status_code == 401
+        db.expire_all()
+        assert db.query(models.User).filter(models.User.email == EMAIL).one().hashed_password == old
+        db.close()
+
+
+async def _always_busy(fn, *args):
+    raise PasswordHasherBusy()
+
+
+@pytest.fixture
+async def file_sessions(tmp_path):
+    """一時ファイルの DB（本番と同じ書き込み用・読み取り専用のエンジン）をアプリに使わせ、書き込み用のセッションを返す"""
+    url = f"sqlite+aiosqlite:///{tmp_path / 'auth.db'}"
+    write_engine, read_engine = create_async_engine(url), create_async_engine(url)
+    configure_sqlite(write_engine)
+    configure_sqlite(read_engine, read_only=True)
+    async with write_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(write_engine, autoflush=False, expire_on_commit=False)
+    read_sessions = async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_write():
+        async with sessions() as db:
+            yield db
+
+    async def override_read():
+        async with read_sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_write
+    app.dependency_overrides[get_read_db] = override_read
+    yield sessions
+    app.dependency_overrides.clear()
+    await write_engine.dispose()
+    await read_engine.dispose()
+
+
+class TestWriteLock:
+    async def test_login_does_not_hold_write_lock(self, file_sessions, monkeypatch):
+        async with file_sessions() as db:
+            # 以前のコストのハッシュ（照合の後に UPDATE で保存し直す）
+            db.add(models.User(email=EMAIL, hashed_password=bcrypt.using(rounds=4).hash(PASSWORD), is_active=True))
+            await db.commit()
+        release = threading.Event()
+        monkeypatch.setattr(hasher_module, "verify_and_update_password", _blocking_verify(release))
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as c:
+            pending = asyncio.create_task(c.post("/api/auth/login", json={"email": EMAIL, "password": PASSWORD}))
+            while hasher_module.password_hasher.stats()["active"] == 0:
+                assert not pending.done(), (await pending).text
+                await asyncio.sleep(0.01)
+
+            # 照合の間も他のリクエストの書き込みは待たされない
+            begin = time.perf_counter()
+            async with file_sessions() as db:
+                db.add(models.User(email="other@example.com", hashed_password="-"))
+                await db.commit()
+            assert time.perf_counter() - begin < HEALTH_DEADLINE_SECONDS
+
+            release.set()
+            assert (await pending).status_code == 200
+
+        async with file_sessions() as db:
+            hashed = await db.scalar(select(models.User.hashed_password).where(models.User.email == EMAIL))
+        assert hashed.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
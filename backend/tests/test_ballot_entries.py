@@ -0,0 +1,110 @@
+"""
+投票データの正規化テーブル（app/ballot_entries.py・ballot_entries）のテスト
+
+カバー範囲:
+- 投票送信時の展開と GROUP BY による集計状態（vote_data からの集計と一致）
+- 導入前の投票の展開（backfill_batch）と未展開の投票がある場合のフォールバック
+- 投票フォーム削除時の削除
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app import models
+from app.ballot_entries import ENTRY_BUILDERS, backfill_batch, sql_state
+from app.tally import recount_state
+
+from .conftest import override_get_db
+from .test_tally import _create_poll, make_ballots
+
+
+def _submit_all(client: TestClient, poll: dict, ballots: list) -> None:
+    for i, vote_data in enumerate(ballots):
+        client.cookies.set("voter_id", f"voter-{i}")
+        resp = client.post(f"/api/vote/{poll['public_id']}", json={"vote_data": vote_data})
+        assert resp.status_code == 200, resp.text
+
+
+class TestSqlState:
+    @pytest.mark.parametrize("method", list(ENTRY_BUILDERS))
+    def test_matches_vote_data_recount(self, auth_client: TestClient, method):
+        poll = _create_poll(auth_client, method)
+        ids = [o["id"] for o in poll["options"]]
+        _submit_all(auth_client, poll, make_ballots(method, *ids))
+
+        db = next(override_get_db())
+        db_poll = db.get(models.Poll, poll["id"])
+        assert db.query(models.BallotEntry).filter_by(poll_id=poll["id"]).count() > 0
+        assert sql_state(db, db_poll) == recount_state(db, db_poll)
+        db.close()
+
+    def test_unknown_option_ids_kept(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "score")
+        _submit_all(auth_client, poll, [{"scores": {"99": 4, str(poll["options"][0]["id"]): 2}}])
+
+        db = next(override_get_db())
+        db_poll = db.get(models.Poll, poll["id"])
+        state = sql_state(db, db_poll)
+        assert state["totals"]["99"] == 4.0
+        assert state == recount_state(db, db_poll)
+        db.close()
+
+    def test_unsupported_method(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "irv")
+        ids = [o["id"] for o in poll["options"]]
+        _submit_all(auth_client, poll, make_ballots("irv", *ids))
+
+        db = next(override_get_db())
+        assert sql_state(db, db.get(models.Poll, poll["id"])) is None
+        assert db.query(models.Vote).filter_by(entries_written=False).count() == 0
+        assert db.query(models.BallotEntry).count() == 0
+        db.close()
+
+
+class TestBackfill:
+    def _add_legacy_votes(self, poll_id: int, vote_datas: list) -> None:
+        """展開前の（この仕組みの導入前に保存された）投票を直接追加する"""
+        db = next(override_get_db())
+        for i, vote_data in enumerate(vote_datas):
+            db.add(models.Vote(poll_id=poll_id, voter_fingerprint=f"legacy-{i}", vote_data=vote_data))
+        db.commit()
+        db.close()
+
+    def test_backfill_completes_sql_path(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "negative")
+        ids = [o["id"] for o in poll["options"]]
+        ballots = make_ballots("negative", *ids)
+        self._add_legacy_votes(poll["id"], ballots)
+        _submit_all(auth_client, poll, ballots)
+
+        db = next(override_get_db())
+        db_poll = db.get(models.Poll, poll["id"])
+        assert sql_state(db, db_poll) is None
+
+        last_id, scanned, written = backfill_batch(db, 0, batch_size=1)
+        assert (scanned, written) == (1, 1)
+        while scanned:
+            last_id, scanned, written = backfill_batch(db, last_id, batch_size=1)
+
+        assert sql_state(db, db_poll) == recount_state(db, db_poll)
+        assert sql_state(db, db_poll)["total"] == 2 * len(ballots)
+        db.close()
+
+    def test_invalid_vote_data_left_unexpanded(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "quadratic")
+        self._add_legacy_votes(poll["id"], [{"votes": {"abc": 1}}])
+
+        db = next(override_get_db())
+        assert backfill_batch(db, 0)[1:] == (1, 0)
+        assert sql_state(db, db.get(models.Poll, poll["id"])) is None
+        db.close()
+
+    def test_delete_poll_removes_entries(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "approval")
+        ids = [o["id"] for o in poll["options"]]
+        _submit_all(auth_client, poll, make_ballots("approval", *ids))
+
+        resp = auth_client.delete(f"/api/polls/{poll['id']}")
+        assert resp.status_code == 200
+        db = next(override_get_db())
+        assert db.query(models.BallotEntry).count() == 0
+        db.close()
@@ -0,0 +1,58 @@
+"""
+非同期 DB 層での同時リクエストのテスト
+
+カバー範囲:
+- 結果の確定（finalize）が遅い間も、投票フォームの取得・投票送信がその完了を待たずに返ること
+"""
+import asyncio
+import threading
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app import tally
+from app.main import app
+
+from .test_result_cache import _create_poll
+
+SLOW_FINALIZE_SECONDS = 1.0
+
+
+async def test_vote_requests_not_blocked_by_slow_results(auth_client: TestClient, monkeypatch):
+    poll = _create_poll(auth_client)
+    started = threading.Event()
+    original = tally.finalize_tally
+
+    def slow_finalize(*args):
+        started.set()
+        time.sleep(SLOW_FINALIZE_SECONDS)  # ワーカースレッド内での重い集計を再現する
+        return original(*args)
+
+    monkeypatch.setattr(tally, "finalize_tally", slow_finalize)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as creator, \
+            httpx.AsyncClient(transport=transport, base_url="http://testserver") as voter:
+        creator.cookies.update(auth_client.cookies)
+        results = asyncio.create_task(creator.get(f"/api/polls/{poll['id']}/results"))
+        while not started.is_set():
+            assert not results.done(), (await results).text
+            await asyncio.sleep(0.01)
+
+        begin = time.perf_counter()
+        got = await voter.get(f"/api/vote/{poll['public_id']}")
+        posted = await voter.post(
+            f"/api/vote/{poll['public_id']}",
+            json={"vote_data": {"option_id": poll["options"][0]["id"]}},
+        )
+        elapsed = time.perf_counter() - begin
+
+        assert got.status_code == 200
+        assert posted.status_code == 200, posted.text
+        assert not results.done()
+        assert elapsed < SLOW_FINALIZE_SECONDS
+
+        resp = await results
+        assert resp.status_code == 200
+        assert resp.json()["total_votes"] == 0
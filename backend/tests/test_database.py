@@ -0,0 +1,91 @@
+"""
+SQLite の接続設定（app/database.py の configure_sqlite・読み取り専用エンジン）のテスト
+
+カバー範囲:
+- 新しい接続への PRAGMA（WAL・synchronous・busy_timeout など）の適用
+- 読み取り専用接続（query_only）での書き込みの拒否
+- WAL で読み取り中のトランザクションが書き込みを待たせないこと
+- 書き込み用の接続のトランザクションが開始時に書き込みのロックを取ること（BEGIN IMMEDIATE）
+- ファイルの DB のみコネクションプールの大きさを指定すること
+"""
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.database import _pool_args, configure_sqlite
+
+
+def _file_engine(tmp_path, read_only: bool = False):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    configure_sqlite(engine, read_only=read_only)
+    return engine
+
+
+class TestSqlitePragmas:
+    def test_pragmas_applied(self, tmp_path):
+        engine = _file_engine(tmp_path)
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+            assert conn.execute(text("PRAGMA temp_store")).scalar() == 2  # MEMORY
+            assert conn.execute(text("PRAGMA query_only")).scalar() == 0
+        engine.dispose()
+
+    def test_read_only_rejects_writes(self, tmp_path):
+        writer = _file_engine(tmp_path)
+        with writer.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        reader = _file_engine(tmp_path, read_only=True)
+        with reader.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 0
+            with pytest.raises(OperationalError):
+                conn.execute(text("INSERT INTO t VALUES (1)"))
+        writer.dispose()
+        reader.dispose()
+
+    def test_reader_snapshot_does_not_block_writer(self, tmp_path):
+        writer = _file_engine(tmp_path)
+        with writer.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+        reader = _file_engine(tmp_path, read_only=True)
+        with reader.connect() as read_conn:
+            read_conn.exec_driver_sql("BEGIN")
+            assert read_conn.execute(text("SELECT count(*) FROM t")).scalar() == 1
+            with writer.begin() as conn:
+                conn.execute(text("INSERT INTO t VALUES (2)"))
+            # 読み取り中のトランザクションは開始時点のスナップショットを読み続ける
+            assert read_conn.execute(text("SELECT count(*) FROM t")).scalar() == 1
+            read_conn.exec_driver_sql("COMMIT")
+            assert read_conn.execute(text("SELECT count(*) FROM t")).scalar() == 2
+        writer.dispose()
+        reader.dispose()
+
+    def test_writer_locks_at_begin(self, tmp_path):
+        first = _file_engine(tmp_path)
+        with first.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        second = _file_engine(tmp_path)
+        with first.begin() as conn:
+            assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 0  # 読んだだけでもロックを持つ
+            other = second.raw_connection()
+            other.execute("PRAGMA busy_timeout=0")
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                other.execute("BEGIN IMMEDIATE")
+            other.close()
+        with second.begin() as conn:
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+        first.dispose()
+        second.dispose()
+
+
+class TestPoolArgs:
+    def test_file_database(self):
+        assert _pool_args("sqlite:///./voting_app.db", 7)["pool_size"] == 7
+
+    def test_memory_database(self):
+        assert _pool_args("sqlite://", 7) == {}
+        assert _pool_args("sqlite:///:memory:", 7) == {}
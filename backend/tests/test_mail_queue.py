@@ -0,0 +1,273 @@
+"""
+送信メールのキュー（app/mail_queue.py）のテスト
+
+ローカルの SMTP サーバー（aiosmtpd）を立てて実際に送信する。
+
+カバー範囲:
+- 複数のメールを1つの接続でまとめて送ること・一定時間メールがなければ切断すること
+- 一時的なエラーでは接続し直して送り直し、宛先の拒否では送り直さないこと
+- キューがいっぱいなら待ってから MailQueueFull を送出すること（登録 API は 503）
+- 確保した空きは put か cancel まで他のメールに使われないこと
+- 登録 API がキュー経由でアクティベーションメールを送ること・保存できなかった登録には送らないこと
+- キューがいっぱいなら登録をコミットしないこと（途中まで作られたユーザーが見えない）
+"""
+import asyncio
+import email
+import socket
+from email.message import EmailMessage
+
+import aiosmtplib
+import pytest
+from aiosmtpd.controller import Controller
+from fastapi.testclient import TestClient
+
+from app import models
+from app import password_hasher as hasher_module
+from app.config import settings
+from app.email_utils import send_activation_email
+from app.mail_queue import MailQueue, MailQueueFull, mail_queue
+
+from .conftest import override_get_db
+
+PASSWORD = "Test1234!"
+
+
+class _Handler:
+    """受け取ったメールを記録する。temporary_failures 回までは DATA に 451 を返す"""
+
+    def __init__(self):
+        self.messages: list[str] = []
+        self.sessions = 0
+        self.temporary_failures = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("rejected@"):
+            return "550 5.1.1 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.temporary_failures:
+            self.temporary_failures -= 1
+            return "451 4.3.0 Try again later"
+        self.messages.append(envelope.content.decode("utf-8", "replace"))
+        return "250 Message accepted"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = _Handler()
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    yield handler, controller.port
+    controller.stop()
+
+
+def _connector(port: int):
+    async def connect() -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(hostname="127.0.0.1", port=port, start_tls=False)
+        await smtp.connect()
+        return smtp
+    return connect
+
+
+def _queue(port: int, **kwargs) -> MailQueue:
+    options = dict(connections=1, max_size=100, batch_size=10, max_retries=2, backoff_seconds=0.01, idle_seconds=5)
+    options.update(kwargs)
+    return MailQueue(connect=_connector(port), **options)
+
+
+def _message(to: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "noreply@example.com"
+    message["To"] = to
+    message["Subject"] = "test"
+    message.set_content(f"hello {to}")
+    return message
+
+
+class TestMailQueue:
+    async def test_batches_over_one_connection(self, smtp_server):
+        handler, port = smtp_server
+        queue = _queue(port)
+        for i in range(25):
+            await queue.enqueue(_message(f"user{i}@example.com"))
+        await queue.stop()
+        assert len(handler.messages) == 25
+        stats = queue.stats()
+        assert stats["sent"] == 25
+        assert stats["connects"] == 1
+        assert handler.sessions == 1
+        assert 3 <= stats["batches"] < 25
+
+    async def test_idle_connection_closed(self, smtp_server):
+        handler, port = smtp_server
+        queue = _queue(port, idle_seconds=0.05)
+        await queue.enqueue(_message("a@example.com"))
+        await asyncio.sleep(0.2)
+        await queue.enqueue(_message("b@example.com"))
+        await queue.stop()
+        assert len(handler.messages) == 2
+        assert queue.stats()["connects"] == 2
+
+    async def test_temporary_failure_retried(self, smtp_server):
+        handler, port = smtp_server
+        handler.temporary_failures = 1
+        queue = _queue(port)
+        await queue.enqueue(_message("a@example.com"))
+        await queue.stop()
+        assert len(handler.messages) == 1
+        stats = queue.stats()
+        assert (stats["sent"], stats["retries"], stats["failed"], stats["connects"]) == (1, 1, 0, 2)
+
+    async def test_gives_up_after_max_retries(self, smtp_server):
+        handler, port = smtp_server
+        handler.temporary_failures = 10
+        queue = _queue(port, max_retries=2)
+        await queue.enqueue(_message("a@example.com"))
+        await queue.stop()
+        stats = queue.stats()
+        assert (stats["sent"], stats["retries"], stats["failed"]) == (0, 2, 1)
+
+    async def test_give_up_logs_note(self, smtp_server, caplog):
+        handler, port = smtp_server
+        handler.temporary_failures = 10
+        queue = _queue(port, max_retries=1)
+        await queue.enqueue(_message("a@example.com"), note="activation URL: http://example.com/auth/activate/t")
+        await queue.stop()
+        gave_up = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Gave up")]
+        assert gave_up == ["Gave up sending mail to a@example.com (activation URL: http://example.com/auth/activate/t)"]
+
+    async def test_rejected_recipient_not_retried(self, smtp_server):
+        handler, port = smtp_server
+        queue = _queue(port)
+        await queue.enqueue(_message("rejected@example.com"))
+        await queue.enqueue(_message("ok@example.com"))
+        await queue.stop()
+        assert len(handler.messages) == 1
+        stats = queue.stats()
+        assert (stats["sent"], stats["retries"], stats["failed"]) == (1, 0, 1)
+
+    async def test_backpressure(self):
+        connected = asyncio.Event()
+
+        async def stalled_connect():
+            connected.set()
+            await asyncio.sleep(3600)  # SMTP サーバーが応答しない
+
+        queue = MailQueue(
+            connect=stalled_connect, connections=1, max_size=1, batch_size=1,
+            max_retries=0, backoff_seconds=0, idle_seconds=5,
+        )
+        await queue.enqueue(_message("a@example.com"))  # 送信用タスクが取り出して接続を待つ
+        await connected.wait()
+        await queue.enqueue(_message("b@example.com"))  # キューに残る
+        with pytest.raises(MailQueueFull):
+            await queue.enqueue(_message("c@example.com"), timeout=0.05)
+        assert queue.stats()["queued"] == 1
+        assert queue.stats()["rejected"] == 1
+        await queue.stop(timeout=0)
+
+    async def test_reservation_holds_slot(self, smtp_server):
+        handler, port = smtp_server
+        queue = _queue(port, max_size=1)
+        reservation = await queue.reserve()
+        with pytest.raises(MailQueueFull):
+            await queue.reserve(timeout=0.05)
+        reservation.cancel()
+        reservation = await queue.reserve(timeout=0.05)  # 取り消した空きを使える
+        reservation.put(_message("a@example.com"))
+        reservation.cancel()  # put 済みなら何もしない
+        await queue.stop()
+        assert len(handler.messages) == 1
+
+
+class TestRegisterMail:
+    @pytest.fixture
+    def smtp_settings(self, smtp_server, monkeypatch):
+        handler, port = smtp_server
+        monkeypatch.setattr(settings, "DEV_MODE", False)
+        monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+        monkeypatch.setattr(settings, "SMTP_PORT", port)
+        monkeypatch.setattr(settings, "SMTP_START_TLS", False)
+        return handler
+
+    def test_register_sends_activation_mail(self, client: TestClient, smtp_settings):
+        resp = client.post(
+            "/api/auth/register",
+            json={"email": "new@example.com", "password": PASSWORD, "password_confirm": PASSWORD},
+        )
+        assert resp.status_code == 200
+        client.portal.call(mail_queue.stop)  # キューに残ったメールを送り切る
+
+        db = next(override_get_db())
+        token = db.query(models.User).filter(models.User.email == "new@example.com").one().activation_token
+        db.close()
+        assert len(smtp_settings.messages) == 1
+        message = email.message_from_string(smtp_settings.messages[0])
+        assert message["To"] == "new@example.com"
+        html = message.get_payload()[0].get_payload(decode=True).decode("utf-8")
+        assert f"/auth/activate/{token}" in html
+
+    def test_full_queue_rejects_registration(self, client: TestClient, smtp_settings, monkeypatch):
+        async def full(timeout=None):
+            raise MailQueueFull()
+
+        monkeypatch.setattr(mail_queue, "reserve", full)
+        resp = client.post(
+            "/api/auth/register",
+            json={"email": "new@example.com", "password": PASSWORD, "password_confirm": PASSWORD},
+        )
+        assert resp.status_code == 503
+        db = next(override_get_db())
+        assert db.query(models.User).count() == 0  # 送れない登録は保存しない
+        db.close()
+
+    def test_failed_commit_sends_no_mail(self, client: TestClient, smtp_settings, monkeypatch):
+        calls = []
+
+        class RecordingReservation:
+            def put(self, message, note=""):
+                calls.append("put")
+
+            def cancel(self):
+                calls.append("cancel")
+
+        async def reserve(timeout=None):
+            return RecordingReservation()
+
+        async def hash_during_concurrent_registration(password):
+            # 登録済みの確認からコミットまでの間に、同じメールアドレスの登録が保存される
+            db = next(override_get_db())
+            db.add(models.User(email="new@example.com", hashed_password="-"))
+            db.commit()
+            db.close()
+            return "hashed"
+
+        monkeypatch.setattr(mail_queue, "reserve", reserve)
+        monkeypatch.setattr(hasher_module.password_hasher, "hash", hash_during_concurrent_registration)
+        resp = client.post(
+            "/api/auth/register",
+            json={"email": "new@example.com", "password": PASSWORD, "password_confirm": PASSWORD},
+        )
+        assert resp.status_code == 409
+        assert calls == ["cancel"]  # 確保した空きは返す
+
+    async def test_dev_mode_skips_queue(self, monkeypatch):
+        async def unexpected(message, timeout=None, note=""):
+            raise AssertionError("DEV_MODE ではキューに入れない")
+
+        monkeypatch.setattr(mail_queue, "enqueue", unexpected)
+        monkeypatch.setattr(settings, "DEV_MODE", True)
+        await send_activation_email("dev@example.com", "token")
@@ -0,0 +1,117 @@
+"""
+メトリクス（app/metrics.py・GET /api/metrics）のテスト
+
+カバー範囲:
+- カウンター・ヒストグラムの Prometheus のテキスト形式（累積のバケット・ラベルのエスケープ）
+- ルートのテンプレート（接頭辞を含む）ごとのリクエスト数・一致しないパスの "unmatched"
+- 投票の受け付け・拒否の数、結果の確定時間（方式・投票数）、CSV の送信バイト数
+- エンジンのイベントによる SQL 文の種類ごとの実行時間
+- METRICS_ENABLED=False では 404（/api/stats も）。/api/health は稼働状態のみを返すこと
+"""
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+from app.metrics import (
+    CONTENT_TYPE,
+    Counter,
+    Histogram,
+    csv_export_bytes,
+    db_query_duration,
+    http_requests,
+    instrument_engine,
+    results_calculation_duration,
+    vote_submissions,
+)
+
+from .test_result_cache import _create_poll, _vote
+
+
+def _count(metric, *labels) -> float:
+    child = metric.labels(*labels)
+    return sum(child.counts) if isinstance(metric, Histogram) else child.value
+
+
+class TestFormat:
+    def test_counter(self):
+        counter = Counter("test_total", "Test counter", ("path",))
+        counter.labels('/a"b').inc()
+        counter.labels('/a"b').inc(2)
+        assert counter.render() == [
+            "# HELP test_total Test counter",
+            "# TYPE test_total counter",
+            'test_total{path="/a\\"b"} 3',
+        ]
+
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "Test histogram", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            histogram.labels().observe(value)
+        assert histogram.render()[2:] == [
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            "test_seconds_sum 4.25",
+            "test_seconds_count 4",
+        ]
+
+
+class TestEndpoint:
+    def test_route_templates(self, client: TestClient):
+        before = _count(http_requests, "GET", "/api/polls/{poll_id}", "401")
+        unmatched = _count(http_requests, "GET", "unmatched", "404")
+        client.get("/api/polls/123")
+        client.get("/api/no-such-route")
+        resp = client.get("/api/metrics")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == CONTENT_TYPE
+        assert _count(http_requests, "GET", "/api/polls/{poll_id}", "401") == before + 1
+        assert _count(http_requests, "GET", "unmatched", "404") == unmatched + 1
+        assert 'http_request_duration_seconds_bucket{method="GET",route="/api/polls/{poll_id}",le="+Inf"}' in resp.text
+        assert 'component_stat{component="result_cache",stat="hits"}' in resp.text
+
+    def test_votes_results_and_csv(self, auth_client: TestClient):
+        accepted = _count(vote_submissions, "accepted")
+        duplicate = _count(vote_submissions, "duplicate")
+        calculations = _count(results_calculation_duration, "plurality", "100")
+        sent = _count(csv_export_bytes, "identity")
+
+        poll = _create_poll(auth_client)
+        _vote(auth_client, poll, "voter-1")
+        resp = auth_client.post(
+            f"/api/vote/{poll['public_id']}", json={"vote_data": {"option_id": poll["options"][0]["id"]}}
+        )
+        assert resp.status_code == 409
+        assert auth_client.get(f"/api/polls/{poll['id']}/results").json()["total_votes"] == 1
+        csv = auth_client.get(f"/api/polls/{poll['id']}/results/csv", headers={"Accept-Encoding": "identity"})
+
+        assert _count(vote_submissions, "accepted") == accepted + 1
+        assert _count(vote_submissions, "duplicate") == duplicate + 1
+        assert _count(results_calculation_duration, "plurality", "100") == calculations + 1
+        assert _count(csv_export_bytes, "identity") == sent + len(csv.content)
+
+    def test_disabled(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+        assert client.get("/api/metrics").status_code == 404
+        assert client.get("/api/stats").status_code == 404
+        assert client.get("/api/health").status_code == 200
+
+    def test_health_is_liveness_only(self, client: TestClient):
+        # 内部の統計は /api/stats（nginx では公開しない）のみで返す
+        assert client.get("/api/health").json() == {"status": "ok"}
+        assert "mail_queue" in client.get("/api/stats").json()
+
+
+class TestDbQueries:
+    def test_statements_by_operation(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+        instrument_engine(engine, "test")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+            conn.execute(text("SELECT x FROM t")).all()
+            conn.execute(text("SELECT count(*) FROM t")).scalar()
+        engine.dispose()
+        assert _count(db_query_duration, "test", "SELECT") == 2
+        assert _count(db_query_duration, "test", "INSERT") == 1
+        assert _count(db_query_duration, "test", "OTHER") == 1  # CREATE TABLE
@@ -3,7 +3,7 @@
 
 カバー範囲:
 - POST   /api/polls/       作成
-- GET    /api/polls/       一覧
+- GET    /api/polls/       一覧（キーセットページング・投票数）
 - GET    /api/polls/{id}   取得
 - PUT    /api/polls/{id}   更新
 - DELETE /api/polls/{id}   削除
@@ -12,6 +12,8 @@
 """
 from fastapi.testclient import TestClient
 
+from .conftest import TestingReadSessionLocal
+
 
 POLL_BASE = {
     "title": "テスト投票",
@@ -63,6 +65,20 @@ class TestCreatePoll:
             poll = create_poll(auth_client, {"voting_method": method})
             assert poll["voting_method"] == method
 
+    def test_create_condorcet_completion(self, auth_client: TestClient):
+        poll = create_poll(
+            auth_client,
+            {"voting_method": "condorcet", "method_settings": {"completion": "schulze"}},
+        )
+        assert poll["method_settings"]["completion"] == "schulze"
+
+    def test_create_invalid_condorcet_completion(self, auth_client: TestClient):
+        resp = auth_client.post(
+            "/api/polls/",
+            json={**POLL_BASE, "voting_method": "condorcet", "method_settings": {"completion": "x"}},
+        )
+        assert resp.status_code == 422
+
 
 # --------------------------------------------------------------------------
 # 一覧・取得
@@ -106,6 +122,78 @@ class TestGetPolls:
         assert resp.status_code == 403
 
 
+class TestListPagination:
+    def _vote(self, client: TestClient, poll: dict, voter: str) -> None:
+        client.cookies.set("voter_id", voter)
+        resp = client.post(
+            f"/api/vote/{poll['public_id']}",
+            json={"vote_data": {"option_id": poll["options"][0]["id"]}},
+        )
+        assert resp.status_code == 200, resp.text
+
+    def test_pages_newest_first(self, auth_client: TestClient):
+        created = [create_poll(auth_client, {"title": f"投票{i}"})["id"] for i in range(5)]
+        seen = []
+        cursor = None
+        for expected in (2, 2, 1):
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            resp = auth_client.get("/api/polls/", params=params)
+            assert resp.status_code == 200
+            assert len(resp.json()) == expected
+            seen += [p["id"] for p in resp.json()]
+            cursor = resp.headers.get("x-next-cursor")
+        assert cursor is None
+        assert seen == created[::-1]
+
+    def test_invalid_cursor(self, auth_client: TestClient):
+        resp = auth_client.get("/api/polls/", params={"cursor": "!!"})
+        assert resp.status_code == 422
+
+    def test_vote_counts(self, auth_client: TestClient):
+        from app import models
+        from .conftest import override_get_db
+
+        first = create_poll(auth_client)
+        second = create_poll(auth_client)
+        for i in range(3):
+            self._vote(auth_client, first, f"voter-{i}")
+        self._vote(auth_client, second, "voter-0")
+        # 集計状態のない投票フォーム（導入前の投票のみ）は votes を数える
+        db = next(override_get_db())
+        db.query(models.PollTally).filter_by(poll_id=second["id"]).delete()
+        db.commit()
+        db.close()
+
+        counts = {p["id"]: p["vote_count"] for p in auth_client.get("/api/polls/").json()}
+        assert counts == {first["id"]: 3, second["id"]: 1}
+
+    def test_constant_query_count(self, auth_client: TestClient):
+        from sqlalchemy import event
+        from .conftest import read_engine
+
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        def list_queries() -> int:
+            statements.clear()
+            event.listen(read_engine.sync_engine, "before_cursor_execute", count)
+            try:
+                assert auth_client.get("/api/polls/").status_code == 200
+            finally:
+                event.remove(read_engine.sync_engine, "before_cursor_execute", count)
+            return len([s for s in statements if not s.startswith("PRAGMA")])
+
+        poll = create_poll(auth_client)
+        self._vote(auth_client, poll, "voter-0")
+        few = list_queries()
+        assert 0 < few <= 4  # ユーザー・投票フォーム・選択肢・投票数
+        for i in range(6):
+            self._vote(auth_client, create_poll(auth_client), f"voter-{i}")
+        assert list_queries() == few
+
+
 # --------------------------------------------------------------------------
 # 更新
 # --------------------------------------------------------------------------
@@ -216,6 +304,58 @@ class TestPollResults:
         assert "text/csv" in resp.headers["content-type"]
         assert "選択肢A" in resp.text or "選択肢B" in resp.text or "選択肢C" in resp.text
 
+    def test_csv_streams_in_batches_with_bom(self, auth_client: TestClient, monkeypatch):
+        from app.routers import polls
+        monkeypatch.setattr(polls, "STREAM_BATCH_SIZE", 2)
+        poll = create_poll(auth_client)
+        opt_id = poll["options"][1]["id"]
+        for i in range(5):
+            auth_client.cookies.set("voter_id", f"voter-{i}")
+            auth_client.post(f"/api/vote/{poll['public_id']}", json={"vote_data": {"option_id": opt_id}})
+
+        resp = auth_client.get(f"/api/polls/{poll['id']}/results/csv", headers={"Accept-Encoding": "identity"})
+        assert resp.status_code == 200
+        assert "content-encoding" not in resp.headers
+        assert resp.content.startswith(b"\xef\xbb\xbf")
+        lines = resp.content.decode("utf-8-sig").splitlines()
+        assert lines[0] == "投票番号,投票日時,選択肢"
+        assert [line.split(",")[0] for line in lines[1:]] == ["1", "2", "3", "4", "5"]
+        assert all(line.endswith("選択肢B") for line in lines[1:])
+
+    def test_csv_rows_read_in_dedicated_session(self, auth_client: TestClient, monkeypatch):
+        # 行はレスポンスの送信中に読むため、リクエストのセッションではなく専用のセッションで読む
+        from app.routers import polls
+        opened = []
+
+        def factory():
+            opened.append(1)
+            return TestingReadSessionLocal()
+
+        monkeypatch.setattr(polls, "read_session_factory", factory)
+        poll = create_poll(auth_client)
+        auth_client.post(
+            f"/api/vote/{poll['public_id']}",
+            json={"vote_data": {"option_id": poll["options"][0]["id"]}},
+        )
+        resp = auth_client.get(f"/api/polls/{poll['id']}/results/csv", headers={"Accept-Encoding": "identity"})
+        assert resp.status_code == 200
+        assert len(resp.content.decode("utf-8-sig").splitlines()) == 2
+        assert opened == [1]
+
+    def test_csv_gzip_on_request(self, auth_client: TestClient):
+        poll = create_poll(auth_client)
+        auth_client.post(
+            f"/api/vote/{poll['public_id']}",
+            json={"vote_data": {"option_id": poll["options"][0]["id"]}},
+        )
+        url = f"/api/polls/{poll['id']}/results/csv"
+        resp = auth_client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["content-encoding"] == "gzip"
+        # httpx が展開した内容は非圧縮のレスポンスと同じ
+        plain = auth_client.get(url, headers={"Accept-Encoding": "gzip;q=0"})
+        assert "content-encoding" not in plain.headers
+        assert resp.content == plain.content
+
     def test_results_requires_auth(self, client: TestClient):
         resp = client.get("/api/polls/1/results")
         assert resp.status_code == 401
@@ -0,0 +1,95 @@
+"""
+ログイン中のユーザーのキャッシュ（app/principal_cache.py）のテスト
+
+カバー範囲:
+- 有効期限・LRU・読み出し中の discard 後に古い内容を保存しないこと
+- 認証が必要なリクエストで2回目以降は users を読まないこと
+- is_active の変更（無効化）で即座に反映されること、DB を直接変更した場合は有効期限で反映されること
+"""
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, update
+
+from app import models
+from app.principal_cache import Principal, PrincipalCache, principal_cache
+
+from .conftest import async_engine, override_get_db, read_engine
+
+
+class TestPrincipalCache:
+    def test_hit_and_expiry(self):
+        cache = PrincipalCache(max_entries=10, ttl_seconds=0.05)
+        principal, generation = cache.lookup(1)
+        assert principal is None
+        cache.store(Principal(1, "a@example.com"), generation)
+        assert cache.lookup(1)[0] == Principal(1, "a@example.com")
+        time.sleep(0.06)
+        assert cache.lookup(1)[0] is None
+        assert cache.stats() == {"entries": 0, "hits": 1, "misses": 2}
+
+    def test_lru_eviction(self):
+        cache = PrincipalCache(max_entries=2, ttl_seconds=60)
+        for user_id in (1, 2):
+            cache.store(Principal(user_id, f"{user_id}@example.com"), cache.lookup(user_id)[1])
+        cache.lookup(1)
+        cache.store(Principal(3, "3@example.com"), cache.lookup(3)[1])
+        assert cache.lookup(2)[0] is None
+        assert cache.lookup(1)[0] is not None
+
+    def test_discard_during_load_skips_store(self):
+        cache = PrincipalCache(max_entries=10, ttl_seconds=60)
+        _, generation = cache.lookup(1)
+        cache.discard(1)  # DB から読み出している間に無効化された
+        cache.store(Principal(1, "a@example.com"), generation)
+        assert cache.lookup(1)[0] is None
+
+
+def _count_user_queries(statements: list):
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            statements.append(statement)
+    return before_cursor_execute
+
+
+class TestCurrentUser:
+    def test_repeated_requests_skip_users_query(self, auth_client: TestClient):
+        statements: list[str] = []
+        listener = _count_user_queries(statements)
+        engines = [async_engine.sync_engine, read_engine.sync_engine]
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", listener)
+        try:
+            for _ in range(3):
+                assert auth_client.get("/api/polls/").status_code == 200
+                assert auth_client.get("/api/auth/me").status_code == 200
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", listener)
+        assert len(statements) == 1  # 最初のリクエストのみ
+        assert principal_cache.stats()["hits"] >= 5
+
+    def test_deactivation_takes_effect_immediately(self, auth_client: TestClient):
+        assert auth_client.get("/api/auth/me").status_code == 200
+        db = next(override_get_db())
+        user = db.query(models.User).filter(models.User.email == "test@example.com").one()
+        user.is_active = False
+        db.commit()
+        db.close()
+        assert auth_client.get("/api/auth/me").status_code == 401
+
+    def test_direct_update_applies_after_ttl(self, auth_client: TestClient, monkeypatch):
+        assert auth_client.get("/api/auth/me").status_code == 200
+        db = next(override_get_db())
+        db.execute(update(models.User).values(is_active=False))  # ORM のイベントを通らない変更
+        db.commit()
+        db.close()
+        assert auth_client.get("/api/auth/me").status_code == 200
+
+        monkeypatch.setattr(principal_cache, "ttl_seconds", 0)
+        principal_cache.clear()  # 有効期限切れを再現する
+        assert auth_client.get("/api/auth/me").status_code == 401
+
+    def test_health_exposes_counters(self, client: TestClient):
+        stats = client.get("/api/stats").json()["principal_cache"]
+        assert set(stats) == {"entries", "hits", "misses"}
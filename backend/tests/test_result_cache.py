@@ -0,0 +1,164 @@
+"""
+集計結果キャッシュ（app/result_cache.py）のテスト
+
+カバー範囲:
+- LRU（件数・バイト数の上限）と hit/miss/eviction カウンター
+- 投票・編集による results_version の更新とキャッシュの無効化
+- stale-while-revalidate（古い結果を返し、バックグラウンドで再計算）
+- 既存DBへの results_version 列の追加（upgrade_schema）
+"""
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+from app.database import Base, upgrade_schema
+from app.result_cache import ResultCache, result_cache
+
+
+def _create_poll(client: TestClient) -> dict:
+    resp = client.post(
+        "/api/polls/",
+        json={
+            "title": "キャッシュテスト",
+            "description": "",
+            "voting_method": "plurality",
+            "options": ["A", "B"],
+            "method_settings": {},
+            "start_time": None,
+            "end_time": None,
+        },
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def _vote(client: TestClient, poll: dict, voter: str, index: int = 0) -> None:
+    client.cookies.set("voter_id", voter)
+    resp = client.post(
+        f"/api/vote/{poll['public_id']}",
+        json={"vote_data": {"option_id": poll["options"][index]["id"]}},
+    )
+    assert resp.status_code == 200, resp.text
+
+
+class TestResultCache:
+    def test_hit_and_version_miss(self):
+        cache = ResultCache(max_entries=10, max_bytes=10_000)
+        assert cache.lookup(1, 0) == (None, False)
+        cache.store(1, 0, {"total_votes": 1})
+        assert cache.lookup(1, 0) == ({"total_votes": 1}, False)
+        assert cache.lookup(1, 1) == (None, False)
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+
+    def test_lru_entry_limit(self):
+        cache = ResultCache(max_entries=2, max_bytes=10_000)
+        cache.store(1, 0, "a")
+        cache.store(2, 0, "b")
+        cache.lookup(1, 0)  # 1 を最近使ったことにする
+        cache.store(3, 0, "c")
+        assert cache.lookup(2, 0) == (None, False)
+        assert cache.lookup(1, 0)[0] == "a"
+        assert cache.stats()["evictions"] == 1
+
+    def test_byte_budget(self):
+        cache = ResultCache(max_entries=10, max_bytes=20)
+        cache.store(1, 0, "x" * 10)
+        cache.store(2, 0, "y" * 10)
+        assert cache.stats()["entries"] == 1
+        assert cache.stats()["evictions"] == 1
+        cache.store(3, 0, "z" * 100)  # 上限を超える値は保存しない
+        assert cache.lookup(3, 0) == (None, False)
+        assert cache.stats()["bytes"] == 12
+
+    def test_stale_entry_refreshed_once(self):
+        cache = ResultCache(max_entries=10, max_bytes=10_000, stale_seconds=60)
+        cache.store(1, 0, "old")
+        assert cache.lookup(1, 1) == ("old", True)
+        assert cache.lookup(1, 2) == ("old", False)  # 再計算はすでに引き受け済み
+        cache.store(1, 2, "new")
+        assert cache.lookup(1, 2) == ("new", False)
+        assert cache.stats()["stale_hits"] == 2
+
+    def test_older_result_does_not_replace_newer(self):
+        cache = ResultCache(max_entries=10, max_bytes=10_000)
+        cache.store(1, 3, "new")
+        cache.store(1, 2, "old")
+        assert cache.lookup(1, 3) == ("new", False)
+
+
+class TestResultsEndpointCache:
+    def test_repeated_refresh_hits_cache(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        _vote(auth_client, poll, "voter-1")
+        url = f"/api/polls/{poll['id']}/results"
+        first = auth_client.get(url).json()
+        second = auth_client.get(url).json()
+        assert first == second
+        stats = result_cache.stats()
+        assert (stats["misses"], stats["hits"]) == (1, 1)
+
+    def test_vote_invalidates(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        url = f"/api/polls/{poll['id']}/results"
+        _vote(auth_client, poll, "voter-1")
+        assert auth_client.get(url).json()["total_votes"] == 1
+        _vote(auth_client, poll, "voter-2", index=1)
+        assert auth_client.get(url).json()["total_votes"] == 2
+
+    def test_update_invalidates(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        url = f"/api/polls/{poll['id']}/results"
+        _vote(auth_client, poll, "voter-1")
+        assert auth_client.get(url).json()["result"]["ranked"][0]["text"] == "A"
+
+        resp = auth_client.put(
+            f"/api/polls/{poll['id']}",
+            json={
+                "title": "キャッシュテスト",
+                "description": "",
+                "options": ["A（改）", "B"],
+                "method_settings": {},
+                "start_time": None,
+                "end_time": None,
+            },
+        )
+        assert resp.status_code == 200, resp.text
+        assert auth_client.get(url).json()["result"]["ranked"][0]["text"] == "A（改）"
+
+    def test_stale_while_revalidate(self, auth_client: TestClient, monkeypatch):
+        monkeypatch.setattr(result_cache, "stale_seconds", 60)
+        poll = _create_poll(auth_client)
+        url = f"/api/polls/{poll['id']}/results"
+        _vote(auth_client, poll, "voter-1")
+        assert auth_client.get(url).json()["total_votes"] == 1
+
+        _vote(auth_client, poll, "voter-2")
+        # 古い結果を返し、レスポンス後のバックグラウンドタスクで再計算する
+        assert auth_client.get(url).json()["total_votes"] == 1
+        assert auth_client.get(url).json()["total_votes"] == 2
+        assert result_cache.stats()["stale_hits"] == 1
+
+    def test_health_exposes_counters(self, client: TestClient):
+        stats = client.get("/api/stats").json()["result_cache"]
+        assert set(stats) == {"entries", "bytes", "hits", "stale_hits", "misses", "evictions"}
+
+
+class TestUpgradeSchema:
+    def test_adds_missing_column(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            # results_version 列の追加前に作られたDBを再現する
+            conn.execute(text("ALTER TABLE polls DROP COLUMN results_version"))
+            conn.execute(text(
+                "INSERT INTO polls (id, public_id, title, voting_method, creator_id) "
+                "VALUES (1, 'p', 'old', 'plurality', 1)"
+            ))
+
+        upgrade_schema(engine)
+
+        columns = {c["name"] for c in inspect(engine).get_columns("polls")}
+        assert "results_version" in columns
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT results_version FROM polls")).scalar() == 0
+        engine.dispose()
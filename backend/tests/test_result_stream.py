@@ -0,0 +1,231 @@
+"""
+結果のライブ配信（app/result_stream.py・GET /api/polls/{id}/results/stream）のテスト
+
+カバー範囲:
+- 連続した notify を1回の計算にまとめ、同じメッセージを全購読者に配ること
+- 送信が追いつかない購読者には最新のメッセージだけを渡すこと
+- 購読者のいない投票フォームへの notify・購読解除後の後片付け
+- エンドポイント: 接続直後の結果、投票後の更新、削除時の deleted イベント、keepalive、切断時の購読解除
+
+StreamingResponse の本文は TestClient・httpx.ASGITransport では応答の完了まで読めないため、
+エンドポイントのテストは ASGI アプリを直接呼び出して送信されたチャンクを順に読む。
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.result_stream import ResultBroadcaster, format_event, result_broadcaster
+
+from .test_result_cache import _create_poll
+
+COALESCE_SECONDS = 0.3
+
+
+class _Counter:
+    """呼ばれた回数をメッセージにして返す compute"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self) -> bytes:
+        self.calls += 1
+        return format_event("results", str(self.calls))
+
+
+class TestBroadcaster:
+    async def test_notifies_coalesced_into_one_computation(self):
+        broadcaster = ResultBroadcaster(coalesce_seconds=0.05)
+        compute = _Counter()
+        subscriber = broadcaster.subscribe(1, compute)
+        for _ in range(10):
+            broadcaster.notify(1)
+        assert await subscriber.next(1.0) == format_event("results", "1")
+        assert compute.calls == 1
+
+    async def test_fan_out_computes_once(self):
+        broadcaster = ResultBroadcaster(coalesce_seconds=0.01)
+        compute = _Counter()
+        subscribers = [broadcaster.subscribe(1, compute) for _ in range(300)]
+        broadcaster.notify(1)
+        messages = await asyncio.gather(*[s.next(1.0) for s in subscribers])
+        assert set(messages) == {format_event("results", "1")}
+        assert broadcaster.stats() == {"polls": 1, "subscribers": 300, "computations": 1, "messages": 300}
+
+    async def test_slow_subscriber_gets_latest_only(self):
+        broadcaster = ResultBroadcaster(coalesce_seconds=0.01)
+        compute = _Counter()
+        subscriber = broadcaster.subscribe(1, compute)
+        for _ in range(3):
+            broadcaster.notify(1)
+            await asyncio.sleep(0.05)  # 購読者は読まずに待たせる
+        assert compute.calls == 3
+        assert await subscriber.next(1.0) == format_event("results", "3")
+        assert await subscriber.next(0.05) is None
+
+    async def test_notify_without_subscribers_is_noop(self):
+        broadcaster = ResultBroadcaster(coalesce_seconds=0.01)
+        broadcaster.notify(1)
+        assert not broadcaster._tasks
+
+    async def test_unsubscribe_cleans_up(self):
+        broadcaster = ResultBroadcaster(coalesce_seconds=0.01)
+        compute = _Counter()
+        subscriber = broadcaster.subscribe(1, compute)
+        broadcaster.notify(1)
+        broadcaster.unsubscribe(1, subscriber)
+        await asyncio.sleep(0.05)
+        assert compute.calls == 0
+        assert broadcaster.stats()["polls"] == 0
+        assert not broadcaster._tasks
+
+    async def test_deleted_poll_closes_subscribers(self):
+        broadcaster = ResultBroadcaster(coalesce_seconds=0.01)
+
+        async def deleted():
+            return None
+
+        subscriber = broadcaster.subscribe(1, deleted)
+        broadcaster.notify(1)
+        assert await subscriber.next(1.0) is None
+        assert subscriber.closed
+
+    async def test_failed_computation_keeps_subscribers(self):
+        broadcaster = ResultBroadcaster(coalesce_seconds=0.01)
+
+        async def failing():
+            raise RuntimeError("boom")
+
+        subscriber = broadcaster.subscribe(1, failing)
+        broadcaster.notify(1)
+        assert await subscriber.next(0.1) is None
+        assert not subscriber.closed
+        assert not broadcaster._tasks
+
+
+class _Stream:
+    """ASGI アプリを直接呼び出して SSE の応答をチャンクごとに読む"""
+
+    def __init__(self, path: str, cookies: dict):
+        cookie = "; ".join(f"{k}={v}" for k, v in cookies.items())
+        self.scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+            "client": ("127.0.0.1", 1234),
+            "server": ("testserver", 80),
+        }
+        self.sent: asyncio.Queue = asyncio.Queue()
+        self.disconnected = asyncio.Event()
+        self.requested = False
+        self.task = asyncio.create_task(app(self.scope, self._receive, self.sent.put))
+
+    async def _receive(self):
+        if not self.requested:
+            self.requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def start(self) -> dict:
+        message = await asyncio.wait_for(self.sent.get(), 2.0)
+        assert message["type"] == "http.response.start"
+        return {k.decode(): v.decode() for k, v in message["headers"]} | {"status": message["status"]}
+
+    async def chunk(self, timeout: float = 2.0) -> bytes:
+        message = await asyncio.wait_for(self.sent.get(), timeout)
+        assert message["type"] == "http.response.body"
+        return message["body"]
+
+    async def close(self) -> None:
+        self.disconnected.set()
+        await asyncio.wait_for(self.task, 2.0)
+
+
+def _parse(chunk: bytes) -> tuple[str, dict]:
+    fields = dict(
+        line.split(": ", 1) for line in chunk.decode("utf-8").splitlines() if ": " in line
+    )
+    return fields["event"], json.loads(fields["data"])
+
+
+@pytest.fixture
+def coalesce(monkeypatch):
+    monkeypatch.setattr(result_broadcaster, "coalesce_seconds", COALESCE_SECONDS)
+
+
+class TestStreamEndpoint:
+    async def test_initial_update_and_delete(self, auth_client: TestClient, coalesce):
+        poll = _create_poll(auth_client)
+        path = f"/api/polls/{poll['id']}/results/stream"
+        computations = result_broadcaster.computations
+        streams = [_Stream(path, dict(auth_client.cookies)) for _ in range(2)]
+
+        for stream in streams:
+            headers = await stream.start()
+            assert headers["status"] == 200
+            assert headers["content-type"].startswith("text/event-stream")
+            assert headers["cache-control"] == "no-cache"
+            first = await stream.chunk()
+            assert first.startswith(b"retry: 3000\n")
+            event, data = _parse(first)
+            assert event == "results"
+            assert data["total_votes"] == 0
+            assert data["poll"]["id"] == poll["id"]
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            for i in range(3):
+                client.cookies.set("voter_id", f"voter-{i}")
+                resp = await client.post(
+                    f"/api/vote/{poll['public_id']}",
+                    json={"vote_data": {"option_id": poll["options"][0]["id"]}},
+                )
+                assert resp.status_code == 200, resp.text
+
+            # 3票は1回の更新にまとまり、全接続に同じ結果が届く
+            updates = [await stream.chunk() for stream in streams]
+            assert updates[0] == updates[1]
+            event, data = _parse(updates[0])
+            assert event == "results"
+            assert data["total_votes"] == 3
+            assert data["result"]["ranked"][0]["text"] == "A"
+            assert result_broadcaster.computations == computations + 1
+
+            client.cookies.clear()
+            client.cookies.update(auth_client.cookies)
+            assert (await client.delete(f"/api/polls/{poll['id']}")).status_code == 200
+
+        for stream in streams:
+            assert (await stream.chunk())[: len(b"event: deleted")] == b"event: deleted"
+            await stream.close()
+        assert result_broadcaster.stats()["subscribers"] == 0
+
+    async def test_keepalive_and_disconnect(self, auth_client: TestClient, monkeypatch):
+        monkeypatch.setattr(settings, "RESULTS_STREAM_KEEPALIVE_SECONDS", 0.05)
+        poll = _create_poll(auth_client)
+        stream = _Stream(f"/api/polls/{poll['id']}/results/stream", dict(auth_client.cookies))
+        await stream.start()
+        await stream.chunk()
+        assert await stream.chunk() == b": keepalive\n\n"
+        assert result_broadcaster.stats()["subscribers"] == 1
+        await stream.close()
+        assert result_broadcaster.stats()["subscribers"] == 0
+
+    def test_requires_login(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        auth_client.cookies.clear()
+        resp = auth_client.get(f"/api/polls/{poll['id']}/results/stream")
+        assert resp.status_code == 401
+        assert result_broadcaster.stats()["subscribers"] == 0
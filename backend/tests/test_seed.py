@@ -0,0 +1,80 @@
+"""
+大規模なデータベースを作るコマンド（scripts/seed.py）のテスト
+
+カバー範囲:
+- 指定した件数のユーザー・投票フォーム・選択肢・投票が書き込まれること
+- 書き込んだ集計状態・ballot_entries が全票からの再集計と一致すること
+- 既存のデータに追加で書き込めること（ID・公開ID が重ならない）
+- 作成したユーザーが SEED_PASSWORD でログインできる形式であること
+- Docker イメージと同じく app/ と scripts/ のみで実行できること（benchmarks/ に依存しない）
+"""
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.auth import verify_password
+from app.ballot_entries import sql_state
+from app.tally import PATTERN_KEYS, recount_poll
+from app.voting import TALLIES
+from scripts.seed import SEED_PASSWORD, main
+
+
+def _seed(url: str, *extra: str) -> None:
+    args = ["--database", url, "--users", "3", "--polls-per-method", "2", "--options", "4", "--votes", "30"]
+    assert main(args + ["--batch-size", "7", "--commit-every", "50", *extra]) == 0
+
+
+def _count(db: Session, model) -> int:
+    return db.scalar(select(func.count()).select_from(model))
+
+
+class TestSeed:
+    def test_counts_and_consistent_tallies(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'seed.db'}"
+        _seed(url, "--distribution", "polarized")
+        engine = create_engine(url)
+        with Session(engine) as db:
+            assert _count(db, models.User) == 3
+            assert _count(db, models.Poll) == 2 * len(TALLIES)
+            assert _count(db, models.PollOption) == 4 * 2 * len(TALLIES)
+            assert _count(db, models.Vote) == 30 * 2 * len(TALLIES)
+            for poll in db.scalars(select(models.Poll)):
+                assert poll.tally.vote_count == 30
+                assert PATTERN_KEYS.get(poll.voting_method) not in poll.tally.state
+                assert recount_poll(db, poll, fix=False)
+                state = sql_state(db, poll)
+                assert state is None or state == poll.tally.state
+            user = db.scalars(select(models.User)).first()
+            assert user.is_active
+            assert verify_password(SEED_PASSWORD, user.hashed_password)
+        engine.dispose()
+
+    def test_appends_to_existing_data(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'seed.db'}"
+        _seed(url, "--methods", "plurality")
+        _seed(url, "--methods", "plurality", "irv")
+        engine = create_engine(url)
+        with Session(engine) as db:
+            assert _count(db, models.User) == 6
+            assert _count(db, models.Poll) == 6
+            assert db.scalar(select(func.count(func.distinct(models.Poll.public_id)))) == 6
+            assert _count(db, models.Vote) == 6 * 30
+            assert all(recount_poll(db, poll, fix=False) for poll in db.scalars(select(models.Poll)))
+        engine.dispose()
+
+    def test_runs_without_benchmarks(self, tmp_path):
+        # Dockerfile は app/ と scripts/ のみをコピーする
+        backend = Path(__file__).resolve().parents[1]
+        for name in ("app", "scripts"):
+            shutil.copytree(backend / name, tmp_path / name, ignore=shutil.ignore_patterns("__pycache__"))
+        url = f"sqlite:///{tmp_path / 'seed.db'}"
+        args = ["--database", url, "--users", "1", "--polls-per-method", "1", "--votes", "5", "--methods", "irv"]
+        proc = subprocess.run(
+            [sys.executable, "-m", "scripts.seed", *args], cwd=tmp_path, capture_output=True, text=True
+        )
+        assert proc.returncode == 0, proc.stderr
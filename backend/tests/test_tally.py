@@ -0,0 +1,476 @@
+"""
+集計状態（app/tally.py・poll_tallies）のテスト
+
+カバー範囲:
+- 投票ごとの加算結果が全票再集計（calculate_results）と一致すること
+- POST /api/vote/{public_id} と同じトランザクションでの集計状態の更新
+- 集計状態のない投票フォームの再構築（起動時に保存する build_missing_tallies）・再集計コマンドによる検証
+- 順位付き投票のパターンを poll_tally_patterns の行に持つこと（投票ごとの加算・以前の版の JSON からの移行・削除、
+  パターンを保存していなかった版の集計状態の起動時の再構築）
+- 分割して集計した部分集計状態の合算（merge）・プロセス並列集計
+- 再集計コマンドの検証（読み取り専用のスナップショット）と置き換え（書き込みのロックはその間だけ）
+- 読み取り用のセッションが集計状態とパターンの行を同じスナップショットから読むこと
+"""
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from app import models
+from app import tally as tally_module
+from app.database import Base, configure_sqlite
+from app.result_cache import result_cache
+from app.tally import (
+    build_missing_tallies,
+    check_poll,
+    load_tally,
+    record_vote,
+    recount_poll,
+    replace_tally,
+    stream_vote_data,
+)
+from app.voting import TALLIES, calculate_results
+from app.voting_parallel import parallel_state
+
+from .conftest import engine, override_get_db
+
+OPTIONS = [{"id": i, "text": t, "order_index": i - 1} for i, t in enumerate("ABC", 1)]
+
+
+def make_ballots(method: str, a: int, b: int, c: int) -> list:
+    """選択肢ID a, b, c に対する方式ごとのテスト用投票データ"""
+    return {
+        "plurality": [{"option_id": a}, {"option_id": b}, {"option_id": a}],
+        "approval": [{"option_ids": [a, b]}, {"option_ids": [b]}, {"option_ids": []}],
+        "borda": [
+            {"rankings": {str(a): 1, str(b): 2, str(c): 3}},
+            {"rankings": {str(b): 1, str(c): 2, str(a): 3}},
+        ],
+        "irv": [{"order": [a, b, c]}, {"order": [b, a, c]}, {"order": [c, b, a]}, {"order": [a, b, c]}],
+        "condorcet": [{"order": [a, b, c]}, {"order": [b, c, a]}, {"order": [c, a, b]}],
+        "score": [{"scores": {str(a): 5, str(b): 3}}, {"scores": {str(a): 2, str(c): 4}}],
+        "majority_judgement": [
+            {"grades": {str(a): "優秀", str(b): "拒否", str(c): "良い"}},
+            {"grades": {str(a): "許容", str(b): "良い"}},
+        ],
+        "quadratic": [{"votes": {str(a): 3, str(b): 1}}, {"votes": {str(b): 2}}],
+        "negative": [{"votes": {str(a): 1, str(b): -1}}, {"votes": {str(a): -1, str(c): 1}}],
+    }[method]
+
+
+def _create_poll(client: TestClient, method: str) -> dict:
+    resp = client.post(
+        "/api/polls/",
+        json={
+            "title": "集計テスト",
+            "description": "",
+            "voting_method": method,
+            "options": ["A", "B", "C"],
+            "method_settings": {},
+            "start_time": None,
+            "end_time": None,
+        },
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+# --------------------------------------------------------------------------
+# アルゴリズム単体: 加算して finalize した結果 = 全票の一括集計
+# --------------------------------------------------------------------------
+
+class TestTallySteps:
+    @pytest.mark.parametrize("method", list(TALLIES))
+    def test_incremental_matches_batch(self, method):
+        tally = TALLIES[method]
+        state = tally.init()
+        ballots = make_ballots(method, 1, 2, 3)
+        for vote_data in ballots:
+            tally.accumulate(state, vote_data)
+            # JSON で保存・復元しても集計を継続できる
+            state = json.loads(json.dumps(state))
+        votes = [{"vote_data": d} for d in ballots]
+        assert tally.finalize(state, OPTIONS) == calculate_results(method, votes, OPTIONS)
+
+    @pytest.mark.parametrize("method", list(TALLIES))
+    def test_empty_state(self, method):
+        tally = TALLIES[method]
+        assert tally.finalize(tally.init(), OPTIONS) == calculate_results(method, [], OPTIONS)
+
+
+def random_ballots(method: str, n: int, rng: random.Random) -> list:
+    """選択肢 1〜3 に対するランダムな投票データ（未投票・部分的な投票を含む）"""
+    ballots = []
+    for _ in range(n):
+        a, b, c = rng.sample([1, 2, 3], 3)
+        pool = make_ballots(method, a, b, c)
+        ballots.append(rng.choice(pool))
+    return ballots
+
+
+class TestMergeTallies:
+    @pytest.mark.parametrize("method", list(TALLIES))
+    @pytest.mark.parametrize("seed", range(5))
+    def test_merged_equals_single_pass(self, method, seed):
+        rng = random.Random(seed)
+        tally = TALLIES[method]
+        ballots = random_ballots(method, rng.randint(0, 60), rng)
+
+        single = tally.init()
+        for vote_data in ballots:
+            tally.accumulate(single, vote_data)
+
+        # ランダムな位置で分割し、部分集計状態を（JSON 往復させてから）合算する
+        cuts = sorted(rng.sample(range(len(ballots) + 1), min(3, len(ballots) + 1)))
+        merged = tally.init()
+        for start, end in zip([0] + cuts, cuts + [len(ballots)]):
+            part = tally.init()
+            for vote_data in ballots[start:end]:
+                tally.accumulate(part, vote_data)
+            tally.merge(merged, json.loads(json.dumps(part)))
+
+        assert merged == single
+        assert tally.finalize(merged, OPTIONS) == tally.finalize(single, OPTIONS)
+
+    @pytest.mark.parametrize("method", ["irv", "majority_judgement", "score"])
+    def test_parallel_matches_calculate_results(self, method):
+        ballots = random_ballots(method, 200, random.Random(3))
+        expected = calculate_results(method, [{"vote_data": d} for d in ballots], OPTIONS, engine="python")
+        state = parallel_state(method, ballots, workers=2, chunk_size=37)
+        assert TALLIES[method].finalize(state, OPTIONS) == expected
+
+
+# --------------------------------------------------------------------------
+# API: 投票送信で集計状態が更新され、結果は集計状態から返される
+# --------------------------------------------------------------------------
+
+class TestPersistedTally:
+    @pytest.mark.parametrize("method", list(TALLIES))
+    def test_results_match_full_recount(self, auth_client: TestClient, method):
+        poll = _create_poll(auth_client, method)
+        ids = [o["id"] for o in poll["options"]]
+        options = [{"id": o["id"], "text": o["text"], "order_index": o["order_index"]} for o in poll["options"]]
+        ballots = make_ballots(method, *ids)
+
+        for i, vote_data in enumerate(ballots):
+            auth_client.cookies.set("voter_id", f"voter-{i}")
+            resp = auth_client.post(f"/api/vote/{poll['public_id']}", json={"vote_data": vote_data})
+            assert resp.status_code == 200, resp.text
+
+        resp = auth_client.get(f"/api/polls/{poll['id']}/results")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["total_votes"] == len(ballots)
+
+        expected = calculate_results(method, [{"vote_data": d} for d in ballots], options)
+        assert data["result"] == json.loads(json.dumps(expected))
+        assert data["poll"]["vote_count"] == len(ballots)
+
+        # 集計状態を使わずカーソルから全票を読み出して集計しても同じ結果
+        resp = auth_client.get(f"/api/polls/{poll['id']}/results", params={"recount": "true"})
+        assert resp.json()["result"] == data["result"]
+
+    def test_stream_vote_data_in_batches(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "plurality")
+        ids = [o["id"] for o in poll["options"]]
+        for i, opt_id in enumerate([ids[0], ids[1], ids[2], ids[0], ids[1]]):
+            auth_client.cookies.set("voter_id", f"voter-{i}")
+            auth_client.post(f"/api/vote/{poll['public_id']}", json={"vote_data": {"option_id": opt_id}})
+
+        db = next(override_get_db())
+        streamed = list(stream_vote_data(db, poll["id"], batch_size=2))
+        db.close()
+        assert [d["option_id"] for d in streamed] == [ids[0], ids[1], ids[2], ids[0], ids[1]]
+
+    def test_invalid_vote_data_rejected(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "score")
+        resp = auth_client.post(
+            f"/api/vote/{poll['public_id']}",
+            json={"vote_data": {"scores": {"not-an-id": 3}}},
+        )
+        assert resp.status_code == 422
+
+        resp = auth_client.get(f"/api/polls/{poll['id']}/results")
+        assert resp.json()["total_votes"] == 0
+
+    def test_missing_tally_is_rebuilt(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "plurality")
+        opt_id = poll["options"][1]["id"]
+        auth_client.post(f"/api/vote/{poll['public_id']}", json={"vote_data": {"option_id": opt_id}})
+
+        db = next(override_get_db())
+        db.query(models.PollTally).delete()
+        db.commit()
+        db.close()
+
+        resp = auth_client.get(f"/api/polls/{poll['id']}/results")
+        data = resp.json()
+        assert data["total_votes"] == 1
+        assert data["result"]["winner_id"] == opt_id
+
+    def test_missing_tallies_built_once(self, auth_client: TestClient):
+        voted = _create_poll(auth_client, "irv")
+        ids = [o["id"] for o in voted["options"]]
+        auth_client.post(f"/api/vote/{voted['public_id']}", json={"vote_data": {"order": ids}})
+        empty = _create_poll(auth_client, "irv")
+
+        db = next(override_get_db())
+        db.query(models.PollTally).delete()
+        db.commit()
+
+        # 投票のある投票フォームのみ作って保存する。2回目は作るものがない
+        assert build_missing_tallies(engine) == 1
+        assert build_missing_tallies(engine) == 0
+        rows = {row.poll_id: row for row in db.query(models.PollTally).all()}
+        db.close()
+        assert set(rows) == {voted["id"]}
+        assert rows[voted["id"]].vote_count == 1
+        assert empty["id"] not in rows
+
+        data = auth_client.get(f"/api/polls/{voted['id']}/results").json()
+        assert data["total_votes"] == 1
+        assert data["result"]["winner_id"] == ids[0]
+
+    def test_recount_detects_and_fixes_drift(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "approval")
+        ids = [o["id"] for o in poll["options"]]
+        auth_client.post(f"/api/vote/{poll['public_id']}", json={"vote_data": {"option_ids": ids[:2]}})
+
+        db = next(override_get_db())
+        row = db.query(models.PollTally).filter(models.PollTally.poll_id == poll["id"]).one()
+        row.state = {**row.state, "counts": {}}
+        db.commit()
+
+        db_poll = db.get(models.Poll, poll["id"])
+        assert recount_poll(db, db_poll, fix=False) is False
+        assert recount_poll(db, db_poll, fix=True) is False
+        db.commit()
+        assert recount_poll(db, db_poll, fix=False) is True
+        assert recount_poll(db, db_poll, fix=False, workers=2) is True
+        db.close()
+
+        resp = auth_client.get(f"/api/polls/{poll['id']}/results")
+        scores = {r["id"]: r["score"] for r in resp.json()["result"]["ranked"]}
+        assert scores[ids[0]] == 1
+
+
+def _patterns(db, poll_id: int) -> dict:
+    rows = db.query(models.PollTallyPattern).filter(models.PollTallyPattern.poll_id == poll_id).all()
+    return {row.pattern: row.count for row in rows}
+
+
+class TestPatternRows:
+    def _vote_all(self, client: TestClient, poll: dict, ballots: list, start: int = 0) -> None:
+        for i, vote_data in enumerate(ballots, start):
+            client.cookies.set("voter_id", f"voter-{i}")
+            resp = client.post(f"/api/vote/{poll['public_id']}", json={"vote_data": vote_data})
+            assert resp.status_code == 200, resp.text
+
+    def test_irv_patterns_stored_as_rows(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "irv")
+        a, b, c = (o["id"] for o in poll["options"])
+        self._vote_all(auth_client, poll, make_ballots("irv", a, b, c))
+
+        db = next(override_get_db())
+        row = db.query(models.PollTally).filter(models.PollTally.poll_id == poll["id"]).one()
+        assert row.state == {"total": 4}  # 投票ごとに書き直す JSON はパターン数によらない
+        assert _patterns(db, poll["id"]) == {f"{a},{b},{c}": 2, f"{b},{a},{c}": 1, f"{c},{b},{a}": 1}
+        db_poll = db.get(models.Poll, poll["id"])
+        assert recount_poll(db, db_poll, fix=False) is True
+        db.close()
+
+        auth_client.delete(f"/api/polls/{poll['id']}")
+        db = next(override_get_db())
+        assert _patterns(db, poll["id"]) == {}
+        db.close()
+
+    def test_legacy_json_patterns_moved_to_rows(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "irv")
+        a, b, c = (o["id"] for o in poll["options"])
+        ballots = make_ballots("irv", a, b, c)
+        self._vote_all(auth_client, poll, ballots[:2])
+        expected = auth_client.get(f"/api/polls/{poll['id']}/results").json()["result"]
+
+        # 以前の版の形式（パターンを JSON に保存し、行はない）
+        db = next(override_get_db())
+        db.query(models.PollTallyPattern).delete()
+        row = db.query(models.PollTally).filter(models.PollTally.poll_id == poll["id"]).one()
+        row.state = {"total": 2, "ballots": {f"{a},{b},{c}": 1, f"{b},{a},{c}": 1}}
+        db.commit()
+        db_poll = db.get(models.Poll, poll["id"])
+        assert recount_poll(db, db_poll, fix=False) is True
+        db.rollback()
+
+        result_cache.discard(poll["id"])
+        assert auth_client.get(f"/api/polls/{poll['id']}/results").json()["result"] == expected
+
+        self._vote_all(auth_client, poll, ballots[2:], start=2)
+        db.expire_all()
+        row = db.query(models.PollTally).filter(models.PollTally.poll_id == poll["id"]).one()
+        assert row.state == {"total": 4}
+        assert _patterns(db, poll["id"]) == {f"{a},{b},{c}": 2, f"{b},{a},{c}": 1, f"{c},{b},{a}": 1}
+        db.close()
+
+    def test_recount_fixes_pattern_rows(self, auth_client: TestClient):
+        poll = _create_poll(auth_client, "irv")
+        a, b, c = (o["id"] for o in poll["options"])
+        self._vote_all(auth_client, poll, make_ballots("irv", a, b, c))
+
+        db = next(override_get_db())
+        db.query(models.PollTallyPattern).filter(models.PollTallyPattern.poll_id == poll["id"]).delete()
+        db.add(models.PollTallyPattern(poll_id=poll["id"], pattern="999", count=4))
+        db.commit()
+        db_poll = db.get(models.Poll, poll["id"])
+        assert recount_poll(db, db_poll, fix=True) is False
+        db.commit()
+        assert _patterns(db, poll["id"]) == {f"{a},{b},{c}": 2, f"{b},{a},{c}": 1, f"{c},{b},{a}": 1}
+        assert "ballots" not in db_poll.tally.state
+        assert recount_poll(db, db_poll, fix=False) is True
+        db.close()
+
+    @pytest.mark.parametrize("method", ["borda", "condorcet"])
+    def test_ranked_patterns_stored_as_rows(self, auth_client: TestClient, method):
+        poll = _create_poll(auth_client, method)
+        ids = [o["id"] for o in poll["options"]]
+        ballots = make_ballots(method, *ids)
+        self._vote_all(auth_client, poll, ballots + ballots[:1])
+
+        db = next(override_get_db())
+        row = db.query(models.PollTally).filter(models.PollTally.poll_id == poll["id"]).one()
+        assert "ballots" not in row.state
+        assert sorted(_patterns(db, poll["id"]).values()) == [1] * (len(ballots) - 1) + [2]
+        db.close()
+
+        profile = auth_client.get(f"/api/polls/{poll['id']}/results").json()["result"]["details"]["profile"]
+        assert profile == {
+            "ballots": len(ballots) + 1,
+            "distinct_ballots": len(ballots),
+            "duplication_ratio": round((len(ballots) + 1) / len(ballots), 2),
+        }
+
+    @pytest.mark.parametrize("method", ["borda", "condorcet"])
+    def test_state_without_patterns_rebuilt_at_startup(self, auth_client: TestClient, method):
+        poll = _create_poll(auth_client, method)
+        ids = [o["id"] for o in poll["options"]]
+        self._vote_all(auth_client, poll, make_ballots(method, *ids))
+        expected = auth_client.get(f"/api/polls/{poll['id']}/results").json()["result"]
+
+        # 投票パターンを保存していなかった版の集計状態（JSON にも行にもパターンがない）
+        db = next(override_get_db())
+        db.query(models.PollTallyPattern).filter(models.PollTallyPattern.poll_id == poll["id"]).delete()
+        db.commit()
+        assert build_missing_tallies(engine) == 1
+        assert build_missing_tallies(engine) == 0
+        db_poll = db.get(models.Poll, poll["id"])
+        assert recount_poll(db, db_poll, fix=False) is True
+        db.close()
+
+        result_cache.discard(poll["id"])
+        assert auth_client.get(f"/api/polls/{poll['id']}/results").json()["result"] == expected
+
+
+# --------------------------------------------------------------------------
+# 再集計コマンド（scripts/recount）: スナップショットで検証し、置き換える間だけ書き込みのロックを取る
+# --------------------------------------------------------------------------
+
+class TestRecountSnapshot:
+    def _engines(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'app.db'}"
+        writer = create_engine(url)
+        configure_sqlite(writer)
+        reader = create_engine(url)
+        configure_sqlite(reader, read_only=True, snapshot=True)
+        Base.metadata.create_all(bind=writer)
+        return writer, reader
+
+    def _vote(self, writer, poll_id: int, voter: str, option_id: int) -> None:
+        with Session(writer) as db:
+            poll = db.get(models.Poll, poll_id)
+            vote_data = {"option_id": option_id}
+            record_vote(db, poll, vote_data)
+            db.add(models.Vote(poll_id=poll_id, voter_fingerprint=voter, vote_data=vote_data))
+            db.commit()
+
+    def test_check_reads_snapshot_and_replace_catches_up(self, tmp_path):
+        writer, reader = self._engines(tmp_path)
+        with Session(writer) as db:
+            poll = models.Poll(title="再集計", voting_method="plurality", creator_id=1)
+            poll.options = [models.PollOption(text=t, order_index=i) for i, t in enumerate("AB")]
+            db.add(poll)
+            db.commit()
+            poll_id, (a, b) = poll.id, [o.id for o in poll.options]
+        for i, oid in enumerate([a, a, b]):
+            self._vote(writer, poll_id, f"voter-{i}", oid)
+        with Session(writer) as db:
+            db.get(models.Poll, poll_id).tally.state = {"total": 3, "counts": {}}  # 集計状態のずれ
+            db.commit()
+
+        with Session(reader) as read_db:
+            poll = read_db.get(models.Poll, poll_id)
+            matched, state, upto_id = check_poll(read_db, poll)
+            assert matched is False
+
+            # 検証中（読み取りのトランザクション中）も投票は書き込める
+            self._vote(writer, poll_id, "voter-3", b)
+            assert check_poll(read_db, poll)[2] == upto_id  # 同じスナップショットを読み続ける
+
+        with Session(writer) as db:
+            replace_tally(db, db.get(models.Poll, poll_id), state, upto_id)
+            db.commit()
+            poll = db.get(models.Poll, poll_id)
+            assert poll.tally.state == {"total": 4, "counts": {str(a): 2, str(b): 2}}
+            assert recount_poll(db, poll, fix=False) is True
+        writer.dispose()
+        reader.dispose()
+
+
+class TestReadSnapshot:
+    def _vote(self, writer, poll_id: int, voter: str, order: list) -> None:
+        with Session(writer) as db:
+            poll = db.get(models.Poll, poll_id)
+            vote_data = {"order": order}
+            record_vote(db, poll, vote_data)
+            db.add(models.Vote(poll_id=poll_id, voter_fingerprint=voter, vote_data=vote_data))
+            db.commit()
+
+    @pytest.mark.parametrize("snapshot", [True, False])
+    async def test_tally_and_patterns_from_one_snapshot(self, tmp_path, monkeypatch, snapshot):
+        path = tmp_path / "app.db"
+        writer = create_engine(f"sqlite:///{path}")
+        configure_sqlite(writer)
+        Base.metadata.create_all(bind=writer)
+        reader = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        configure_sqlite(reader, read_only=True, snapshot=snapshot)  # app/database.py の read_engine と同じ設定
+
+        with Session(writer) as db:
+            poll = models.Poll(title="スナップショット", voting_method="irv", creator_id=1)
+            poll.options = [models.PollOption(text=t, order_index=i) for i, t in enumerate("AB")]
+            db.add(poll)
+            db.commit()
+            poll_id, (a, b) = poll.id, [o.id for o in poll.options]
+        self._vote(writer, poll_id, "voter-0", [a, b])
+        self._vote(writer, poll_id, "voter-1", [b, a])
+
+        load_patterns = tally_module._load_patterns
+
+        def vote_then_load(db, poll_id):
+            # 集計状態の行を読んでからパターンの行を読むまでの間に投票がコミットされる
+            self._vote(writer, poll_id, "voter-2", [a, b])
+            return load_patterns(db, poll_id)
+
+        monkeypatch.setattr(tally_module, "_load_patterns", vote_then_load)
+        async with AsyncSession(reader) as db:
+            poll = await db.get(models.Poll, poll_id)
+            vote_count, state = await db.run_sync(lambda session: load_tally(session, poll, persist=False))
+        await reader.dispose()
+        writer.dispose()
+
+        assert vote_count == 2
+        if snapshot:
+            assert state["ballots"] == {f"{a},{b}": 1, f"{b},{a}": 1}
+        else:
+            assert sum(state["ballots"].values()) == 3  # 文ごとに別の時点を読むと食い違う
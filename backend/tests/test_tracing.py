@@ -0,0 +1,167 @@
+"""
+リクエストごとのトレース（app/tracing.py）のテスト
+
+カバー範囲:
+- ルートスパン（ルートのテンプレート・ステータス）と SQL 文・結果の確定・シリアライズの子スパンが
+  同じトレースID で JSON Lines のファイルに書き出されること・X-Trace-Id ヘッダー
+- traceparent ヘッダーのトレースID・サンプリングの引き継ぎ、TRACE_SAMPLE_RATE=0
+- SLOW_QUERY_MS 以上かかった文が EXPLAIN QUERY PLAN の結果とともにログに出ること
+- スパンの書き出しを専用のスレッドで行うこと（export() は待たない・上限を超えたトレースは捨てる）
+- トレース中でなければ span() は何もしないこと
+"""
+import json
+import logging
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+from app.database import get_db, get_read_db
+from app import tracing
+from app.main import app
+from app.tracing import JsonLinesExporter, TracingMiddleware, explain_query_plan, span, trace_engine
+
+from .conftest import (
+    async_engine,
+    login,
+    override_get_async_db,
+    override_get_read_db,
+    read_engine,
+    register_and_activate,
+)
+from .test_result_cache import _create_poll, _vote
+
+
+@pytest.fixture(scope="module", autouse=True)
+def traced_engines():
+    # テスト用のエンジンに一度だけ登録する（トレース中でなければ SQL のイベントは時間を測るのみ）
+    trace_engine(async_engine, "write")
+    trace_engine(read_engine, "read")
+
+
+def _traced_client(exporter: JsonLinesExporter, sample_rate: float = 1.0) -> TestClient:
+    app.dependency_overrides[get_db] = override_get_async_db
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    return TestClient(TracingMiddleware(app, exporter, sample_rate))
+
+
+def _spans(path, trace_id: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:  # 呼ぶ前に exporter.flush() で書き出しを待つ
+        spans = [json.loads(line) for line in f]
+    return [s for s in spans if s["trace_id"] == trace_id]
+
+
+class TestRequestTraces:
+    def test_results_spans(self, tmp_path, monkeypatch):
+        path = tmp_path / "traces.jsonl"
+        exporter = JsonLinesExporter(str(path))
+        with _traced_client(exporter) as client:
+            register_and_activate(client, "trace@example.com", "Test1234!")
+            login(client, "trace@example.com", "Test1234!")
+            poll = _create_poll(client)
+            _vote(client, poll, "voter-1")
+            monkeypatch.setattr(settings, "SLOW_QUERY_MS", 1e-9)  # 全ての文を遅い文として扱う
+            resp = client.get(f"/api/polls/{poll['id']}/results")
+            listing = client.get("/api/polls/")
+        app.dependency_overrides.clear()
+        exporter.flush()
+        assert resp.status_code == 200
+
+        spans = _spans(path, resp.headers["x-trace-id"])
+        root = spans[-1]  # ルートスパンは最後に終わる
+        assert root["name"] == "GET /api/polls/{poll_id}/results"
+        assert root["parent_id"] is None
+        assert root["attributes"]["status"] == 200
+        ids = {s["span_id"] for s in spans}
+        assert all(s["parent_id"] in ids for s in spans[:-1])
+
+        sql = [s for s in spans if s["name"] == "sql"]
+        assert sql and all(s["attributes"]["engine"] == "read" for s in sql)
+        (tally,) = [s for s in sql if "FROM poll_tallies" in s["attributes"]["statement"]]
+        assert tally["attributes"]["slow"] is True
+        assert any(line.startswith("SEARCH poll_tallies") for line in tally["attributes"]["plan"])
+        (calculate,) = [s for s in spans if s["name"] == "calculate"]
+        assert calculate["attributes"] == {"method": "plurality", "ballots": 1, "options": len(poll["options"])}
+        assert [s["name"] for s in spans].count("serialize") == 1
+
+        # dict を返すルートは TracedJSONResponse の render がシリアライズのスパンになる
+        names = [s["name"] for s in _spans(path, listing.headers["x-trace-id"])]
+        assert "serialize" in names and names[-1] == "GET /api/polls/"
+
+    def test_traceparent(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+        exporter = JsonLinesExporter(str(path))
+        with _traced_client(exporter, sample_rate=0) as client:
+            resp = client.get("/api/health", headers={"traceparent": f"00-{trace_id}-{parent_id}-01"})
+            unsampled = client.get("/api/health", headers={"traceparent": f"00-{trace_id}-{parent_id}-00"})
+            default = client.get("/api/health")
+        app.dependency_overrides.clear()
+        exporter.flush()
+        assert resp.headers["x-trace-id"] == trace_id
+        assert "x-trace-id" not in unsampled.headers and "x-trace-id" not in default.headers
+        root = _spans(path, trace_id)[-1]
+        assert root["parent_id"] == parent_id
+        assert root["name"] == "GET /api/health"
+
+    def test_export_queues_spans_for_writer_thread(self, tmp_path, monkeypatch):
+        path = tmp_path / "traces.jsonl"
+        exporter = JsonLinesExporter(str(path), max_pending=1)
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_open(*args, **kwargs):
+            writing.set()
+            release.wait(5)
+            return open(*args, **kwargs)
+
+        monkeypatch.setattr(tracing, "open", slow_open, raising=False)
+        exporter.export([{"trace_id": "a" * 32, "name": "first"}])
+        assert writing.wait(5)
+        # 書き込み中も export() は待たずに戻る（上限を超えた分は捨てる）
+        exporter.export([{"trace_id": "a" * 32, "name": "second"}])
+        exporter.export([{"trace_id": "a" * 32, "name": "third"}])
+        assert not path.exists()
+        release.set()
+        exporter.flush()
+        assert [s["name"] for s in _spans(path, "a" * 32)] == ["first", "second"]
+        assert (exporter.exported, exporter.dropped) == (2, 1)
+
+    def test_span_outside_trace(self):
+        with span("calculate") as s:
+            assert s is None
+
+
+class TestSlowQueries:
+    def test_logged_with_plan(self, tmp_path, monkeypatch, caplog):
+        engine = create_engine(f"sqlite:///{tmp_path / 'slow.db'}")
+        trace_engine(engine, "test")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER, y INTEGER)"))
+            conn.execute(text("CREATE INDEX ix_t_x ON t (x)"))
+            monkeypatch.setattr(settings, "SLOW_QUERY_MS", 1e-9)
+            with caplog.at_level(logging.WARNING, logger="app.tracing"):
+                conn.execute(text("SELECT y FROM t WHERE x = :x"), {"x": 1}).all()
+        engine.dispose()
+
+        (record,) = [r for r in caplog.records if "SELECT y FROM t" in r.getMessage()]
+        message = record.getMessage()
+        assert message.startswith("Slow query on test engine")
+        assert "trace -" in message
+        assert "SEARCH t USING INDEX ix_t_x (x=?)" in message
+
+    def test_plan_tree(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'plan.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        raw = engine.raw_connection()
+        try:
+            plan = explain_query_plan(
+                raw.driver_connection, "SELECT x FROM t WHERE x IN (SELECT x FROM t WHERE x > ?)", (1,)
+            )
+        finally:
+            raw.close()
+            engine.dispose()
+        assert plan[0] == "SCAN t"
+        assert any(line.startswith("  ") for line in plan)  # サブクエリは字下げされる
@@ -0,0 +1,240 @@
+"""
+重複投票の防止（一意インデックス・INSERT ... ON CONFLICT）と
+投票済みフィンガープリントのブルームフィルター（app/voter_filter.py）のテスト
+
+カバー範囲:
+- BloomFilter の偽陰性がないこと・偽陽性率
+- フィルターがない・古い場合でも一意インデックスで二重投票を拒否し、集計状態も加算しないこと
+- 同じ投票者の同時送信で1票だけが保存されること
+- 別々の投票者の同時送信がすべて保存・集計されること（集計状態の更新を取りこぼさない）
+- 新しい投票者の確認で DB を参照しないこと（skipped_lookups）
+- フィルターは読み取り用のセッションでバックグラウンドに作り、作成中に保存された投票も含めること
+- 重複票が保存済みの既存の DB に一意インデックスを追加するとき、最初の1票を残して削除・再集計すること
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app import models
+from app.ballot_entries import add_entries
+from app.database import Base, configure_sqlite, get_db, get_read_db, upgrade_schema
+from app.main import app
+from app.tally import record_vote
+from app.voter_filter import BloomFilter, voter_filters
+
+from .conftest import TestingReadSessionLocal, override_get_db
+from .test_result_cache import _create_poll, _vote
+
+
+def _never_contains(poll_id, fingerprint):
+    return False
+
+
+@pytest.fixture
+async def file_db(tmp_path, monkeypatch):
+    """一時ファイルの DB（configure_sqlite 済み）をアプリに使わせ、(公開ID, 選択肢ID) を返す"""
+    url = f"sqlite+aiosqlite:///{tmp_path / 'votes.db'}"
+    engine = create_async_engine(url)
+    configure_sqlite(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    async with sessions() as db:
+        poll = models.Poll(
+            title="同時投票",
+            voting_method="plurality",
+            creator=models.User(email="file@example.com", hashed_password="-", is_active=True),
+            options=[models.PollOption(text="A", order_index=0)],
+        )
+        db.add(poll)
+        await db.commit()
+        public_id, option_id = poll.public_id, poll.options[0].id
+
+    async def override():
+        async with sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override
+    app.dependency_overrides[get_read_db] = override
+    monkeypatch.setattr(voter_filters, "session_factory", sessions)
+    yield public_id, option_id
+    await voter_filters.join()
+
+    app.dependency_overrides.clear()
+    async with sessions() as db:
+        # 集計状態の総投票数は保存された投票の数と一致する
+        votes = await db.scalar(select(func.count()).select_from(models.Vote))
+        assert (await db.get(models.PollTally, poll.id)).vote_count == votes
+    await engine.dispose()
+
+
+class TestBloomFilter:
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000)
+        items = [f"fp-{i}" for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+        assert all(item in bloom for item in items)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(capacity=5000, error_rate=0.01)
+        for i in range(5000):
+            bloom.add(f"fp-{i}")
+        false_positives = sum(f"other-{i}" in bloom for i in range(20000))
+        assert false_positives / 20000 < 0.02
+
+
+class TestDuplicateVotes:
+    def test_unique_index(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        db = next(override_get_db())
+        db.add(models.Vote(poll_id=poll["id"], voter_fingerprint="fp", vote_data={}))
+        db.commit()
+        db.add(models.Vote(poll_id=poll["id"], voter_fingerprint="fp", vote_data={}))
+        with pytest.raises(IntegrityError):
+            db.commit()
+        db.close()
+
+    def test_stale_filter_still_rejects(self, auth_client: TestClient, monkeypatch):
+        poll = _create_poll(auth_client)
+        _vote(auth_client, poll, "voter-1")
+        # 別のプロセスで受け付けた投票などでフィルターが古い場合を再現する
+        monkeypatch.setattr(voter_filters, "might_contain", _never_contains)
+
+        auth_client.cookies.set("voter_id", "voter-1")
+        resp = auth_client.post(
+            f"/api/vote/{poll['public_id']}",
+            json={"vote_data": {"option_id": poll["options"][1]["id"]}},
+        )
+        assert resp.status_code == 409
+        results = auth_client.get(f"/api/polls/{poll['id']}/results").json()
+        assert results["total_votes"] == 1
+        assert results["result"]["ranked"][0]["text"] == "A"
+
+    async def test_concurrent_submissions_store_one_vote(self, file_db):
+        # 同時の書き込みは本番と同じ WAL のファイル DB で行う
+        # （インメモリの共有キャッシュではテーブル単位のロックで待たずに失敗するため）
+        public_id, option_id = file_db
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as voter:
+            voter.cookies.set("voter_id", "same-voter")
+            responses = await asyncio.gather(*[
+                voter.post(f"/api/vote/{public_id}", json={"vote_data": {"option_id": option_id}})
+                for _ in range(3)
+            ])
+        assert sorted(r.status_code for r in responses) == [200, 409, 409]
+
+    async def test_concurrent_voters_all_tallied(self, file_db):
+        # 最初の投票で集計状態を同時に作らないこと・集計状態の読み書きの間に他の投票が挟まらないこと
+        public_id, option_id = file_db
+        transport = httpx.ASGITransport(app=app)
+
+        async def vote(i: int) -> int:
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as voter:
+                voter.cookies.set("voter_id", f"voter-{i}")
+                resp = await voter.post(f"/api/vote/{public_id}", json={"vote_data": {"option_id": option_id}})
+                return resp.status_code
+
+        assert await asyncio.gather(*[vote(i) for i in range(20)]) == [200] * 20
+
+
+class TestUpgradeWithDuplicates:
+    def test_duplicates_removed_before_unique_index(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            # 一意インデックスの導入前に、同時送信で同じ投票者の票が複数保存された DB を再現する
+            conn.execute(text("DROP INDEX ux_votes_poll_id_voter_fingerprint"))
+        with Session(engine) as db:
+            poll = models.Poll(
+                title="重複票",
+                voting_method="plurality",
+                creator=models.User(email="old@example.com", hashed_password="-", is_active=True),
+                options=[models.PollOption(text="A", order_index=0), models.PollOption(text="B", order_index=1)],
+            )
+            db.add(poll)
+            db.flush()
+            a, b = (o.id for o in poll.options)
+            for fingerprint, option_id in [("fp-1", a), ("fp-1", b), ("fp-2", b), ("fp-1", b)]:
+                vote_data = {"option_id": option_id}
+                record_vote(db, poll, vote_data)
+                vote = models.Vote(poll_id=poll.id, voter_fingerprint=fingerprint, vote_data=vote_data)
+                db.add(vote)
+                db.flush()
+                add_entries(db, poll, vote.id, vote_data)
+            db.commit()
+            poll_id, version = poll.id, poll.results_version
+
+        upgrade_schema(engine)
+
+        assert "ux_votes_poll_id_voter_fingerprint" in {i["name"] for i in inspect(engine).get_indexes("votes")}
+        with Session(engine) as db:
+            votes = db.scalars(select(models.Vote).order_by(models.Vote.id)).all()
+            assert [(v.voter_fingerprint, v.vote_data["option_id"]) for v in votes] == [("fp-1", a), ("fp-2", b)]
+            assert db.scalar(select(func.count()).select_from(models.BallotEntry)) == 2
+            poll = db.get(models.Poll, poll_id)
+            assert poll.tally.vote_count == 2
+            assert poll.tally.state["counts"] == {str(a): 1, str(b): 1}
+            assert poll.results_version > version
+        upgrade_schema(engine)  # 2回目は何もしない
+        engine.dispose()
+
+
+class TestFilterLookups:
+    def test_new_voters_skip_lookup(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        _vote(auth_client, poll, "voter-0")  # フィルターがないため DB で確認し、作り始める
+        auth_client.portal.call(voter_filters.join)
+        for i in range(1, 4):
+            _vote(auth_client, poll, f"voter-{i}")
+        stats = voter_filters.stats()
+        assert stats["skipped_lookups"] == 3
+        assert stats["lookups"] == 1
+        assert stats["rebuilds"] == 1
+
+    def test_status_uses_filter(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        _vote(auth_client, poll, "voter-1")
+        auth_client.portal.call(voter_filters.join)
+        url = f"/api/vote/{poll['public_id']}/status"
+        assert auth_client.get(url).json()["already_voted"] is True
+        auth_client.cookies.set("voter_id", "voter-2")
+        assert auth_client.get(url).json()["already_voted"] is False
+        assert voter_filters.stats()["lookups"] == 2
+
+    def test_filter_built_from_existing_votes(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        _vote(auth_client, poll, "voter-1")
+        voter_filters.clear()  # 再起動後を再現する
+        auth_client.cookies.set("voter_id", "voter-1")
+        url = f"/api/vote/{poll['public_id']}/status"
+        assert auth_client.get(url).json()["already_voted"] is True  # 作成中は DB で確認する
+        auth_client.portal.call(voter_filters.join)
+        assert auth_client.get(url).json()["already_voted"] is True
+        assert voter_filters.stats()["rebuilds"] == 1
+
+    async def test_background_load_uses_read_session(self, monkeypatch):
+        opened = []
+
+        def factory():
+            opened.append(1)
+            return TestingReadSessionLocal()
+
+        monkeypatch.setattr(voter_filters, "session_factory", factory)
+        assert voter_filters.might_contain(1, "fp-old") is True  # 作成前は DB で確認させる
+        voter_filters.add(1, "fp-new")  # 作成中にコミットされた投票
+        await voter_filters.join()
+        assert opened == [1]
+        assert voter_filters.might_contain(1, "fp-new") is True
+        assert voter_filters.might_contain(1, "fp-other") is False
+        assert voter_filters.stats()["rebuilds"] == 1
+
+    def test_health_exposes_counters(self, client: TestClient):
+        stats = client.get("/api/stats").json()["voter_filter"]
+        assert set(stats) == {"polls", "skipped_lookups", "lookups", "false_positives", "rebuilds"}
@@ -2,7 +2,7 @@
 匿名投票 API のテスト
 
 カバー範囲:
-- GET  /api/vote/{public_id}         フォーム取得
+- GET  /api/vote/{public_id}         フォーム取得・キャッシュ（ETag / 304）
 - GET  /api/vote/{public_id}/status  投票済みチェック
 - POST /api/vote/{public_id}         投票送信・重複防止
 """
@@ -47,6 +47,75 @@ class TestGetVotePoll:
         assert resp.status_code == 404
 
 
+class TestPublicPollCache:
+    def _update(self, auth_client: TestClient, poll: dict, **changes) -> None:
+        body = {
+            "title": "テスト",
+            "description": "",
+            "options": ["A", "B", "C"],
+            "method_settings": {},
+            "start_time": None,
+            "end_time": None,
+            **changes,
+        }
+        resp = auth_client.put(f"/api/polls/{poll['id']}", json=body)
+        assert resp.status_code == 200, resp.text
+
+    def test_etag_and_cache_control(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        resp = auth_client.get(f"/api/vote/{poll['public_id']}")
+        assert resp.headers["etag"].startswith('"') and resp.headers["etag"].endswith('-1"')
+        assert resp.headers["cache-control"] == "public, max-age=30"
+
+    def test_if_none_match_returns_304(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        url = f"/api/vote/{poll['public_id']}"
+        etag = auth_client.get(url).headers["etag"]
+        resp = auth_client.get(url, headers={"If-None-Match": f'"other", W/{etag}'})
+        assert resp.status_code == 304
+        assert resp.content == b""
+        assert resp.headers["etag"] == etag
+        assert auth_client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+    def test_repeated_views_hit_cache(self, auth_client: TestClient):
+        from app.public_poll_cache import public_poll_cache
+        poll = _create_poll(auth_client)
+        for _ in range(3):
+            auth_client.get(f"/api/vote/{poll['public_id']}")
+        auth_client.get(f"/api/vote/{poll['public_id']}/status")
+        assert public_poll_cache.stats() == {"entries": 1, "hits": 3, "misses": 1}
+
+    def test_update_invalidates(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        url = f"/api/vote/{poll['public_id']}"
+        before = auth_client.get(url)
+        self._update(auth_client, poll, title="変更後")
+        after = auth_client.get(url)
+        assert after.json()["title"] == "変更後"
+        assert after.headers["etag"] != before.headers["etag"]
+        resp = auth_client.get(url, headers={"If-None-Match": before.headers["etag"]})
+        assert resp.status_code == 200
+
+    def test_delete_invalidates(self, auth_client: TestClient):
+        poll = _create_poll(auth_client)
+        url = f"/api/vote/{poll['public_id']}"
+        assert auth_client.get(url).status_code == 200
+        auth_client.delete(f"/api/polls/{poll['id']}")
+        assert auth_client.get(url).status_code == 404
+
+    def test_max_age_stops_at_start_time(self, auth_client: TestClient, monkeypatch):
+        from datetime import datetime, timedelta
+        from app.config import settings
+        monkeypatch.setattr(settings, "PUBLIC_POLL_MAX_AGE", 3600)
+        poll = _create_poll(auth_client)
+        start = (datetime.utcnow() + timedelta(minutes=2)).strftime("%Y-%m-%dT%H:%M")
+        self._update(auth_client, poll, start_time=start)
+        resp = auth_client.get(f"/api/vote/{poll['public_id']}")
+        assert resp.json()["is_active"] is False
+        assert resp.headers["etag"].endswith('-0"')
+        assert 0 < int(resp.headers["cache-control"].split("max-age=")[1]) <= 120
+
+
 # --------------------------------------------------------------------------
 # 投票済みステータス
 # --------------------------------------------------------------------------
@@ -57,9 +126,10 @@ class TestVoteStatus:
         # 別クライアント（クッキーなし）でステータス確認
         from fastapi.testclient import TestClient as TC
         from app.main import app
-        from .conftest import override_get_db
-        from app.database import get_db
-        app.dependency_overrides[get_db] = override_get_db
+        from .conftest import override_get_async_db, override_get_read_db
+        from app.database import get_db, get_read_db
+        app.dependency_overrides[get_db] = override_get_async_db
+        app.dependency_overrides[get_read_db] = override_get_read_db
         with TC(app) as anon:
             resp = anon.get(f"/api/vote/{poll['public_id']}/status")
             assert resp.status_code == 200
@@ -3,6 +3,8 @@
 
 各テストは HTTP を使わず関数を直接呼び出す。
 """
+import random
+
 import pytest
 from app.voting import (
     calculate_approval,
@@ -16,6 +18,8 @@ from app.voting import (
     calculate_results,
     calculate_score,
 )
+from app.voting import TALLIES, build_profile
+from app.voting_parallel import parallel_state
 
 # --------------------------------------------------------------------------
 # テスト用ヘルパー
@@ -144,6 +148,32 @@ class TestIRV:
         result = calculate_irv([], opts)
         assert result["winner_id"] is None or result["ranked"] == []
 
+    def test_round_counts_with_redistribution(self):
+        opts = make_options("A", "B", "C", "D")
+        # D 脱落 → C へ、C 脱落 → B へ移り（D→C の票は行き先がなく無効）、B が過半数
+        votes = (
+            [make_vote({"order": [1, 2]})] * 5
+            + [make_vote({"order": [2, 1]})] * 4
+            + [make_vote({"order": [3, 2]})] * 2
+            + [make_vote({"order": [4, 3]})] * 1
+        )
+        result = calculate_irv(votes, opts)
+        rounds = result["details"]["rounds"]
+        assert [r["counts"] for r in rounds] == [
+            {1: 5, 2: 4, 3: 2, 4: 1},
+            {1: 5, 2: 4, 3: 3},
+            {1: 5, 2: 6},
+        ]
+        assert rounds[2]["total"] == 11
+        assert [e["id"] for e in result["details"]["eliminated"]] == [4, 3]
+        assert result["winner_id"] == 2
+
+    def test_exhausted_ballots_leave_total(self):
+        opts = make_options("A", "B", "C")
+        votes = [make_vote({"order": [1]})] * 2 + [make_vote({"order": [2]})] * 2 + [make_vote({"order": [3]})]
+        result = calculate_irv(votes, opts)
+        assert result["details"]["rounds"][1]["total"] == 4
+
 
 # --------------------------------------------------------------------------
 # 5. コンドルセ（Condorcet）
@@ -180,6 +210,63 @@ class TestCondorcet:
         result = calculate_condorcet(votes, opts)
         assert "pairwise" in result["details"]
 
+    def test_unranked_options_not_compared(self):
+        opts = make_options("A", "B", "C")
+        votes = [make_vote({"order": [3, 1]})]
+        pairwise = calculate_condorcet(votes, opts)["details"]["pairwise"]
+        assert pairwise["3"]["1"] == 1
+        assert pairwise["1"]["2"] == 0 and pairwise["2"]["1"] == 0
+
+    def _cycle_votes(self):
+        # A>B (6:3), B>C (7:2), C>A (5:4) の循環
+        return (
+            [make_vote({"order": [1, 2, 3]})] * 4
+            + [make_vote({"order": [2, 3, 1]})] * 3
+            + [make_vote({"order": [3, 1, 2]})] * 2
+        )
+
+    @pytest.mark.parametrize("completion", ["schulze", "ranked_pairs"])
+    def test_completion_resolves_cycle(self, completion):
+        opts = make_options("A", "B", "C")
+        result = calculate_condorcet(self._cycle_votes(), opts, {"completion": completion})
+        assert result["details"]["has_cycle"] is True
+        assert result["details"]["completion"] == completion
+        assert result["winner_id"] == 1
+        assert [r["id"] for r in result["ranked"]] == [1, 2, 3]
+
+    def test_ranked_pairs_skips_pair_creating_cycle(self):
+        opts = make_options("A", "B", "C")
+        result = calculate_condorcet(self._cycle_votes(), opts, {"completion": "ranked_pairs"})
+        assert result["details"]["locked_pairs"] == [[2, 3], [1, 2]]
+
+    def test_schulze_known_election(self):
+        # シュルツ方式の標準的な例（45票・5候補）: E > A > C > B > D
+        opts = make_options("A", "B", "C", "D", "E")
+        ids = {t: o["id"] for t, o in zip("ABCDE", opts)}
+        profile = [
+            (5, "ACBED"), (5, "ADECB"), (8, "BEDAC"), (3, "CABED"),
+            (7, "CAEBD"), (2, "CBADE"), (7, "DCEBA"), (8, "EBADC"),
+        ]
+        votes = [
+            make_vote({"order": [ids[c] for c in order]})
+            for count, order in profile
+            for _ in range(count)
+        ]
+        result = calculate_condorcet(votes, opts, {"completion": "schulze"})
+        assert [r["text"] for r in result["ranked"]] == list("EACBD")
+        assert result["winner_id"] == ids["E"]
+
+    def test_completion_keeps_condorcet_winner(self):
+        opts = make_options("A", "B", "C")
+        votes = [make_vote({"order": [2, 1, 3]}), make_vote({"order": [2, 3, 1]})]
+        for completion in ("schulze", "ranked_pairs"):
+            result = calculate_condorcet(votes, opts, {"completion": completion})
+            assert result["winner_id"] == 2
+
+    def test_unknown_completion_raises(self):
+        with pytest.raises(ValueError):
+            calculate_condorcet([make_vote({"order": [1, 2]})], make_options("A", "B"), {"completion": "x"})
+
 
 # --------------------------------------------------------------------------
 # 6. スコア投票（Score）
@@ -201,6 +288,12 @@ class TestScore:
         result = calculate_score([], opts)
         assert all(r["score"] == 0.0 for r in result["ranked"])
 
+    def test_details_shape(self):
+        # 合計は採点された選択肢のみ、票数は全選択肢（採点されなければ 0）
+        opts = make_options("A", "B")
+        result = calculate_score([make_vote({"scores": {"1": 4}})], opts)
+        assert result["details"] == {"averages": {1: 4.0, 2: 0.0}, "totals": {1: 4.0}, "vote_counts": {1: 1, 2: 0}}
+
 
 # --------------------------------------------------------------------------
 # 7. マジョリティ・ジャッジメント（MJ）
@@ -235,6 +328,42 @@ class TestMajorityJudgement:
         result = calculate_majority_judgement([], opts)
         assert result["details"]["median_labels"]["1"] == "未評価"
 
+    def test_even_count_uses_lower_median(self):
+        opts = make_options("A")
+        votes = [make_vote({"grades": {"1": g}}) for g in ("許容", "許容", "優秀", "優秀")]
+        result = calculate_majority_judgement(votes, opts)
+        assert result["details"]["median_labels"]["1"] == "許容"
+
+    def test_tie_broken_by_removing_median_grades(self):
+        opts = make_options("A", "B")
+        # 中央値・上下の票数が同じでも、中央値を取り除いていくと B が上回る
+        # A: 良い,良い,良い,とても良い,優秀 → 良い, 良い, とても良い, ...
+        # B: 良い,良い,良い,優秀,優秀       → 良い, 良い, 優秀, ...
+        grades_a = ["良い", "良い", "良い", "とても良い", "優秀"]
+        grades_b = ["良い", "良い", "良い", "優秀", "優秀"]
+        votes = [make_vote({"grades": {"1": a, "2": b}}) for a, b in zip(grades_a, grades_b)]
+        result = calculate_majority_judgement(votes, opts)
+        assert result["winner_id"] == 2
+        assert [r["rank"] for r in result["ranked"]] == [1, 2]
+
+    def test_lower_spread_loses_tie(self):
+        opts = make_options("A", "B")
+        # 中央値はどちらも「良い」。A は中央値より下の評価が多い
+        votes = [
+            make_vote({"grades": {"1": "拒否", "2": "良い"}}),
+            make_vote({"grades": {"1": "良い", "2": "良い"}}),
+            make_vote({"grades": {"1": "優秀", "2": "優秀"}}),
+        ]
+        result = calculate_majority_judgement(votes, opts)
+        assert result["winner_id"] == 2
+        assert result["ranked"][1]["score"] < result["ranked"][0]["score"]
+
+    def test_unrated_option_ranks_last(self):
+        opts = make_options("A", "B")
+        votes = [make_vote({"grades": {"2": "拒否"}})]
+        result = calculate_majority_judgement(votes, opts)
+        assert result["winner_id"] == 2
+
 
 # --------------------------------------------------------------------------
 # 8. クアドラティック・ボーティング（Quadratic）
@@ -304,3 +433,103 @@ class TestDispatcher:
     def test_unknown_method_raises(self):
         with pytest.raises(ValueError):
             calculate_results("unknown_method", [], make_options("X"))
+
+
+# --------------------------------------------------------------------------
+# 順位付き投票のプロファイル（重複した投票のまとめ）
+# --------------------------------------------------------------------------
+
+class TestRankedProfile:
+    def test_build_profile_normalizes_ids(self):
+        votes = [
+            make_vote({"order": [1, 2]}),
+            make_vote({"order": ["1", "2"]}),
+            make_vote({"order": [2, 1]}),
+        ]
+        assert build_profile("irv", votes) == {(1, 2): 2, (2, 1): 1}
+
+    def test_borda_profile_ignores_key_order(self):
+        votes = [
+            make_vote({"rankings": {"1": 1, "2": 2}}),
+            make_vote({"rankings": {"2": 2, "1": 1}}),
+        ]
+        assert build_profile("borda", votes) == {((1, 1), (2, 2)): 2}
+
+    @pytest.mark.parametrize("method,field", [("borda", "rankings"), ("irv", "order"), ("condorcet", "order")])
+    def test_duplication_ratio_reported(self, method, field):
+        opts = make_options("A", "B", "C")
+        first = {"1": 1, "2": 2, "3": 3} if method == "borda" else [1, 2, 3]
+        second = {"3": 1, "2": 2} if method == "borda" else [3, 2]
+        votes = [make_vote({field: first})] * 6 + [make_vote({field: second})] * 2
+        result = calculate_results(method, votes, opts)
+        assert result["details"]["profile"] == {
+            "ballots": 8,
+            "distinct_ballots": 2,
+            "duplication_ratio": 4.0,
+        }
+
+        # 集計状態からの結果・並列集計の結果も同じ重複率を返す
+        tally = TALLIES[method]
+        state = tally.init()
+        for v in votes:
+            tally.accumulate(state, v["vote_data"])
+        assert tally.finalize(state, opts) == result
+        state = parallel_state(method, [v["vote_data"] for v in votes], workers=2, chunk_size=3)
+        assert tally.finalize(state, opts) == result
+
+
+# --------------------------------------------------------------------------
+# NumPy 投票行列エンジン（app/voting_numpy.py）
+# --------------------------------------------------------------------------
+
+def random_cardinal_votes(method: str, n_votes: int, n_options: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    ids = list(range(1, n_options + 1))
+    votes = []
+    for _ in range(n_votes):
+        chosen = rng.sample(ids, rng.randint(0, n_options))
+        if method == "approval":
+            data = {"option_ids": chosen}
+        elif method == "borda":
+            data = {"rankings": {str(oid): rank for rank, oid in enumerate(chosen, 1)}}
+        elif method == "score":
+            data = {"scores": {str(oid): rng.randint(0, 10) for oid in chosen}}
+        elif method == "quadratic":
+            data = {"votes": {str(oid): rng.randint(0, 5) for oid in chosen}}
+        else:
+            data = {"votes": {str(oid): rng.choice([-1, 0, 1]) for oid in chosen}}
+        votes.append(make_vote(data))
+    return votes
+
+
+class TestNumpyEngine:
+    @pytest.mark.parametrize("method", ["approval", "borda", "score", "quadratic", "negative"])
+    def test_matches_python_engine(self, method):
+        opts = make_options("A", "B", "C", "D", "E")
+        votes = random_cardinal_votes(method, 200, len(opts), seed=42)
+        expected = calculate_results(method, votes, opts, engine="python")
+        assert calculate_results(method, votes, opts, engine="numpy") == expected
+
+    @pytest.mark.parametrize("method", ["approval", "borda", "score", "quadratic", "negative"])
+    def test_no_votes(self, method):
+        opts = make_options("A", "B")
+        expected = calculate_results(method, [], opts, engine="python")
+        assert calculate_results(method, [], opts, engine="numpy") == expected
+
+    def test_ignores_unknown_option_ids(self):
+        opts = make_options("A", "B")
+        votes = [make_vote({"scores": {"1": 4, "99": 5}}), make_vote({"scores": {"01": 2}})]
+        result = calculate_results("score", votes, opts, engine="numpy")
+        assert result["details"]["totals"] == {1: 6.0}
+        assert result["details"]["vote_counts"] == {1: 2, 2: 0}
+
+    def test_auto_engine_uses_numpy_for_large_polls(self, monkeypatch):
+        from app import voting
+        monkeypatch.setattr(voting.settings, "NUMPY_ENGINE_MIN_VOTES", 10)
+        assert voting._choose_engine("score", [make_vote({})] * 10) == "numpy"
+        assert voting._choose_engine("score", [make_vote({})] * 9) == "python"
+        assert voting._choose_engine("irv", [make_vote({})] * 10) == "python"
+
+    def test_unsupported_method_raises(self):
+        with pytest.raises(ValueError):
+            calculate_results("irv", [], make_options("X"), engine="numpy")
@@ -1,7 +1,7 @@
 const BASE = '/api'
 
 async function request(path, options = {}) {
-  const { body, ...rest } = options
+  const { body, page, ...rest } = options
   const res = await fetch(`${BASE}${path}`, {
     credentials: 'include',
     headers: {
@@ -19,6 +19,8 @@ async function request(path, options = {}) {
   if (!res.ok) {
     throw new Error(data.detail || 'リクエストに失敗しました。')
   }
+  // ページングされた一覧は次のページのカーソルをヘッダーで返す
+  if (page) return { items: data, nextCursor: res.headers.get('X-Next-Cursor') }
   return data
 }
 
@@ -30,13 +32,14 @@ export const api = {
     logout: ()           => request('/auth/logout',   { method: 'POST' }),
   },
   polls: {
-    list: ()             => request('/polls/'),
+    list: (cursor)       => request(`/polls/${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''}`, { page: true }),
     create: (body)       => request('/polls/',         { method: 'POST', body }),
     get: (id)            => request(`/polls/${id}`),
     update: (id, body)   => request(`/polls/${id}`,   { method: 'PUT',  body }),
     delete: (id)         => request(`/polls/${id}`,   { method: 'DELETE' }),
     results: (id)        => request(`/polls/${id}/results`),
     csvUrl: (id)         => `${BASE}/polls/${id}/results/csv`,
+    resultsStreamUrl: (id) => `${BASE}/polls/${id}/results/stream`,
   },
   vote: {
     getPoll: (pid)       => request(`/vote/${pid}`),
@@ -40,6 +40,7 @@ export default function CreatePoll() {
   const [scoreMin, setScoreMin] = useState(0)
   const [scoreMax, setScoreMax] = useState(10)
   const [qvBudget, setQvBudget] = useState(100)
+  const [completion, setCompletion] = useState('none')
 
   function changeForm(e) {
     setForm(f => ({ ...f, [e.target.name]: e.target.value }))
@@ -61,6 +62,7 @@ export default function CreatePoll() {
   function buildMethodSettings() {
     if (form.voting_method === 'score')     return { min: scoreMin, max: scoreMax }
     if (form.voting_method === 'quadratic') return { budget: qvBudget }
+    if (form.voting_method === 'condorcet') return { completion }
     return {}
   }
 
@@ -152,6 +154,21 @@ export default function CreatePoll() {
                 </div>
               )}
 
+              {form.voting_method === 'condorcet' && (
+                <div className="method-settings">
+                  <div className="form-group">
+                    <label className="form-label">循環時の補完ルール</label>
+                    <select className="form-control" value={completion}
+                      onChange={e => setCompletion(e.target.value)}>
+                      <option value="none">補完なし（循環時は勝者なし）</option>
+                      <option value="schulze">シュルツ方式</option>
+                      <option value="ranked_pairs">ランクドペア方式</option>
+                    </select>
+                    <p className="form-hint">コンドルセ勝者がいない場合に勝者を決める方法</p>
+                  </div>
+                </div>
+              )}
+
               {form.voting_method === 'quadratic' && (
                 <div className="method-settings">
                   <div className="form-group">
@@ -20,14 +20,32 @@ export default function Dashboard() {
   const [loading, setLoading] = useState(true)
   const [error, setError]     = useState('')
   const [copied, setCopied]   = useState(null)
+  const [nextCursor, setNextCursor]   = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
     api.polls.list()
-      .then(setPolls)
+      .then(page => {
+        setPolls(page.items)
+        setNextCursor(page.nextCursor)
+      })
       .catch(e => setError(e.message))
       .finally(() => setLoading(false))
   }, [])
 
+  async function loadMore() {
+    setLoadingMore(true)
+    try {
+      const page = await api.polls.list(nextCursor)
+      setPolls(p => [...p, ...page.items])
+      setNextCursor(page.nextCursor)
+    } catch (e) {
+      setError(e.message)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   async function deletePoll(id) {
     if (!confirm('この投票フォームを削除しますか？')) return
     try {
@@ -123,6 +141,14 @@ export default function Dashboard() {
             })}
           </div>
         )}
+
+        {nextCursor && (
+          <div className="dash-load-more">
+            <button className="btn btn-secondary" onClick={loadMore} disabled={loadingMore}>
+              {loadingMore ? '読み込み中...' : 'さらに表示'}
+            </button>
+          </div>
+        )}
       </div>
     </main>
   )
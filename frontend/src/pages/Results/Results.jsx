@@ -49,6 +49,15 @@ export default function Results() {
       .finally(() => setLoading(false))
   }, [id])
 
+  // 投票・編集のたびに最新の結果をサーバーから受け取る（Server-Sent Events）
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return
+    const source = new EventSource(api.polls.resultsStreamUrl(id), { withCredentials: true })
+    source.addEventListener('results', e => setData(JSON.parse(e.data)))
+    source.addEventListener('deleted', () => source.close())
+    return () => source.close()
+  }, [id])
+
   if (loading) return <div className="loading-center"><div className="spinner" /></div>
   if (error)   return <main className="page"><div className="container"><div className="alert alert-danger">{error}</div></div></main>
 
@@ -133,6 +142,8 @@ export default function Results() {
             {method === 'condorcet' && details.has_cycle && (
               <div className="alert alert-warning">
                 ⚠️ コンドルセ勝者は存在しません（選好の循環が検出されました）
+                {details.completion === 'schulze' && ' — シュルツ方式で勝者を決定しました'}
+                {details.completion === 'ranked_pairs' && ' — ランクドペア方式で勝者を決定しました'}
               </div>
             )}
 